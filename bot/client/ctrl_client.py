@@ -1,10 +1,28 @@
 """Exposes bot systems and accepts/issues control-type commands."""
 
+from itertools import count
 from time import time
 import zmq
+from zmq.utils import jsonapi
 import lib.messages as msgs
 
 
+def build_calls(calls):
+    """Turn (obj_name, method, params) tuples into call_req messages.
+
+    :param calls: Calls to make, params may be left off for no params.
+    :type calls: list
+    :returns: List of call_req dicts.
+
+    """
+    reqs = []
+    for call in calls:
+        obj_name, method = call[:2]
+        params = call[2] if len(call) > 2 else {}
+        reqs.append(msgs.call_req(obj_name, method, params))
+    return reqs
+
+
 def api_method(ctrl_sock, obj_name, method):
     """Factory for ZMQ-based remote function calls.
 
@@ -139,6 +157,24 @@ class CtrlClient(object):
         self.ctrl_sock.send_json(msgs.call_req(obj_name, method, params))
         return self.ctrl_sock.recv_json()
 
+    def batch(self, calls, stop_on_error=False):
+        """Call several remote API methods in one round trip.
+
+        The server runs the calls in order, one after the other.
+
+        :param calls: (obj_name, method, params) of each call, in order.
+            params may be left off for calls without any.
+        :type calls: list
+        :param stop_on_error: Don't run the calls after one that fails.
+        :type stop_on_error: boolean
+        :returns: batch_reply dict, its replies hold a call_reply or error
+            dict per call run, or an error dict.
+
+        """
+        self.ctrl_sock.send_json(msgs.batch_req(build_calls(calls),
+                                                stop_on_error))
+        return self.ctrl_sock.recv_json()
+
     def exit_server(self):
         """Send a message to the server, asking it to die.
 
@@ -169,3 +205,117 @@ class CtrlClient(object):
         """Tear down ZMQ socket."""
         self.ctrl_sock.close()
         self.context.term()
+
+
+class AsyncCtrlClient(object):
+
+    """Control client that can have many requests in flight at once.
+
+    CtrlClient's REQ socket has to wait for each reply before sending the
+    next request, so a script pays a full round trip per call. This client
+    uses a DEALER socket instead: send() returns a request id straight
+    away, and replies are matched back up by id as they arrive, in
+    whatever order the server finishes them. The server has to be in
+    router mode for requests to actually run concurrently, in rep mode
+    they're answered one at a time.
+
+    """
+
+    def __init__(self, ctrl_addr="tcp://127.0.0.1:60000"):
+        """Build ZMQ DEALER socket and connect to CtrlServer.
+
+        :param ctrl_addr: Address of control server to connect to via ZMQ.
+        :type ctrl_addr: string
+
+        """
+        self.context = zmq.Context()
+        self.ctrl_addr = ctrl_addr
+        self.ctrl_sock = self.context.socket(zmq.DEALER)
+        self.ctrl_sock.connect(ctrl_addr)
+        self.ids = count(1)
+        # Replies that arrived while waiting for a different request
+        self.replies = {}
+
+    def send_msg(self, msg):
+        """Send any request message without waiting for its reply.
+
+        The request id goes in a routing frame, which the server sends
+        back in front of the reply. The empty frame after it is the
+        delimiter REQ sockets add, which REP servers need.
+
+        :param msg: Message from lib.messages.
+        :type msg: dict
+        :returns: Request id to get the reply with.
+
+        """
+        req_id = next(self.ids)
+        self.ctrl_sock.send_multipart([str(req_id), "", jsonapi.dumps(msg)])
+        return req_id
+
+    def send(self, obj_name, method, params=None):
+        """Start a remote API call.
+
+        :returns: Request id to get the call_reply with.
+
+        """
+        return self.send_msg(msgs.call_req(obj_name, method, params or {}))
+
+    def send_batch(self, calls, stop_on_error=False):
+        """Start a batch of calls, see CtrlClient.batch.
+
+        :returns: Request id to get the batch_reply with.
+
+        """
+        return self.send_msg(msgs.batch_req(build_calls(calls),
+                                            stop_on_error))
+
+    def recv(self, timeout=None):
+        """Get the next reply to arrive, for any request.
+
+        :param timeout: Seconds to wait, None to wait forever.
+        :type timeout: float
+        :returns: (request id, reply dict), or None on timeout.
+
+        """
+        if self.replies:
+            req_id = min(self.replies)
+            return req_id, self.replies.pop(req_id)
+        if timeout is not None and \
+                not self.ctrl_sock.poll(timeout * 1000):
+            return None
+        frames = self.ctrl_sock.recv_multipart()
+        return int(frames[0]), jsonapi.loads(frames[-1])
+
+    def wait(self, req_id, timeout=None):
+        """Get the reply to one request, keeping others that arrive first.
+
+        :param req_id: Id returned when the request was sent.
+        :type req_id: int
+        :param timeout: Seconds to wait, None to wait forever.
+        :type timeout: float
+        :returns: Reply dict, or None on timeout.
+
+        """
+        if timeout is not None:
+            deadline = time() + timeout
+        while req_id not in self.replies:
+            if timeout is not None:
+                remaining = max(deadline - time(), 0)
+                if not self.ctrl_sock.poll(remaining * 1000):
+                    return None
+            frames = self.ctrl_sock.recv_multipart()
+            self.replies[int(frames[0])] = jsonapi.loads(frames[-1])
+        return self.replies.pop(req_id)
+
+    def call(self, obj_name, method, params=None):
+        """Call a remote API method and wait for its reply.
+
+        :returns: Result dict returned by remote control server.
+
+        """
+        return self.wait(self.send(obj_name, method, params))
+
+    def clean_up(self):
+        """Tear down ZMQ socket."""
+        self.ctrl_sock.close()
+        self.context.term()
@@ -3,6 +3,8 @@
 import sys
 from pprint import pprint
 
+import bot.lib.telemetry as telemetry
+
 try:
     import zmq
 except ImportError:
@@ -37,6 +39,24 @@ class SubClient(object):
         self.sub_sock.connect(self.sub_addr)
         print "SubClient subscribed to PubServer at {}".format(self.sub_addr)
 
+    def recv(self):
+        """Wait for a published message and decode it.
+
+        Binary messages (two frames, see bot.lib.telemetry) decode to typed
+        values with the time they were sampled. Text messages have no
+        timestamp and their value is left as a string.
+
+        :returns: (topic, timestamp, value), timestamp None for text.
+
+        """
+        frames = self.sub_sock.recv_multipart()
+        if len(frames) == 2:
+            topic, payload = frames
+            timestamp, value = telemetry.decode(payload)
+            return topic, timestamp, value
+        topic, _, value = frames[0].partition(" ")
+        return topic, None, value
+
     def print_msgs(self):
         """Prints messages subscribed to via SUB socket.
 
@@ -46,7 +66,7 @@ class SubClient(object):
         print "Printing messages, ctrl+c to quit loop..."
         while True:
             try:
-                pprint(self.sub_sock.recv())
+                pprint(self.recv())
             except KeyboardInterrupt:
                 print
                 return
@@ -56,15 +76,14 @@ class SubClient(object):
 
         Note that the format of topics is a bit interesting. From what I can
         tell, any topic that matches the regex ^topic* will be subscribed
-        to. For example, if there's a topic drive_motor_detail_br and another
-        drive_motor_detail_fr, then passing drive_motor_detail will subscribe
-        to both of them. On the other hand, passing motor_detail_fr will not
+        to. For example, if there's a topic drive_motor_detail_north and another
+        drive_motor_detail_south, then passing drive_motor_detail will subscribe
+        to both of them. On the other hand, passing motor_detail_north will not
         subscribe to any topic (unless there's another one that starts with
-        motor_detail_fr).
+        motor_detail_north).
 
-        Also note that with ZMQ (libzmq) >= 3.0, filtering of topics is done
-        at the publisher. So, topics that are not subscribed to by any clients
-        will not be published, reducing the load on the bot.
+        Also note that PubServer only reads the values of topics that some
+        client is subscribed to, so unused topics cost the bot nothing.
 
         :param topic: Topic to listen for.
         :type topic: string
@@ -77,15 +96,14 @@ class SubClient(object):
 
         Note that the format of topics is a bit interesting. From what I can
         tell, any topic that matches the regex ^topic* will be subscribed
-        to. For example, if there's a topic drive_motor_detail_br and another
-        drive_motor_detail_fr, then passing drive_motor_detail will subscribe
-        to both of them. On the other hand, passing motor_detail_fr will not
+        to. For example, if there's a topic drive_motor_detail_north and another
+        drive_motor_detail_south, then passing drive_motor_detail will subscribe
+        to both of them. On the other hand, passing motor_detail_north will not
         subscribe to any topic (unless there's another one that starts with
         motor_detail).
 
-        Also note that with ZMQ (libzmq) >= 3.0, filtering of topics is done
-        at the publisher. So, topics that are not subscribed to by any clients
-        will not be published, reducing the load on the bot.
+        Also note that PubServer only reads the values of topics that some
+        client is subscribed to, so unused topics cost the bot nothing.
 
         :param topic: Topic to stop listening for.
         :type topic: string
@@ -2,6 +2,7 @@
 import bot.lib.lib as lib
 import bot.driver.driver as driver
 from bot.hardware.dmcc_motor import DMCCMotorSet
+from bot.lib.sample_stream import SampleStream
 from time import sleep
 from math import sin, cos, pi, fabs, hypot, atan2, degrees
 
@@ -25,6 +26,13 @@ class OmniDriver(driver.Driver):
         motor_config = self.config['omni_drive_motors']
         self.motors = DMCCMotorSet(motor_config)
         self.mode = mode
+        # Power changes smaller than this aren't worth an I2C write
+        self.deadband = self.config.get('omni_drive_deadband', 0)
+        # Commanded powers, recorded while subscribed to
+        self.power_stream = SampleStream(
+            "drive_powers", sorted(motor_config),
+            **self.config.get("telemetry_streams", {}))
+        self.streams = [self.power_stream]
 
     def __str__(self):
         """Show status of motors."""
@@ -48,6 +56,27 @@ class OmniDriver(driver.Driver):
         else:
             self.motors[name].velocity = value
 
+    @lib.api_call
+    def set_motors(self, values):
+        """Set several motors at once, as one command.
+
+        In power mode, motors whose power would change by less than the
+        deadband aren't written (see DMCCMotorSet.set_powers).
+
+        :param values: Map of motor name to power or velocity.
+        :type values: dict
+
+        """
+        if self.mode == 'power':
+            self.motors.set_powers(values, self.deadband)
+            if self.power_stream.active:
+                self.power_stream.record(
+                    [self.motors[name].power
+                     for name in self.power_stream.fields[1:]])
+        else:
+            for name, value in values.items():
+                self.set_motor(name, value)
+
     # finding velocity is dependant on how we actually orient the chassis
 
 # ''' Because we don't know about orientation
@@ -137,10 +166,8 @@ class OmniDriver(driver.Driver):
         except AssertionError:
             raise AssertionError("Angular rate is out of bounds")
 
-        self.set_motor("north", -rate)
-        self.set_motor("south", rate)
-        self.set_motor("west", -rate)
-        self.set_motor("east", rate)
+        self.set_motors({"north": -rate, "south": rate,
+                         "west": -rate, "east": rate})
 
     @lib.api_call
     def move(self, speed, angle=0):
@@ -169,10 +196,7 @@ class OmniDriver(driver.Driver):
         # Handle zero speed, prevent divide-by-zero error
         if speed == 0:  # TODO deadband (epsilon) check?
             self.logger.debug("Special case for speed == 0")
-            self.set_motor("north", 0)
-            self.set_motor("south", 0)
-            self.set_motor("east", 0)
-            self.set_motor("west", 0)
+            self.set_motors({"north": 0, "south": 0, "east": 0, "west": 0})
             return
 
         # Calculate motor speeds
@@ -201,10 +225,8 @@ class OmniDriver(driver.Driver):
                     north, south, west, east))
 
         # Set motor speeds
-        self.set_motor("north", north)
-        self.set_motor("south", south)
-        self.set_motor("west", west)
-        self.set_motor("east", east)
+        self.set_motors({"north": north, "south": south,
+                         "west": west, "east": east})
 
     # @lib.api_call
     # NOTE(Vijay): Not yet implemented
@@ -15,7 +15,7 @@ class PID(object):
 
     def clear_error(self):
         self.previous_error = 0
-        self.integeral_error = 0
+        self.integral_error = 0
 
     def pid(self, target, process_var, timestep):
         current_error = (target - process_var)
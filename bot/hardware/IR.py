@@ -1,7 +1,10 @@
 import smbus
-from time import sleep
+from time import time
 import bot.lib.lib as lib
-import numpy as np
+from bot.hardware.ir_calibration import IRCalibration
+from bot.hardware.ir_filter import IRFilter
+from bot.hardware.ir_packet import IRLink, parse_frame
+from bot.hardware.ir_sampler import IRSampler, IRSnapshot
 
 
 class IR(object):
@@ -9,78 +12,159 @@ class IR(object):
 
     def __init__(self):
         self.config = lib.get_config()
+        self.logger = lib.get_logger()
         self.bus = smbus.SMBus(1)
+        link_config = self.config.get("IR_link", {})
+        self.link = IRLink(self.bus,
+                           link_config.get("addr", 8),
+                           link_config.get("block_size", 1),
+                           link_config.get("frame_timeout", 0.05))
+        # Raw counts of the last good frame and when it was read, reused
+        # if the link times out, for up to max_stale seconds
+        self.last_raw = None
+        self.last_raw_time = 0.0
+        self.max_stale = link_config.get("max_stale", 0.2)
         self.hash_values = self.config["IR"]
         self.irDistancesFilt = [0] *10
-        self.Last4IrDistances = {}
         self.biases = self.config["IR_Bias"]
-        for j in self.hash_values:
-            self.Last4IrDistances[j] = [0] * 4 # each side ar
+        self.calibration = IRCalibration(self.hash_values, self.biases,
+                                         self.config.get("IR_Calibration"))
+        self.average_filter = IRFilter(self.hash_values.keys(),
+                                       "moving_average", window=4)
+
+        # Optional background acquisition, see start_sampling
+        self.sampler = None
+        sampler_config = self.config.get("IR_sampler", {})
+        if sampler_config.get("enabled", False):
+            self.start_sampling(sampler_config.get("rate", 100),
+                                sampler_config.get("ring_size", 16))
 
     def parse_packets(self, msg):
         """ Return the 20 bytes of data from the IR Rangefinders.
         :params msg:
         :value: int
-        :returns: Boolean value indicating success.
+        :returns: List of raw counts, one per channel.
 
         """
-        first = msg[::2]
-        second = msg[1::2]
-        data = [second[i] * 256 + first[i] for i in xrange(len(first))]
-        return data
-    
-    
+        return parse_frame(msg).tolist()
+
     def read_values(self):
-        ms = range(20)
-        i = 0
-        while True:
-            ms[i] = self.bus.read_byte(8)
-            if ms[i] > 254:
-                i = 0
-                continue
-            elif i >= 19:
-                break
-            else:
-                i = i+1
-                
-        data = self.parse_packets(ms)
-        #print data[10], data[11] 
-        #data = data[:10]
-        #data[3] = data[3] - 40
-        for side in self.biases:
-            data_index = self.hash_values[side] - 1
-            data[data_index] += self.biases[side]
-            if data[data_index] < 0:
-                sleep(.2)
-                data[data_index] = 1
-
-        
-        data = [((i ** -1.55) * 2000000 if i != 0 else 0) for i in data]
-        return_dict = {}
-        for j in self.hash_values:
-            return_dict[j] = int(data[self.hash_values[j] - 1])
-        return return_dict
-
-     
+        """Get the current IR distances.
+
+        When the sampler thread is running this is the newest sampled frame
+        and the bus isn't touched, otherwise the bus is polled directly.
+
+        :returns: Dict mapping sensor name to distance.
+        :raises: IOError if the sampler hasn't produced a frame in time.
+
+        """
+        frame = self.latest_frame()
+        if frame is not None:
+            return dict(frame)
+        return self.poll_values()
+
+    def poll_values(self, reuse_last=True):
+        """Read and convert one packet straight from the IR hub.
+
+        Waiting for a packet is bounded by the IR_link frame_timeout. On a
+        timeout the last good packet is used again, if there is one, it's
+        less than IR_link max_stale seconds old and reuse_last is set.
+
+        :param reuse_last: Fall back to the last good packet on a timeout.
+        :type reuse_last: boolean
+        :returns: Dict mapping sensor name to distance.
+        :raises: IOError if the link times out and no packet can be reused.
+
+        """
+        try:
+            raw = parse_frame(self.link.read_frame())
+        except IOError as e:
+            if not reuse_last or self.last_raw is None:
+                raise
+            age = time() - self.last_raw_time
+            if age > self.max_stale:
+                raise IOError("{}, last good IR packet is {:.3f}s old".format(
+                    e, age))
+            self.logger.warning("Reusing last IR packet: {}".format(e))
+            raw = self.last_raw
+        else:
+            self.last_raw = raw
+            self.last_raw_time = time()
+        return self.calibration.convert(raw)
+
+    @lib.api_call
+    def get_link_stats(self):
+        """Frame, resync, drop and latency counters for the IR hub link."""
+        return self.link.stats()
+
+    def read_snapshot(self):
+        """Read all IR sensors once and timestamp the result.
+
+        When sampling, this is a copy of the newest frame. The sampler
+        reuses its ring slots, so the frame itself would change under the
+        caller after ring_size - 1 sample periods.
+
+        :returns: IRSnapshot of the current IR distances.
+        :raises: IOError if the sampler hasn't produced a frame in time.
+
+        """
+        frame = self.latest_frame()
+        if frame is not None:
+            return IRSnapshot(frame, frame.timestamp)
+        timestamp = time()
+        return IRSnapshot(self.poll_values(), timestamp)
+
+    def latest_frame(self):
+        """Newest sampled frame, or None if the sampler isn't running.
+
+        The frame is the sampler's own ring slot, copy it to keep it.
+
+        :raises: IOError if the sampler has no frame within 10 periods.
+
+        """
+        sampler = self.sampler
+        if sampler is None:
+            return None
+        # The sampler owns the link, polling it from here as well would
+        # interleave two readers on the one packet decoder
+        frame = sampler.latest(timeout=sampler.period * 10)
+        if frame is None:
+            raise IOError("No IR frame from the sampler yet")
+        return frame
+
+    @lib.api_call
+    def start_sampling(self, rate=100, ring_size=16):
+        """Read the IR hub from a background thread at a fixed rate.
+
+        :param rate: Sampling rate in Hz.
+        :type rate: float
+        :param ring_size: Number of recent frames to keep.
+        :type ring_size: int
+
+        """
+        if self.sampler is not None:
+            self.stop_sampling()
+        # The sampler counts timeouts itself, don't hide them with stale data
+        self.sampler = IRSampler(lambda: self.poll_values(reuse_last=False),
+                                 rate, ring_size)
+        # Don't let the sampler keep the process alive
+        self.sampler.setDaemon(True)
+        self.sampler.start()
+
+    @lib.api_call
+    def stop_sampling(self):
+        """Stop the sampler thread and go back to polling the bus."""
+        if self.sampler is None:
+            return
+        sampler = self.sampler
+        self.sampler = None
+        sampler.stop()
+        sampler.join()
+
     def moving_average_filter(self):
-        movingAVG_N = 4.0
-        irDistances = self.read_values()
-        for side in irDistances:
-            #pop left for the queue
-            self.Last4IrDistances[side] = self.Last4IrDistances[side][1:]
-            self.Last4IrDistances[side].append(irDistances[side])
-        averages = {}
-        for side in irDistances:
-            averages[side] = sum(self.Last4IrDistances[side])/movingAVG_N
-        return averages
+        """Read the IR sensors and average each with its last 3 readings."""
+        return self.average_filter.update(self.read_values())
 
     def set_bias(self, side, bias):
         self.biases[side] = bias
- 
-#http://stackoverflow.com/questions/14313510/does-numpy-have-a-function-for-calculating-moving-average 
-    def moving_average(a, n=4) :
-        ret = np.cumsum(a, dtype=float)
-        ret[n:] = ret[n:] - ret[:-n]
-        return ret[n - 1:] / n
-            
-            
+        self.calibration.set_bias(side, bias)
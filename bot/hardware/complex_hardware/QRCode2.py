@@ -9,12 +9,14 @@ import math
 
 
 class QRCode2(object):
-    def __init__(self, tvec, value, top_right):
+    def __init__(self, tvec, value, top_right, corners=None):
         self.tvec = tvec
         self.value = value
         self.tr = top_right
+        self.corners = corners
         
 class Block(object):
-    def __init__(self, size, color):
+    def __init__(self, size, color, center=None):
         self.size = size
         self.color = color
+        self.center = center
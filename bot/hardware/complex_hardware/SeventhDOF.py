@@ -1,11 +1,16 @@
 import os, sys
 from time import sleep
-import pyDMCC
 
 import bot.lib.lib as lib
+from bot.hardware.dmcc_manager import get_manager
 
 class Rail_Mover(object):
 
+    # Seconds between position reads while the rail moves. Each read holds
+    # the board lock, so polling flat out would shut the drive motors on
+    # the same DMCC out of the bus for the whole move.
+    poll_period = 0.005
+
     def __init__(self):
     
         self.bin_1 = 200
@@ -20,7 +25,8 @@ class Rail_Mover(object):
         board_num = rail_motor_conf["board_num"]
         motor_num = rail_motor_conf["motor_num"]
         
-        self.rail_DMCC = pyDMCC.DMCC(1)    
+        # Shared with the drive motors, so bus access is serialized
+        self.rail_DMCC = get_manager().board(board_num)
         self.rail_motor = self.rail_DMCC.motors[motor_num]
     @lib.api_call 
     def Orientor(self,Position):
@@ -63,6 +69,7 @@ class Rail_Mover(object):
             i = 0 
             while self.rail_motor.position > (StartPOS + Displacement):
                 i = i +1 
+                sleep(self.poll_period)
             print self.rail_motor.position
             
             self.rail_motor.power = 0
@@ -74,6 +81,7 @@ class Rail_Mover(object):
             i = 0
             while self.rail_motor.position < (StartPOS + Displacement):
                 i = i +1     
+                sleep(self.poll_period)
                
             print self.rail_motor.position
             self.rail_motor.power = 0
@@ -100,6 +108,7 @@ class Rail_Mover(object):
         while self.rail_motor.position > 20:
             print self.rail_motor.position
             print "velocity: ", self.rail_motor.velocity
+            sleep(self.poll_period)
         
         self.rail_motor.power = 0
         self.rail_motor.reset()
@@ -116,6 +125,7 @@ class Rail_Mover(object):
         i = 0
         while self.rail_motor.velocity < 0:
             i = i+1
+            sleep(self.poll_period)
             
     
         self.rail_motor.power = 0
@@ -1,15 +1,14 @@
 import numpy as np
+import os
+import re
+import threading
 import time
-import subprocess
 
 import zbar
 import cv2
-from PIL import Image
-from PIL import ImageEnhance
 import cv2
 import math
 
-from threading import Thread
 
 
 import bot.lib.lib as lib
@@ -17,19 +16,54 @@ from bot.hardware.qr_code import QRCode
 from bot.hardware.complex_hardware.QRCode2 import QRCode2
 from bot.hardware.complex_hardware.QRCode2 import Block
 from bot.hardware.complex_hardware.partial_qr import *
+from bot.hardware.complex_hardware.frame_grabber import FrameGrabber
+from bot.hardware.complex_hardware.qr_tracker import QRTracker
+from bot.hardware.complex_hardware.qr_pose import qr_object_points
+from bot.hardware.complex_hardware.qr_pose import select_qr
+from bot.hardware.complex_hardware.qr_pose import solve_qr_batch
+from bot.hardware.complex_hardware.color_classifier import BOUNDARIES
+from bot.hardware.complex_hardware.color_classifier import NO_COLOR
+from bot.hardware.complex_hardware.color_classifier import build_color_lut
+from bot.hardware.complex_hardware.color_classifier import classify
+
+
+# Resolution each camera negotiated, by udev name, so later Camera objects
+# know it without opening the device
+resolution_cache = {}
 
 
 def find_name(symlink):
-    # find where symlink is pointing (/dev/vide0, video1, etc)
-    cmd = "readlink -f /dev/" + symlink 
-    process = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE)
-    out = process.communicate()[0]
+    """Find the video device index a udev symlink points to.
+
+    :param symlink: Name of the symlink in /dev, like logitech_cam.
+    :type symlink: string
+    :returns: N of the /dev/videoN the link resolves to.
+    :raises IOError: If the link doesn't resolve to a video device.
+
+    """
+    path = os.path.realpath(os.path.join("/dev", symlink))
+    match = re.search(r"(\d+)$", path)
+    if match is None:
+        raise IOError("/dev/{} is not a video device".format(symlink))
+    return int(match.group(1))
+
+def to_zbar_image(gray):
+    """Wrap a grayscale frame as a zbar Y800 image, straight from memory.
+
+    Y800 is one byte per pixel, row-major, which is exactly the layout of a
+    contiguous 8-bit NumPy image, so the pixels are handed to zbar as-is.
+    The zbar binding takes a byte string, so the only cost is one copy of
+    the frame buffer; nothing is encoded or written to disk.
+
+    :param gray: Single channel image, as returned by cvtColor/threshold.
+    :type gray: numpy.ndarray
+    :returns: zbar.Image ready to be scanned.
+
+    """
+    gray = np.ascontiguousarray(gray, dtype=np.uint8)
+    height, width = gray.shape
+    return zbar.Image(width, height, 'Y800', gray.tostring())
 
-    #extract ints from name video0, etc
-    nums = [int(x) for x in out if x.isdigit()]
-    # There should nto be more than one digit
-    interface_num = nums[0]    
-    return interface_num
 
 class Camera(object):
 
@@ -39,58 +73,179 @@ class Camera(object):
                             [ L/2, -L/2, 0],
                             [ L/2,  L/2, 0]])
 
-    def __init__(self, cam_config):
-        self.logger = lib.get_logger()
+    # Resolution asked of the device when it's opened
+    requested_resolution = (1280, 720)
 
-        udev_name = cam_config["udev_name"]
-        print udev_name
+    def __init__(self, cam_config, cam=None):
+        """Set up the vision tools, the device is opened on first use.
+
+        :param cam_config: Camera entry from config, with udev_name and
+            the a, n distance calibration.
+        :type cam_config: dict
+        :param cam: Already open capture to use instead of the camera named
+            in cam_config, like a replay of saved frames.
+
+        """
+        self.logger = lib.get_logger()
 
-        cam_num = find_name(udev_name)
-        
         #extract calib data from cam_config
         self.a = cam_config["a"]
         self.n = cam_config["n"]
-        
-        self.cam = cv2.VideoCapture(cam_num)
-        self.cam.set(3, 1280)
-        self.cam.set(4, 720)
-        
-        self.resX = int(self.cam.get(3))
-        self.resY = int(self.cam.get(4))
+        # Intrinsics are optional, with them poses come from solvePnP
+        self.camera_matrix = cam_config.get("camera_matrix")
+        self.dist_coeffs = cam_config.get("dist_coeffs")
+        if self.camera_matrix is not None:
+            self.camera_matrix = np.float64(self.camera_matrix)
+            self.dist_coeffs = np.float64(self.dist_coeffs or [0] * 5)
+
+        # Capture device, opened by the cam property
+        self.udev_name = cam_config.get("udev_name")
+        self.source = cam
+        self._cam = None
+        self.cam_lock = threading.RLock()
+        self._resolution = None
 
         # QR scanning tools
         self.scanner = zbar.ImageScanner()
         self.scanner.parse_config('enable')
-        
-        (self.grabbed, self.frame) = self.cam.read()
-        self.stopped = True
-        
-        
-        
-    def start(self):
-        # start the thread to read frames from the video stream
-        thread = Thread(target=self.update, args=())
+        tracking = lib.get_config().get("qr_tracking", {})
+        self.tracker = QRTracker(**tracking)
+        self.pyramid_levels = lib.get_config().get(
+            "partial_qr", {}).get("pyramid_levels", 1)
+
+        # Block color tools, the table folds in the old 3x color boost
+        self.color_lut = build_color_lut()
+        self.erode_kernel = np.ones((21, 21), np.uint8)
+        self.dilate_kernel = np.ones((11, 11), np.uint8)
+
+        # Continuous capture, started on first use
+        self.grabber = None
+        self.frame_timeout = lib.get_config().get("camera_frame_timeout", 2.0)
+
+    @property
+    def cam(self):
+        """Capture device, opened and configured on first access."""
+        with self.cam_lock:
+            if self._cam is None:
+                self._cam = self.open_capture()
+            return self._cam
+
+    def open_capture(self):
+        """Open the capture device and negotiate its resolution.
+
+        :returns: Open capture.
+        :raises IOError: If the camera can't be opened.
+
+        """
+        cam = self.source
+        if cam is None:
+            cam_num = find_name(self.udev_name)
+            self.logger.info("Opening {} as /dev/video{}".format(
+                self.udev_name, cam_num))
+            cam = cv2.VideoCapture(cam_num)
+            if not cam.isOpened():
+                raise IOError("Can't open camera {}".format(self.udev_name))
+        width, height = self.requested_resolution
+        cam.set(3, width)
+        cam.set(4, height)
+
+        self._resolution = (int(cam.get(3)), int(cam.get(4)))
+        if self.source is None:
+            resolution_cache[self.udev_name] = self._resolution
+        return cam
+
+    @property
+    def resolution(self):
+        """(width, height) of frames, opens the device if not yet known."""
+        if self._resolution is None and self.source is None:
+            self._resolution = resolution_cache.get(self.udev_name)
+        if self._resolution is None:
+            self.cam
+        return self._resolution
+
+    @property
+    def resX(self):
+        return self.resolution[0]
+
+    @property
+    def resY(self):
+        return self.resolution[1]
+
+    def warm_up(self):
+        """Open the device and read a first frame in the background.
+
+        The first read waits out format negotiation and auto exposure, this
+        gets that out of the way before the first vision command.
+
+        :returns: The warm up thread.
+
+        """
+        thread = threading.Thread(target=self._warm_up)
         thread.setDaemon(True)
-        self.stopped = False
         thread.start()
         return thread
 
-    def update(self):
-        # keep looping infinitely until the thread is stopped
-        while not self.stopped:
-            print "In the update camera thread"
-            # otherwise, read the next frame from the stream
-            (self.grabbed, self.frame) = self.cam.read()
-            time.sleep(.1)
-        return
+    def _warm_up(self):
+        try:
+            # Hold the lock so capture can't start reading alongside us
+            with self.cam_lock:
+                self.cam.read()
+        except Exception as e:
+            self.logger.warning("Camera warm up failed: {}".format(e))
+
+    def start(self):
+        """Start continuous capture, if it isn't running already.
+
+        :returns: The running FrameGrabber.
+
+        """
+        with self.cam_lock:
+            if self.grabber is None or self.grabber.stopped:
+                self.grabber = FrameGrabber(self.cam)
+                self.grabber.start()
+        return self.grabber
 
     def read(self):
-        # return the frame most recently read
-        return self.frame
+        """Return the most recently captured frame.
+
+        :raises IOError: If no frame arrives within frame_timeout.
+
+        """
+        return self.frame_or_raise(self.start().latest(self.frame_timeout))
+
+    def read_next(self):
+        """Return the first frame captured after this call.
+
+        :raises IOError: If no frame arrives within frame_timeout.
+
+        """
+        grabber = self.start()
+        seq = grabber.seq
+        return self.frame_or_raise(
+            grabber.wait_next(seq, self.frame_timeout))
+
+    def frame_or_raise(self, captured):
+        """Take the frame out of a grabber result, None means none came."""
+        if captured is None:
+            raise IOError("No frame from camera {} within {}s".format(
+                self.udev_name, self.frame_timeout))
+        return captured[2]
 
     def stop(self):
-        # indicate that the thread should be stopped
-        self.stopped = True
+        """Stop continuous capture, the next read restarts it."""
+        if self.grabber is not None:
+            self.grabber.stop()
+            # Don't let a new grabber read the device alongside this one
+            self.grabber.join()
+            self.grabber = None
+
+    def close(self):
+        """Stop capture and release the device, the next use reopens it."""
+        with self.cam_lock:
+            self.stop()
+            if self._cam is not None:
+                self._cam.release()
+                self._cam = None
         
     def apply_filters(self, frame):
         """Attempts to improve viewing by applying filters """
@@ -104,19 +259,11 @@ class Camera(object):
 
     @lib.api_call
     def get_current_frame(self):
-        self.cam.grab()        
-        self.cam.grab()        
-        self.cam.grab()        
-        self.cam.grab()       
-        return self.cam.read()
+        # A frame from after the call, no stale frames to flush
+        return True, self.read_next()
  
     def get_zbar_im(self, qr_frame):
-        cv2.imwrite('buffer.png', qr_frame)
-        pil_im = Image.open('buffer.png').convert('L')
-        width, height = pil_im.size
-        raw = pil_im.tobytes()
-
-        return zbar.Image(width, height, 'Y800', raw)
+        return to_zbar_image(qr_frame)
 
     @lib.api_call
     def get_qr_list(self, frame):
@@ -139,11 +286,11 @@ class Camera(object):
     def sort_closest_qr(self, qr_list):
         """returns sortest list with closest qr first"""
 
-        for code in qr_list:
-            _, code.rvec, code.tvec = cv2.solvePnP(code.verts
-                                               , code.points
-                                               , self.cam_matrix
-                                               , self.dist_coeffs)
+        corners = np.float32([[code.topLeft, code.topRight,
+                               code.bottomLeft, code.bottomRight]
+                              for code in qr_list])
+        for code, pose in zip(qr_list, self.solve_poses(corners)):
+            code.tvec = pose[:3]
             
         # Finds qr with smallest displacement 
         qr_list.sort(key=lambda qr: qr.displacement, reverse=False)
@@ -155,11 +302,9 @@ class Camera(object):
         while True:
             ret, frame = self.get_current_frame()
             clean_frame = self.apply_filters(frame)
-            z_im = self.get_zbar_im(clean_frame)
-            qr_list = self.get_qr_list(z_im)
-            sorted_qr = self.sort_closest_qr
-            if sorted_qr != None:
-                break
+            qr_list = self.get_qr_list(clean_frame)
+            if qr_list:
+                return self.sort_closest_qr(qr_list)[0]
 
     def draw_qr_on_frame(self, frame, qr):
         cv2.line(frame, qr.topLeft, qr.topRight, (20, 20, 255), 8, 8)
@@ -191,19 +336,60 @@ class Camera(object):
             sorted_qr = self.sort_closest_qr(found_qrs)
             targetQR = sorted_qr[0]
 
-        self.cam.release()
+        self.close()
         cv2.destroyAllWindows
 
     @lib.api_call
-    def QRSweep(self):
-        
-        QRList = []
-        ret, frame = self.read()   
+    def QRSweep(self, track=False):
+        """Scan a new frame for QR codes, return the best one to grab.
+
+        :param track: Only scan around the code found by the last tracked
+            sweep, falling back to the full frame after repeated misses.
+            For loops that scan the same code over and over.
+        :type track: boolean
+
+        """
+        frame = self.read_next()
+
+        # Offset of the scanned window within the frame
+        x0 = y0 = 0
+        roi = None
+        if track:
+            roi = self.tracker.roi(frame.shape)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            frame = frame[y0:y1, x0:x1]
         
-        # Direct conversion cv -> zbar images did not work.
-        # Buffer file used to have native data structures.
+        frame = self.qr_preprocess(frame)
+        QRList = self.qr_pose(self.qr_decode(frame, (x0, y0)))
+        count = len(QRList)
+
+        #cleanup
+        del(frame)
 
-        # PIL -> zbar
+        if count == 0:
+            print "No QRCode Found"
+            if track:
+                self.tracker.missed()
+            return None
+        
+        targetQR = self.selectQR(QRList)
+        if targetQR == None:
+            print "No QRCode Found"
+            if track:
+                self.tracker.missed()
+        else: 
+            if track:
+                self.tracker.found(targetQR.corners)
+            print "value: ", targetQR.value
+            print "X:     ", targetQR.tvec[0]
+            print "Y:     ", targetQR.tvec[1]
+            print "X:     ", targetQR.tvec[2]
+        #self.cam.release()
+        return targetQR
+    
+    def qr_preprocess(self, frame):
+        """Blur, gray and threshold a BGR frame for QR decoding."""
         #frame = cv2.bilateralFilter(frame, 9, 75, 75) 
         frame = cv2.GaussianBlur(frame,(5,5),0)
         frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
@@ -214,122 +400,85 @@ class Camera(object):
                                       , cv2.THRESH_BINARY, 19, 0)
         
         #ret, thresh = cv2.threshold(gray,50,255,cv2.THRESH_BINARY)
-        cv2.imwrite('buffer.png', frame)
-        pil_im = Image.open('buffer.png').convert('L')
+        return frame
+
+    def qr_decode(self, frame, offset=(0, 0)):
+        """Find and decode the QR codes in a thresholded frame.
 
-        width, height = pil_im.size
-        raw = pil_im.tobytes()
-        z_im = zbar.Image(width, height, 'Y800', raw)
+        :param frame: Output of qr_preprocess.
+        :param offset: (x, y) of frame within the full camera frame.
+        :returns: List of (data, (tl, tr, bl, br)) in full frame pixels.
+
+        """
+        x0, y0 = offset
+        z_im = to_zbar_image(frame)
 
         # Find codes in image
         self.scanner.scan(z_im)
-        count = 0
+        decoded = []
         for symbol in z_im:
-            tl, bl, br, tr = [item for item in symbol.location]
-            points = np.float32([[tl[0], tl[1]],
-                                 [tr[0], tr[1]],
-                                 [bl[0], bl[1]],
-                                 [br[0], br[1]]])
+            tl, bl, br, tr = [(x + x0, y + y0) for x, y in symbol.location]
+            decoded.append((symbol.data, (tl, tr, bl, br)))
+        del(z_im)
+        return decoded
+
+    def qr_pose(self, decoded):
+        """Work out where each decoded code is relative to the camera.
 
-            tvec = self.solveQR(tl, tr, bl, br)
+        :param decoded: Output of qr_decode.
+        :returns: List of QRCode2.
 
-            print symbol.data
+        """
+        QRList = []
+        if len(decoded) == 0:
+            return QRList
+        corners = np.float32([points for data, points in decoded])
+        poses = self.solve_poses(corners)
+        for (data, (tl, tr, bl, br)), points, tvec in \
+                zip(decoded, corners, poses.tolist()):
+
+            print data
             print "X_Displacement = ", tvec[0]
             print "Y_Displacement = ", tvec[1]
             print "Z_Displacement = ", tvec[2]
             print "========================================="
 
-            QRList.append(QRCode2(tvec, symbol.data, tr)) 
-            count += 1
-        
-        #cleanup
-        del(z_im)
-        del(pil_im)
-        del(raw)
-        del(frame)
+            QRList.append(QRCode2(tvec, data, tr, points)) 
+        return QRList
 
-        if count == 0:
-            print "No QRCode Found"
-            return None
-        
-        targetQR = self.selectQR(QRList)
-        if targetQR == None:
-            print "No QRCode Found"
-        else: 
-            print "value: ", targetQR.value
-            print "X:     ", targetQR.tvec[0]
-            print "Y:     ", targetQR.tvec[1]
-            print "X:     ", targetQR.tvec[2]
-        #self.cam.release()
-        return targetQR
-    
     def selectQR(self, QRList):
         # find the best QRCode to grab (closest x then highest y)
-        QRList.sort(key=lambda qr: qr.tvec[0], reverse=False)       # sort the list of qr codes by x, smallest to largest
-        x_min = 100
-        min_qr = 0
-        count = 0
-        for qr in QRList:
-            #find smallest x
-            if abs(qr.tvec[0]) < abs(x_min):
-                x_min = qr.tvec[0]
-                min_qr = count
-            count += 1
-        targetQR = None
-        #check upper and lower qrs in list for height
-        if (min_qr > 0):
-            if (abs(QRList[min_qr -1].tvec[0] - x_min) < .1):
-                if QRList[min_qr -1].tvec[1] < QRList[min_qr].tvec[1]:
-                    targetQR = QRList[min_qr-1]
-                else:
-                    targetQR = QRList[min_qr]
-        if ((min_qr < (len(QRList) - 1)) and (targetQR == None)):
-            if (abs(QRList[min_qr +1].tvec[0] - x_min) < .1):
-                if QRList[min_qr +1].tvec[1] < QRList[min_qr].tvec[1]:
-                    targetQR = QRList[min_qr+1]
-                else:
-                    targetQR = QRList[min_qr]
-        if targetQR == None:
-            targetQR = QRList[min_qr]
-            
-        return targetQR
-    
-    #new solvepnp
-    def solveQR(self, tl, tr, bl, br):
-        QRSize = 1.5                # units = inches
-        center = [self.resX/2, self.resY/2]
-
-        #find the center of the QRCode
-        QRCenter = [int((tl[0] + tr[0] + bl[0] + br[0])/4), int((tl[1] + tr[1] + bl[1] + br[1])/4)]
-
-        #find pixel displacement
-        pixel_displacement = [(QRCenter[0] - center[0]),(QRCenter[1] - center[1])]
-
-        #find Z distance to QRCode
-
-        # Find longest edge
-        north = int(math.sqrt(pow(abs(tl[0] - tr[0]), 2) + pow(abs(tl[1] - tr[1]), 2)))
-        south = int(math.sqrt(pow(abs(bl[0] - br[0]), 2) + pow(abs(bl[1] - br[1]), 2)))
-        east = int(math.sqrt(pow(abs(tr[0] - br[0]), 2) + pow(abs(tr[1] - br[1]), 2)))
-        west = int(math.sqrt(pow(abs(tl[0] - bl[0]), 2) + pow(abs(tl[1] - bl[1]), 2)))
-        if (north >= south and north >= east and north >= west):
-            largest_edge = north
-        elif (south >= east and south >= west):
-            largest_edge = south
-        elif (east >= west):
-            largest_edge = east
-        else:
-            largest_edge = west
+        index = select_qr([qr.tvec for qr in QRList])
+        if index is None:
+            return None
+        return QRList[index]
 
-        displacement = self.getDistance(largest_edge)
-        
-        #find x and y based on distance
-        x_units = (QRSize)*(pixel_displacement[0]/float(largest_edge))
-        y_units = -1 * (QRSize)*(pixel_displacement[1]/float(largest_edge))
-        
-        z_units = math.sqrt(displacement**2 - x_units**2 - y_units**2)
+    def solve_poses(self, corners):
+        """Position of each QR code relative to the camera.
 
-        return [x_units, y_units, z_units, displacement]
+        :param corners: (N, 4, 2) image corners, ordered tl, tr, bl, br.
+        :returns: (N, 4) array of [x, y, z, distance], x right, y up.
+
+        """
+        if self.camera_matrix is None:
+            return solve_qr_batch(corners, (self.resX, self.resY),
+                                  self.a, self.n, self.L)
+        # solvePnP isn't batched, but it's only used with calibration
+        object_points = qr_object_points(self.L)
+        poses = np.empty((len(corners), 4))
+        for i, image_points in enumerate(corners):
+            _, rvec, tvec = cv2.solvePnP(object_points,
+                                         np.float32(image_points),
+                                         self.camera_matrix,
+                                         self.dist_coeffs)
+            x, y, z = tvec.ravel()
+            # PnP's y points down, ours points up
+            poses[i] = [x, -y, z, np.sqrt(x * x + y * y + z * z)]
+        return poses
+
+    #new solvepnp
+    def solveQR(self, tl, tr, bl, br):
+        return self.solve_poses([[tl, tr, bl, br]])[0].tolist()
 
     def getDistance(self, length):
         return self.a*math.pow(length, self.n)
@@ -338,107 +487,64 @@ class Camera(object):
     def check_color(self):
         """
         Looks through the camera and detects blocks size and color.
-        returns a Block object of with the size and color data fields.
+        returns a Block object of the largest block, None if there's none.
         """
-        largest = None
-        print "Getting the frame"
-        #get the image
-        bgr = self.read()
-        
-        print "got the Frame, cropping the image"
-
-        #enhance and show the image with gaussian and colorenhance
-        bgr_enhanced = self.enhance_color(bgr)
-
-        # define the list of boundaries
-        boundaries = [
-            ([0,0,120], [230,50,255]),                          #red bgr  GOOD
-            ([220,0,0], [255,150,150]),                         #blue bgr GOOD
-            ([0,125,125], [100,255,255]),                       #yellow bgr GOOD
-            ([75,120,0], [185,255,75])                          #green: bad
-        ]
-
-        # loop over the boundaries
-        print "looking for colors"
-        count = 0
-        for (lower, upper) in boundaries:
-            # create NumPy arrays from the boundaries
-            lower = np.array(lower)
-            upper = np.array(upper)
-
-            # find the colors within the specified boundaries and apply the mask
-            mask = cv2.inRange(bgr_enhanced, lower, upper)
-            mask = cv2.erode(mask, None, iterations=10)
-            output = cv2.dilate(mask, None, iterations=5)
-
-            #find contours of the masked output
-            (cnts,_) = cv2.findContours(output.copy(),cv2.RETR_LIST,cv2.CHAIN_APPROX_SIMPLE)
-
-            cnt = 0
-            for contour in cnts:
-                size = cv2.contourArea(contour)
-                if largest != None:
-                    if (size > largest.size):
-                        largest = Block(size, self.num_to_color(count))
-                else:
-                    largest = Block(size, self.num_to_color(count))
-
-                center = self.find_contour_center(contour)
-                cv2.circle(output, center, 5, (0,0,255), -1) 
-                cnt += 1
-
-            count += 1
-        
-        if  largest == None:
+        blocks = self.find_blocks(self.read())
+        if len(blocks) == 0:
             print  "no color found"
-        else:
-            print "Color found: ", largest.color
-
-        # cleanup
-        del(bgr)
-        del(bgr_enhanced)
-        del(mask)
-        del(output)
-        del(cnts)
-
-        return largest
+            return None
+        print "Color found: ", blocks[0].color
+        return blocks[0]
 
-    def enhance_color(self, bgr):
+    def find_blocks(self, bgr):
         """
-        resizes the opencv image and enhances it for color
+        Finds blocks of every color in one pass over the frame.
+        returns a list of Block objects with size (area), color and center,
+        largest first.
         """
-        size = 640,480
-        #crop and enhance the image for color
-        rgb = cv2.cvtColor(bgr,cv2.COLOR_BGR2RGB)
+        return self.segment_blocks(self.prepare_color_frame(bgr))
 
-        pil_im = Image.fromarray(rgb)
+    def segment_blocks(self, prepared):
+        """
+        Finds blocks in a frame already run through prepare_color_frame.
+        """
+        labels = classify(prepared, self.color_lut)
+
+        # Stands in for 10 erodes then 5 dilates with a 3x3 kernel per color:
+        # a pixel survives erosion only if its whole window is one color
+        low = cv2.erode(labels, self.erode_kernel)
+        high = cv2.dilate(labels, self.erode_kernel)
+        labels[low != high] = NO_COLOR
+        labels = cv2.dilate(labels, self.dilate_kernel)
+
+        blocks = []
+        for label, (color, lower, upper) in enumerate(BOUNDARIES, 1):
+            mask = np.uint8(labels == label)
+            if not mask.any():
+                continue
+            (cnts, _) = cv2.findContours(mask, cv2.RETR_LIST,
+                                         cv2.CHAIN_APPROX_SIMPLE)
+            for contour in cnts:
+                blocks.append(Block(cv2.contourArea(contour), color,
+                                    self.find_contour_center(contour)))
+        blocks.sort(key=lambda block: block.size, reverse=True)
+        return blocks
 
-        pil_im.thumbnail(size, Image.ANTIALIAS)
+    def prepare_color_frame(self, bgr):
+        """
+        shrinks the opencv image, crops out the middle and blurs it
+        """
+        # Same region the color ranges were tuned on: fit in 640x480,
+        # then crop a third off each side and w/6 off top and bottom
+        h, w = bgr.shape[:2]
+        scale = min(640.0 / w, 480.0 / h, 1.0)
+        w, h = int(w * scale), int(h * scale)
+        small = cv2.resize(bgr, (w, h), interpolation=cv2.INTER_AREA)
 
-        w, h = pil_im.size
         w_3 = int(w/3)
         h_6 = int(w/6)
-
-        pil_cropped = pil_im.crop((w_3,h_6,w-w_3, h- h_6))
-        converter = ImageEnhance.Color(pil_cropped)
-        enhanced = converter.enhance(3.0)
-        pil_image = enhanced.convert('RGB') 
-        open_cv_image = np.array(pil_image)
-
-        # Convert RGB to BGR 
-        rgb_enhanced = open_cv_image[:, :, ::-1].copy()
-        bgr_enhanced = cv2.GaussianBlur(rgb_enhanced,(9,9),0)
-    
-        # cleanup
-        del(rgb)
-        del(rgb_enhanced)
-        del(pil_cropped)
-        del(enhanced)
-        del(pil_im)
-        del(pil_image)
-        del(open_cv_image)
-
-        return bgr_enhanced
+        cropped = small[h_6:h - h_6, w_3:w - w_3]
+        return cv2.GaussianBlur(cropped, (9,9), 0)
 
     def num_to_color(self, number):
         if number == 0:
@@ -464,21 +570,12 @@ class Camera(object):
         #Capture frame-by-frame
         frame = self.read()
 
-        frame_orig = frame
-
-        # gray and blur
-        frame = cv2.GaussianBlur(frame,(0,0),3)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame = cv2.adaptiveThreshold(frame, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 2)
-        
-        #edge detect and find contours
-        frame = cv2.Canny(frame, 50, 150)
-        (cnts, hierarchy) = cv2.findContours(frame.copy()
-                                            , cv2.RETR_TREE
-                                            , cv2.CHAIN_APPROX_SIMPLE)
-
-        markers = find_markers(cnts, hierarchy)
+        # Candidates on a downscaled frame, markers refined at full size
+        markers = detect_markers(frame, self.pyramid_levels)
+        return self.partial_qr_group(markers)
 
+    def partial_qr_group(self, markers):
+        """Groups finder pattern markers into partial QR codes."""
         # Sort Markers by largest edge
         markers.sort(key=lambda x: largest_edge(x), reverse = True)
         
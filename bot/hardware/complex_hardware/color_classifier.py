@@ -0,0 +1,89 @@
+"""Per-pixel block color classification through a 3-D lookup table.
+
+Block colors used to be found by boosting saturation through PIL and then
+running cv2.inRange once per color. Both steps only depend on a pixel's own
+BGR value, so they are folded into one table indexed by quantized B, G and
+R: labelling a frame is a single fancy-indexing pass, whatever the number
+of colors.
+
+"""
+
+import numpy as np
+
+
+# BGR ranges for each color, as tuned on the enhanced image
+BOUNDARIES = [
+    ("red", [0, 0, 120], [230, 50, 255]),
+    ("blue", [220, 0, 0], [255, 150, 150]),
+    ("yellow", [0, 125, 125], [100, 255, 255]),
+    ("green", [75, 120, 0], [185, 255, 75]),  # not reliable yet
+]
+
+# Label for pixels that match no color, the table starts out filled with it
+NO_COLOR = 0
+
+
+def enhance_saturation(bgr, factor):
+    """Blend pixels away from their gray level, like PIL ImageEnhance.Color.
+
+    :param bgr: Array of BGR values, last axis is the channel.
+    :type bgr: numpy.ndarray
+    :param factor: 1.0 leaves colors alone, larger values saturate them.
+    :type factor: float
+    :returns: float array of enhanced BGR values, clipped to [0, 255].
+
+    """
+    bgr = np.asarray(bgr, dtype=np.float64)
+    # ITU-R 601-2 luma, as PIL uses for mode 'L'
+    gray = (0.114 * bgr[..., 0] + 0.587 * bgr[..., 1] +
+            0.299 * bgr[..., 2])[..., np.newaxis]
+    return np.clip(gray + factor * (bgr - gray), 0, 255)
+
+
+def build_color_lut(boundaries=BOUNDARIES, saturation=3.0, bits=5):
+    """Build the table mapping a quantized BGR value to a color label.
+
+    Labels are 1 + the index of the first matching range in boundaries,
+    or NO_COLOR. Each cell is classified at the center of the BGR values
+    that fall into it.
+
+    :param boundaries: (name, lower, upper) BGR ranges, checked in order.
+    :type boundaries: list
+    :param saturation: Saturation boost applied before matching ranges.
+    :type saturation: float
+    :param bits: Bits kept per channel, the table has 2**(3*bits) cells.
+    :type bits: int
+    :returns: uint8 array of shape (2**bits,) * 3, indexed [b, g, r].
+
+    """
+    levels = 2 ** bits
+    step = 256 / levels
+    centers = np.arange(levels) * step + (step - 1) / 2.0
+    grid = np.empty((levels, levels, levels, 3))
+    grid[..., 0] = centers[:, np.newaxis, np.newaxis]
+    grid[..., 1] = centers[np.newaxis, :, np.newaxis]
+    grid[..., 2] = centers[np.newaxis, np.newaxis, :]
+    enhanced = enhance_saturation(grid, saturation)
+
+    lut = np.zeros((levels,) * 3, dtype=np.uint8)
+    # Fill in reverse so earlier ranges win where ranges overlap
+    for label in xrange(len(boundaries), 0, -1):
+        name, lower, upper = boundaries[label - 1]
+        match = np.all((enhanced >= lower) & (enhanced <= upper), axis=-1)
+        lut[match] = label
+    return lut
+
+
+def classify(bgr, lut):
+    """Label every pixel of a BGR image with its color.
+
+    :param bgr: uint8 BGR image.
+    :type bgr: numpy.ndarray
+    :param lut: Table from build_color_lut.
+    :type lut: numpy.ndarray
+    :returns: uint8 label image, same height and width as bgr.
+
+    """
+    shift = 8 - int(np.log2(lut.shape[0]))
+    quantized = bgr >> shift
+    return lut[quantized[..., 0], quantized[..., 1], quantized[..., 2]]
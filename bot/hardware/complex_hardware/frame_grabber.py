@@ -0,0 +1,123 @@
+"""Continuous camera capture into a bounded ring of frames.
+
+Reading a V4L2 camera on demand hands back whatever frame has been sitting
+in the driver's queue, so callers used to grab() several times to flush it.
+FrameGrabber instead reads the camera continuously in its own thread, at
+whatever rate the sensor delivers, and keeps the newest few frames tagged
+with a sequence number and capture time. Consumers take the newest frame or
+wait for the next new one without ever holding up capture.
+
+"""
+
+import threading
+from time import sleep
+from time import time
+
+import bot.lib.lib as lib
+
+
+class FrameGrabber(threading.Thread):
+
+    """Thread that reads a capture device into a ring of recent frames."""
+
+    def __init__(self, capture, ring_size=4):
+        """Build the frame ring, don't start capturing yet.
+
+        :param capture: Open capture, anything whose read() returns
+            (grabbed, frame) like cv2.VideoCapture.
+        :param ring_size: Number of recent frames to keep.
+        :type ring_size: int
+
+        """
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.logger = lib.get_logger()
+
+        if ring_size < 1:
+            raise ValueError("Ring needs at least 1 frame")
+
+        self.capture = capture
+        # Each slot holds (seq, timestamp, frame), newest is at seq % size
+        self.ring = [None] * ring_size
+        self.seq = 0
+        self.read_errors = 0
+        self.stopped = True
+        self.new_frame = threading.Condition()
+
+    def start(self):
+        """Start capturing in the background."""
+        self.stopped = False
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Ask the capture thread to exit after its current read."""
+        self.stopped = True
+        with self.new_frame:
+            self.new_frame.notify_all()
+
+    def run(self):
+        """Entry point for thread, reads frames until stopped."""
+        while not self.stopped:
+            # Blocks until the sensor has a frame, which sets our rate
+            grabbed, frame = self.capture.read()
+            timestamp = time()
+            if not grabbed:
+                self.read_errors += 1
+                sleep(0.01)
+                continue
+            with self.new_frame:
+                self.seq += 1
+                self.ring[self.seq % len(self.ring)] = \
+                    (self.seq, timestamp, frame)
+                self.new_frame.notify_all()
+
+    def latest(self, timeout=None):
+        """Get the newest frame, waiting for the first if there's none yet.
+
+        :param timeout: Seconds to wait for a first frame, None to wait
+            for as long as capture is running.
+        :type timeout: float
+        :returns: (seq, timestamp, frame), or None if no frame arrived.
+
+        """
+        return self.wait_next(0, timeout)
+
+    def wait_next(self, after_seq, timeout=None):
+        """Wait for a frame newer than after_seq and return the newest.
+
+        Use this to get a frame captured after something happened, like
+        the arm moving, instead of one that was already in flight.
+
+        :param after_seq: Sequence number of a frame already seen.
+        :type after_seq: int
+        :param timeout: Seconds to wait, None to wait for as long as
+            capture is running.
+        :type timeout: float
+        :returns: (seq, timestamp, frame), or None on timeout or stop.
+
+        """
+        if timeout is not None:
+            deadline = time() + timeout
+        with self.new_frame:
+            while self.seq <= after_seq:
+                if self.stopped:
+                    return None
+                if timeout is None:
+                    self.new_frame.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        return None
+                    self.new_frame.wait(remaining)
+            return self.ring[self.seq % len(self.ring)]
+
+    def history(self):
+        """Get the frames still in the ring, newest first.
+
+        :returns: List of (seq, timestamp, frame).
+
+        """
+        with self.new_frame:
+            count = min(self.seq, len(self.ring))
+            return [self.ring[(self.seq - i) % len(self.ring)]
+                    for i in xrange(count)]
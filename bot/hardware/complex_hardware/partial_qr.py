@@ -128,6 +128,142 @@ def is_square(contour):
         else:
             return False
 
+def contour_stats(contours):
+    """Bounding boxes and areas of many contours in a few array operations.
+
+    All points are concatenated into one array, so each statistic is a
+    single ufunc reduceat over the per-contour segments instead of a cv2
+    call per contour. Areas come from the shoelace formula.
+
+    :param contours: Contours as returned by cv2.findContours.
+    :type contours: list of numpy.ndarray
+    :returns: Tuple of arrays (x, y, w, h, area), one entry per contour.
+
+    """
+    lengths = np.array([len(c) for c in contours])
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    xs = points[:, 0]
+    ys = points[:, 1]
+
+    x = np.minimum.reduceat(xs, starts)
+    y = np.minimum.reduceat(ys, starts)
+    w = np.maximum.reduceat(xs, starts) - x + 1
+    h = np.maximum.reduceat(ys, starts) - y + 1
+
+    # Index of the next point, wrapping around within each contour
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    cross = xs * ys[following] - xs[following] * ys
+    area = np.abs(np.add.reduceat(cross, starts)) / 2
+    return x, y, w, h, area
+
+
+def candidate_regions(contours, hierarchy, min_perimeter=15,
+                      aspect=(0.6, 1.6), min_fill=0.4):
+    """Pick out contours that could be finder patterns.
+
+    Filters on statistics for every contour at once: the contour must have
+    a child (finder patterns are nested squares), a roughly square bounding
+    box, fill most of that box and be big enough. Boxes inside an already
+    chosen, bigger box are dropped, since a finder pattern shows up as
+    several nested contours.
+
+    :param contours: Contours as returned by cv2.findContours (RETR_TREE).
+    :param hierarchy: Matching hierarchy from cv2.findContours.
+    :param min_perimeter: Smallest bounding box perimeter to keep (pixels).
+    :param aspect: (min, max) width/height ratio to keep.
+    :param min_fill: Smallest ratio of contour area to bounding box area.
+    :returns: numpy.ndarray of (x, y, w, h) boxes, largest first.
+
+    """
+    if len(contours) == 0:
+        return np.zeros((0, 4))
+    x, y, w, h, area = contour_stats(contours)
+    has_child = hierarchy[0][:, 2] != -1
+    ratio = w / h
+    keep = (has_child &
+            (ratio >= aspect[0]) & (ratio <= aspect[1]) &
+            (area >= min_fill * w * h) &
+            (2 * (w + h) >= min_perimeter))
+
+    boxes = np.column_stack((x, y, w, h))[keep]
+    boxes = boxes[np.argsort(-(boxes[:, 2] * boxes[:, 3]))]
+    chosen = []
+    for box in boxes:
+        inside = [box[0] >= c[0] and box[1] >= c[1] and
+                  box[0] + box[2] <= c[0] + c[2] and
+                  box[1] + box[3] <= c[1] + c[3] for c in chosen]
+        if not any(inside):
+            chosen.append(box)
+    return np.array(chosen).reshape(-1, 4)
+
+
+def edge_contours(gray, sigma, offset=(0, 0)):
+    """Blur, threshold and edge detect, then find the contour tree."""
+    blurred = cv2.GaussianBlur(gray, (0, 0), sigma)
+    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                   cv2.THRESH_BINARY, 9, 2)
+    edges = cv2.Canny(thresh, 50, 150)
+    return cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE,
+                            offset=offset)
+
+
+def detect_markers(frame, levels=1, pad=0.5):
+    """Find finder pattern markers coarse to fine.
+
+    Candidate regions are found on a downscaled copy of the frame (levels
+    pyrDown steps), then only those regions are searched for markers at
+    full resolution, so most of the background never gets the expensive
+    full-resolution treatment.
+
+    :param frame: BGR or grayscale frame.
+    :type frame: numpy.ndarray
+    :param levels: Number of pyramid levels to go down for candidates,
+        0 searches the whole frame at full resolution.
+    :type levels: int
+    :param pad: Margin added around candidate regions, as a fraction of
+        their size.
+    :type pad: float
+    :returns: List of Marker, in full frame coordinates.
+
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if levels <= 0:
+        cnts, hierarchy = edge_contours(frame, 3)
+        if hierarchy is None:
+            return []
+        return find_markers(cnts, hierarchy)
+
+    small = frame
+    for i in xrange(levels):
+        small = cv2.pyrDown(small)
+    scale = 2 ** levels
+    cnts, hierarchy = edge_contours(small, 3.0 / scale)
+    if hierarchy is None:
+        return []
+    regions = candidate_regions(cnts, hierarchy) * scale
+
+    height, width = frame.shape[:2]
+    markers = []
+    for x, y, w, h in regions:
+        margin = pad * max(w, h)
+        x0 = int(max(x - margin, 0))
+        y0 = int(max(y - margin, 0))
+        x1 = int(min(x + w + margin, width))
+        y1 = int(min(y + h + margin, height))
+        cnts, hierarchy = edge_contours(frame[y0:y1, x0:x1], 3, (x0, y0))
+        if hierarchy is None:
+            continue
+        for marker in find_markers(cnts, hierarchy):
+            # Regions can overlap, don't report a marker twice
+            if not any(distance(marker.center, m.center) < m.length / 2
+                       for m in markers):
+                markers.append(marker)
+    return markers
+
+
 def largest_edge(mark):
     if (mark.width > mark.height):
         return mark.width
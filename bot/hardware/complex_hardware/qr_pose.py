@@ -0,0 +1,104 @@
+"""Batched QR code pose estimates and target selection.
+
+Every code found in a frame goes through the same few lines of geometry,
+so the corners of all codes are stacked into one (N, 4, 2) array and the
+pose of every code is worked out in a handful of NumPy expressions.
+
+Corners are always ordered top left, top right, bottom left, bottom right.
+
+"""
+
+import numpy as np
+
+
+# Edge length of the QR codes on the field, in inches
+QR_SIZE = 1.5
+
+# Pairs of corner indices making up the north, south, east and west edges
+EDGES = np.array([[0, 1], [2, 3], [1, 3], [0, 2]])
+
+
+def qr_object_points(size=QR_SIZE):
+    """Corners of a QR code in its own frame (x right, y down), for PnP.
+
+    :param size: Edge length of the code.
+    :type size: float
+    :returns: (4, 3) float32 array, same corner order as image corners.
+
+    """
+    half = size / 2.0
+    return np.float32([[-half, -half, 0],
+                       [half, -half, 0],
+                       [-half, half, 0],
+                       [half, half, 0]])
+
+
+def solve_qr_batch(corners, resolution, a, n, size=QR_SIZE):
+    """Estimate the position of many QR codes relative to the camera.
+
+    Distance comes from the code's longest edge in pixels through the
+    camera's a * length**n calibration. x and y are the offset of the
+    code's center from the image center, scaled by the code's known size.
+
+    :param corners: Image corners of each code.
+    :type corners: (N, 4, 2) array
+    :param resolution: (width, height) of the image in pixels.
+    :type resolution: tuple
+    :param a: Distance calibration scale.
+    :type a: float
+    :param n: Distance calibration exponent.
+    :type n: float
+    :param size: Edge length of the codes.
+    :type size: float
+    :returns: (N, 4) array of [x, y, z, distance] per code, x right, y up.
+
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+    center = np.array(resolution, dtype=np.int64) // 2
+
+    # Whole pixels, as the single-code version worked in
+    qr_center = np.floor(corners.sum(axis=1) / 4)
+    pixel_displacement = qr_center - center
+
+    edge_vectors = corners[:, EDGES[:, 0]] - corners[:, EDGES[:, 1]]
+    edges = np.floor(np.sqrt((edge_vectors ** 2).sum(axis=2)))
+    largest_edge = edges.max(axis=1)
+
+    poses = np.empty((len(corners), 4))
+    poses[:, 3] = a * largest_edge ** n
+    poses[:, 0] = size * pixel_displacement[:, 0] / largest_edge
+    poses[:, 1] = -size * pixel_displacement[:, 1] / largest_edge
+    # Noisy corners can make x and y overshoot the distance, call that z=0
+    poses[:, 2] = np.sqrt(np.maximum(
+        poses[:, 3] ** 2 - poses[:, 0] ** 2 - poses[:, 1] ** 2, 0))
+    return poses
+
+
+def select_qr(tvecs, same_column=0.1):
+    """Pick the code to grab: the one closest to center in x.
+
+    If a neighbour in x order is within same_column of it, they are in the
+    same column of the stack, and the one with the smaller y wins.
+
+    :param tvecs: Position of each code, x in column 0 and y in column 1.
+    :type tvecs: (N, >=2) array
+    :param same_column: Largest x difference between codes in one column.
+    :type same_column: float
+    :returns: Index into tvecs of the chosen code, None if there are none.
+
+    """
+    tvecs = np.asarray(tvecs, dtype=np.float64)
+    if len(tvecs) == 0:
+        return None
+    order = np.argsort(tvecs[:, 0], kind="mergesort")
+    x = tvecs[order, 0]
+    y = tvecs[order, 1]
+
+    closest = int(np.argmin(np.abs(x)))
+    for neighbour in (closest - 1, closest + 1):
+        if 0 <= neighbour < len(x) and \
+                abs(x[neighbour] - x[closest]) < same_column:
+            if y[neighbour] < y[closest]:
+                return int(order[neighbour])
+            return int(order[closest])
+    return int(order[closest])
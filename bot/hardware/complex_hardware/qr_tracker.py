@@ -0,0 +1,90 @@
+"""Region of interest tracking for repeated QR scans.
+
+When the arm is centering on a code, the code only moves a few pixels
+between scans, so most of each full-frame scan is wasted. QRTracker
+remembers where the code was last seen and hands out a padded window
+around it to scan instead, falling back to the full frame after a few scans
+in a row come up empty.
+
+"""
+
+import numpy as np
+
+
+class QRTracker(object):
+
+    """Keeps the region a tracked QR code was last found in."""
+
+    def __init__(self, pad=0.75, max_misses=3, min_pad=32):
+        """Set how generous the window is and how quickly it's given up.
+
+        :param pad: Margin around the last corners, as a fraction of the
+            code's size in pixels.
+        :type pad: float
+        :param max_misses: Scans in a row without the code before going
+            back to scanning the full frame.
+        :type max_misses: int
+        :param min_pad: Smallest margin in pixels, so small or distant codes
+            still get room to move.
+        :type min_pad: int
+
+        """
+        self.pad = pad
+        self.max_misses = max_misses
+        self.min_pad = min_pad
+        self.reset()
+
+    def reset(self):
+        """Forget the tracked code, the next scan is full frame."""
+        self.corners = None
+        self.misses = 0
+
+    @property
+    def tracking(self):
+        return self.corners is not None
+
+    def roi(self, shape):
+        """Get the window to scan in a frame of the given shape.
+
+        :param shape: Frame shape, (rows, cols) or (rows, cols, channels).
+        :type shape: tuple
+        :returns: (x0, y0, x1, y1) pixel bounds, or None for the full frame.
+
+        """
+        if self.corners is None:
+            return None
+        height, width = shape[:2]
+        low = self.corners.min(axis=0)
+        high = self.corners.max(axis=0)
+        margin = max(self.pad * (high - low).max(), self.min_pad)
+        x0, y0 = np.maximum(np.floor(low - margin), 0).astype(int)
+        x1, y1 = np.ceil(high + margin).astype(int)
+        x1 = min(x1, width)
+        y1 = min(y1, height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def found(self, corners):
+        """Record where the code was found, in full frame coordinates.
+
+        :param corners: Corner points of the code.
+        :type corners: sequence of (x, y)
+
+        """
+        self.corners = np.array(corners, dtype=np.float32).reshape(-1, 2)
+        self.misses = 0
+
+    def missed(self):
+        """Record a scan that didn't find the code.
+
+        :returns: True if the tracker gave up and will scan full frames.
+
+        """
+        if self.corners is None:
+            return True
+        self.misses += 1
+        if self.misses >= self.max_misses:
+            self.reset()
+            return True
+        return False
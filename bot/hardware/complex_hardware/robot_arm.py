@@ -34,7 +34,7 @@ GRAB = 5
 class RobotArm(object):
 
     """An object that resembles a robotic arm with n joints"""
-    def __init__(self, arm_config):
+    def __init__(self, arm_config, ir=None):
         
         self.logger = lib.get_logger()
         self.bot_config = lib.get_config()
@@ -51,6 +51,8 @@ class RobotArm(object):
         # Figure out what camera is being used
         cam_model = arm_config["camera"]
         self.cam = Camera(self.bot_config[cam_model])
+        if arm_config.get("camera_warm_up", False):
+            self.cam.warm_up()
         self.rail = Rail_Mover()  
         
         # initialize vertices of QR code
@@ -66,7 +68,8 @@ class RobotArm(object):
 
         self.hopper = [None, None, None, None]
         
-        self.IR = IR()
+        # Nav reads the same sensors, share its IR when there is one
+        self.IR = ir if ir is not None else IR()
         #self.cam.start()
 
     @property
@@ -137,8 +140,10 @@ class RobotArm(object):
         p_x = 10
         p_y = 10
 
+        # Scan around the code found last time instead of the full frame
+        self.cam.tracker.reset()
         while True:
-            ret = self.cam.QRSweep()
+            ret = self.cam.QRSweep(track=True)
             
             # Calculate new vector for change
             if ret != None:
@@ -338,7 +343,7 @@ class RobotArm(object):
         block_dist = 12.5 #adjust to correct block distance from camera
         self.rail.DisplacementMover(3600 - self.rail.rail_motor.position) #goto middle
         for i in xrange(1): #potentially move multiple times to get it right
-            img = self.cam.get_current_frame() #needs to be bottom camera
+            img = self.cam.read_next() #needs to be bottom camera
             offsets = generic_blocks.get_lateral_offset(img, block_dist)
             if len(offsets) == 0: return 0
             self.rail.DisplacementConverter(-offsets[0])
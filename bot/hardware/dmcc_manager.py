@@ -0,0 +1,156 @@
+"""Process-wide access to the DMCC motor capes.
+
+Every DMCCMotorSet used to run its own pyDMCC.autodetect(), and the rail
+built its own pyDMCC.DMCC, so one physical board could have several Python
+objects talking over I2C from different threads at once. DMCCManager scans
+for boards once and hands out the same board objects to everyone, wrapped
+so that every bus transaction on a board holds that board's lock.
+
+Use get_manager() to get the shared instance.
+
+"""
+
+from collections import defaultdict
+from threading import Lock, RLock
+
+import pyDMCC
+
+import bot.lib.lib as lib
+
+
+class Locked(object):
+
+    """Proxy that makes every attribute access on a DMCC object hold a lock.
+
+    pyDMCC reads and writes registers in property getters and setters, so
+    getting or setting any attribute, or calling any method, is a bus
+    transaction and is done with the board's lock held.
+
+    """
+
+    def __init__(self, target, lock):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_lock", lock)
+
+    @property
+    def __class__(self):
+        # So isinstance checks see the wrapped pyDMCC type
+        return type(self._target)
+
+    def __getattr__(self, name):
+        with self._lock:
+            value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        def locked_call(*args, **kwargs):
+            with self._lock:
+                return value(*args, **kwargs)
+        return locked_call
+
+    def __setattr__(self, name, value):
+        with self._lock:
+            setattr(self._target, name, value)
+
+    def __repr__(self):
+        return "Locked({!r})".format(self._target)
+
+
+class LockedBoard(Locked):
+
+    """Locked proxy for a pyDMCC.DMCC, whose motors share its lock."""
+
+    def __init__(self, dmcc, lock):
+        Locked.__init__(self, dmcc, lock)
+        motors = dict((num, Locked(motor, lock))
+                      for num, motor in dmcc.motors.items())
+        object.__setattr__(self, "motors", motors)
+
+
+class DMCCManager(object):
+
+    """Owns every DMCC board in the process, one lock per board."""
+
+    def __init__(self):
+        """Detect the boards, or fake them when DMCCs are in test mode."""
+        self.config = lib.get_config()
+        self.logger = lib.get_logger()
+        self.is_testing = self.config["test_mode"]["DMCC"]
+
+        if not self.is_testing:
+            dmccs = pyDMCC.autodetect()
+            self.logger.debug("Found %d physical DMCC boards" % len(dmccs))
+        else:
+            self.logger.debug("Skipping autodetect due to test mode")
+            dmccs = defaultdict(
+                lambda: pyDMCC.DMCC(
+                    0, verify=False, bus=None, logger=self.logger))
+        self.dmccs = dmccs
+
+        self.boards = {}
+        self.locks = {}
+        # Guards the two dicts above, not the bus
+        self.table_lock = Lock()
+
+    def lock(self, board_num):
+        """Get the lock held for transactions on a board.
+
+        Hold it to make several transactions on one board back to back,
+        like writing both of its motors. It's reentrant, so the proxies'
+        own locking still works inside.
+
+        :param board_num: Cape number of the board.
+        :type board_num: int
+        :returns: The board's RLock.
+
+        """
+        with self.table_lock:
+            if board_num not in self.locks:
+                self.locks[board_num] = RLock()
+            return self.locks[board_num]
+
+    def board(self, board_num):
+        """Get the shared, locked handle to a board.
+
+        :param board_num: Cape number of the board.
+        :type board_num: int
+        :returns: LockedBoard for the board.
+        :raises KeyError: If no such board was detected.
+
+        """
+        lock = self.lock(board_num)
+        with self.table_lock:
+            if board_num not in self.boards:
+                self.boards[board_num] = LockedBoard(self.dmccs[board_num],
+                                                     lock)
+            return self.boards[board_num]
+
+    def motor(self, board_num, motor_num):
+        """Get the shared, locked handle to one motor of a board.
+
+        :param board_num: Cape number of the board.
+        :type board_num: int
+        :param motor_num: Motor on the board, 1 or 2.
+        :type motor_num: int
+        :returns: Locked pyDMCC.Motor.
+        :raises KeyError: If there's no such board or motor.
+
+        """
+        return self.board(board_num).motors[motor_num]
+
+
+_manager = None
+_manager_lock = Lock()
+
+
+def get_manager():
+    """Get the process-wide DMCCManager, detecting boards on first call.
+
+    :returns: The shared DMCCManager.
+
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DMCCManager()
+        return _manager
@@ -2,9 +2,8 @@
 
 from collections import defaultdict
 
-import pyDMCC
-
 import bot.lib.lib as lib
+from bot.hardware.dmcc_manager import get_manager
 
 
 class DMCCMotorSet(dict):
@@ -25,24 +24,9 @@ class DMCCMotorSet(dict):
         self.logger = lib.get_logger()
         self.is_testing = self.config["test_mode"]["DMCC"]
 
-        # print "Testing: ", self.config["testing"]
-        # print pyDMCC.lib._config
-
-        # This instantiates all DMCCs in every DMCCManager, which is probably
-        # not optimal, which works fine for our purposes.  Potentially better
-        # approaches:
-        #  - global state: shared dmccs dictionary, instantiated once
-        #  - selected instantiation: only initialize the dmccs we are control
-        if not self.is_testing:
-            dmccs = pyDMCC.autodetect()
-            self.logger.debug("Found %d physical DMCC boards" % len(dmccs))
-        else:
-            self.logger.debug("Skipping autodetect due to test mode")
-            dmccs = defaultdict(
-                lambda: pyDMCC.DMCC(
-                    0, verify=False, bus=None, logger=self.logger))
-
-        self.logger.debug("DMCC Motor conf: {}".format(dmccs))
+        # Boards are detected once per process and shared with every other
+        # user, like the rail, which also serializes their bus access
+        self.manager = get_manager()
 
         self.motors = {}
         for name, conf in motor_config.items():
@@ -52,7 +36,8 @@ class DMCCMotorSet(dict):
                 invert = False
             try:
                 self.motors[name] = DMCCMotor(
-                    dmccs[conf['board_num']], conf['motor_num'], invert)
+                    self.manager.board(conf['board_num']), conf['motor_num'],
+                    invert)
             except KeyError:
                 self.logger.error(
                     "Bad motor definition for motor: '{}'".format(
@@ -64,6 +49,40 @@ class DMCCMotorSet(dict):
     def __getitem__(self, index):
         return self.motors[index]
 
+    def set_powers(self, powers, deadband=0):
+        """Set the power of several motors, skipping needless writes.
+
+        A motor is only written if its power changes by at least deadband,
+        so small corrections that make no physical difference don't cost an
+        I2C transaction. A change to zero is always written, so a stop is
+        never swallowed. Writes are issued board by board, each board's
+        writes back to back under its lock.
+
+        :param powers: Map of motor name to desired power [-100,100].
+        :type powers: dict
+        :param deadband: Smallest change in power worth writing.
+        :type deadband: float
+        :returns: Number of motors actually written.
+
+        """
+        boards = defaultdict(list)
+        for name, value in powers.items():
+            motor = self.motors[name]
+            current = motor.power
+            if value == current:
+                continue
+            if value != 0 and abs(value - current) < deadband:
+                continue
+            boards[motor.dmcc.cape_num].append((motor.motor_num, motor, value))
+
+        written = 0
+        for board_num in sorted(boards):
+            with self.manager.lock(board_num):
+                for motor_num, motor, value in sorted(boards[board_num]):
+                    motor.power = value
+                    written += 1
+        return written
+
     def __str__(self):
         return "{} for motors: {}".format(self.__class__.__name__,
                                           self.motors.keys())
@@ -74,7 +93,7 @@ class DMCCMotor(object):
     def __init__(self, dmcc, motor_num, invert=False):
         """Wraps an individual pyDMCC motor
 
-        :param dmcc: Controlling pyDMCC.DMCC object, None when testing
+        :param dmcc: Controlling board, from DMCCManager.board
         :param motor_num: Motor number in motor_num_range.
         :param invert: Set to True if all values should be inverted
         :type motor_num: int
@@ -0,0 +1,102 @@
+"""Conversion of raw IR hub counts to distances.
+
+The IR hub reports a 16-bit count per channel. Converting those counts with
+a power curve in Python for every sample is wasteful, so IRCalibration
+evaluates each sensor's curve once over the whole raw range and converts a
+packet with a single vectorized table lookup.
+
+"""
+
+import numpy as np
+
+
+# Curve used for any sensor without its own calibration: scale * raw**exponent
+DEFAULT_CURVE = {"scale": 2000000, "exponent": -1.55}
+
+# Size of the raw count range the hub can report
+RAW_RANGE = 1 << 16
+
+
+class IRCalibration(object):
+
+    """Per-sensor bias and distance curves, applied as a lookup table."""
+
+    def __init__(self, sensors, biases=None, curves=None):
+        """Precompute the distance lookup table for every sensor.
+
+        :param sensors: Map of sensor name to 1-based channel in the packet.
+        :type sensors: dict
+        :param biases: Map of sensor name to raw count offset.
+        :type biases: dict
+        :param curves: Map of sensor name (or "default") to a curve dict
+            with "scale" and "exponent" keys.
+        :type curves: dict
+
+        """
+        if biases is None:
+            biases = {}
+        if curves is None:
+            curves = {}
+        default_curve = curves.get("default", DEFAULT_CURVE)
+
+        self.names = sorted(sensors.keys())
+        self.channels = np.array([sensors[name] - 1 for name in self.names],
+                                 dtype=np.intp)
+        self.rows = np.arange(len(self.names), dtype=np.intp)
+        self.bias = np.zeros(len(self.names), dtype=np.int32)
+        for name, bias in biases.items():
+            self.set_bias(name, bias)
+
+        # One row of distances per sensor, indexed by (biased) raw count
+        self.lut = np.empty((len(self.names), RAW_RANGE), dtype=np.int32)
+        for row, name in enumerate(self.names):
+            self.lut[row] = self.build_curve(curves.get(name, default_curve))
+
+    @staticmethod
+    def build_curve(curve):
+        """Evaluate a calibration curve over every raw count.
+
+        A raw count of zero means nothing was seen and maps to zero.
+
+        :param curve: Dict with "scale" and "exponent" keys.
+        :type curve: dict
+        :returns: Array of RAW_RANGE distances, truncated to ints.
+
+        """
+        raw = np.arange(1, RAW_RANGE, dtype=np.float64)
+        table = np.zeros(RAW_RANGE, dtype=np.int32)
+        table[1:] = curve["scale"] * raw ** curve["exponent"]
+        return table
+
+    def set_bias(self, name, bias):
+        """Change the raw count offset of one sensor.
+
+        :param name: Sensor name, as used in the IR config.
+        :type name: string
+        :param bias: Offset added to the raw count before conversion.
+        :type bias: int
+
+        """
+        try:
+            row = self.names.index(name)
+        except ValueError:
+            # Biases for sensors that aren't mapped have nowhere to go
+            return
+        self.bias[row] = bias
+
+    def convert(self, raw):
+        """Convert one decoded packet of raw counts to distances.
+
+        Biased counts below zero are clamped to one, matching the hub's
+        historical behavior, without stalling the caller.
+
+        :param raw: Raw counts, indexed by packet channel.
+        :type raw: list or numpy.ndarray
+        :returns: Dict mapping sensor name to distance.
+
+        """
+        counts = np.asarray(raw, dtype=np.int32)[self.channels] + self.bias
+        counts[counts < 0] = 1
+        np.minimum(counts, RAW_RANGE - 1, out=counts)
+        distances = self.lut[self.rows, counts]
+        return dict(zip(self.names, distances.tolist()))
@@ -0,0 +1,203 @@
+"""Noise filters for IR distance readings.
+
+Every filter works on a vector holding one value per sensor and keeps its
+state in preallocated NumPy arrays, so feeding it a sample costs the same
+small, fixed amount of work and allocates nothing per channel.
+
+"""
+
+from inspect import getargspec
+
+import numpy as np
+
+
+class MovingAverageFilter(object):
+
+    """Mean of the last `window` samples, kept as a running sum."""
+
+    def __init__(self, channels, window=4):
+        self.window = window
+        self.ring = np.zeros((window, channels))
+        self.total = np.zeros(channels)
+        self.reset()
+
+    def reset(self):
+        self.ring.fill(0)
+        self.total.fill(0)
+        self.index = 0
+        self.count = 0
+
+    def update(self, values):
+        self.total += values - self.ring[self.index]
+        self.ring[self.index] = values
+        self.index = (self.index + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+        return self.total / self.count
+
+
+class ExponentialFilter(object):
+
+    """Exponentially weighted average, alpha is the weight of a new sample."""
+
+    def __init__(self, channels, alpha=0.5):
+        self.alpha = alpha
+        self.state = np.zeros(channels)
+        self.reset()
+
+    def reset(self):
+        self.state.fill(0)
+        self.primed = False
+
+    def update(self, values):
+        if not self.primed:
+            self.state[:] = values
+            self.primed = True
+        else:
+            self.state += self.alpha * (values - self.state)
+        return self.state.copy()
+
+
+class MedianFilter(object):
+
+    """Median of the last `window` samples, good at rejecting spikes."""
+
+    def __init__(self, channels, window=5):
+        self.window = window
+        self.ring = np.zeros((window, channels))
+        # Partitioned in place each sample, so the ring keeps its order
+        self.scratch = np.zeros((window, channels))
+        self.median = np.zeros(channels)
+        self.reset()
+
+    def reset(self):
+        self.ring.fill(0)
+        self.index = 0
+        self.count = 0
+
+    def update(self, values):
+        self.ring[self.index] = values
+        self.index = (self.index + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+
+        # Only the middle of each column needs to be in sorted position
+        scratch = self.scratch[:self.count]
+        np.copyto(scratch, self.ring[:self.count])
+        middle = self.count // 2
+        if self.count % 2:
+            scratch.partition(middle, axis=0)
+            self.median[:] = scratch[middle]
+        else:
+            scratch.partition((middle - 1, middle), axis=0)
+            np.add(scratch[middle - 1], scratch[middle], out=self.median)
+            self.median *= 0.5
+        return self.median.copy()
+
+
+class KalmanFilter(object):
+
+    """Scalar Kalman filter per channel, modelling distance as a random walk.
+
+    process_noise is how much the true distance may change between samples,
+    measurement_noise is the variance of a single reading.
+
+    """
+
+    def __init__(self, channels, process_noise=1.0, measurement_noise=25.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.estimate = np.zeros(channels)
+        self.variance = np.zeros(channels)
+        self.gain = np.zeros(channels)
+        self.reset()
+
+    def reset(self):
+        self.estimate.fill(0)
+        self.variance.fill(self.measurement_noise)
+        self.primed = False
+
+    def update(self, values):
+        if not self.primed:
+            self.estimate[:] = values
+            self.primed = True
+            return self.estimate.copy()
+        self.variance += self.process_noise
+        np.divide(self.variance, self.variance + self.measurement_noise,
+                  out=self.gain)
+        self.estimate += self.gain * (values - self.estimate)
+        self.variance *= 1 - self.gain
+        return self.estimate.copy()
+
+
+# Filter types selectable from config, by name
+FILTERS = {
+    "moving_average": MovingAverageFilter,
+    "exponential": ExponentialFilter,
+    "median": MedianFilter,
+    "kalman": KalmanFilter,
+}
+
+
+class IRFilter(object):
+
+    """Applies one filter type to a dict of named IR readings."""
+
+    def __init__(self, names, kind="moving_average", **params):
+        """Build filter state for each named sensor.
+
+        :param names: Names of the sensors that will be filtered.
+        :type names: iterable of string
+        :param kind: Filter type, one of the keys of FILTERS.
+        :type kind: string
+        :param params: Parameters for that filter type, like window or alpha.
+        :raises: ValueError for an unknown filter type.
+
+        """
+        try:
+            filter_class = FILTERS[kind]
+        except KeyError:
+            raise ValueError("Unknown IR filter type: '{}'".format(kind))
+        self.kind = kind
+        self.names = sorted(names)
+        self.samples = np.zeros(len(self.names))
+        self.filter = filter_class(len(self.names), **params)
+
+    def update(self, values):
+        """Feed one reading of every sensor, get the filtered readings.
+
+        :param values: Map of sensor name to distance.
+        :type values: dict
+        :returns: Dict mapping sensor name to filtered distance.
+
+        """
+        for i, name in enumerate(self.names):
+            self.samples[i] = values[name]
+        filtered = self.filter.update(self.samples)
+        return dict(zip(self.names, filtered.tolist()))
+
+    def reset(self):
+        """Forget all previous samples."""
+        self.filter.reset()
+
+
+def build_filter(names, filter_config):
+    """Build an IRFilter from an IR_Filter config entry.
+
+    :param names: Names of the sensors that will be filtered.
+    :type names: iterable of string
+    :param filter_config: Dict with a "type" key, the filter's parameters
+        and optionally other keys (like "sides") that are ignored here.
+    :type filter_config: dict
+    :returns: Constructed IRFilter.
+
+    """
+    kind = filter_config.get("type", "moving_average")
+    filter_class = FILTERS.get(kind)
+    if filter_class is None:
+        raise ValueError("Unknown IR filter type: '{}'".format(kind))
+    # Only hand the filter the parameters its constructor takes
+    accepted = getargspec(filter_class.__init__).args[2:]
+    params = dict((key, value) for key, value in filter_config.items()
+                  if key in accepted)
+    return IRFilter(names, kind, **params)
@@ -0,0 +1,174 @@
+"""Framing and decoding of the IR hub's I2C byte stream.
+
+The IR hub streams frames of FRAME_LEN data bytes, each preceded by a SYNC
+byte. IRPacketDecoder splits a byte stream into frames and counts anything
+that had to be thrown away. IRLink drives the decoder from the bus with a
+deadline per frame, so a noisy or dead link can't hang a control loop.
+
+"""
+
+from time import time
+
+import numpy as np
+
+
+# Byte the hub sends before every frame
+SYNC = 255
+
+# Data bytes per frame, two little-endian bytes per channel
+FRAME_LEN = 20
+
+
+def parse_frame(frame):
+    """Turn the data bytes of one frame into raw channel counts.
+
+    :param frame: FRAME_LEN data bytes.
+    :type frame: list or bytearray
+    :returns: numpy.ndarray of FRAME_LEN / 2 raw counts.
+
+    """
+    return np.frombuffer(bytearray(frame), dtype="<u2").astype(np.int32)
+
+
+class IRPacketDecoder(object):
+
+    """Incrementally splits the hub's byte stream into frames."""
+
+    def __init__(self):
+        """Start out waiting for a sync byte, with zeroed counters."""
+        self.frames = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+        self.reset()
+
+    def reset(self):
+        """Drop any partial frame and wait for the next sync byte.
+
+        Counters are kept, this only forgets stream state.
+
+        """
+        self.buf = bytearray()
+        self.in_frame = False
+
+    def feed(self, data):
+        """Decode more bytes from the stream.
+
+        :param data: Bytes read from the hub.
+        :type data: iterable of int
+        :returns: List of complete frames (bytearrays), oldest first.
+
+        """
+        complete = []
+        for byte in data:
+            if byte == SYNC:
+                if self.in_frame and len(self.buf) > 0:
+                    # Frame was cut short, a byte must have been lost
+                    self.resyncs += 1
+                self.buf = bytearray()
+                self.in_frame = True
+            elif self.in_frame:
+                self.buf.append(byte)
+                if len(self.buf) == FRAME_LEN:
+                    complete.append(self.buf)
+                    self.frames += 1
+                    self.buf = bytearray()
+                    self.in_frame = False
+            else:
+                # Between frames, or we came in mid-frame
+                self.skipped_bytes += 1
+        return complete
+
+
+class IRLink(object):
+
+    """Reads frames from the IR hub with a bounded wait per frame."""
+
+    def __init__(self, bus, addr=8, block_size=1, frame_timeout=0.05):
+        """Set up framing for the hub at the given I2C address.
+
+        :param bus: Open smbus.SMBus (or anything with the same reads).
+        :param addr: I2C address of the IR hub.
+        :type addr: int
+        :param block_size: Bytes per bus transaction. 1 uses read_byte,
+            larger values use I2C block reads.
+        :type block_size: int
+        :param frame_timeout: Seconds to wait for a frame before giving up.
+        :type frame_timeout: float
+
+        """
+        self.bus = bus
+        self.addr = addr
+        self.block_size = block_size
+        self.frame_timeout = frame_timeout
+        self.decoder = IRPacketDecoder()
+
+        self.frames_read = 0
+        self.timeouts = 0
+        self.superseded = 0
+        self.bytes_read = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def read_chunk(self):
+        """Do one bus transaction, return the bytes it got."""
+        if self.block_size > 1:
+            return self.bus.read_i2c_block_data(self.addr, 0,
+                                                self.block_size)
+        return [self.bus.read_byte(self.addr)]
+
+    def read_frame(self):
+        """Read the next complete frame from the hub.
+
+        If one transaction yields several frames, the newest is used.
+
+        :returns: bytearray of FRAME_LEN data bytes.
+        :raises: IOError if no complete frame arrives before the deadline.
+
+        """
+        start = time()
+        deadline = start + self.frame_timeout
+        # Partial frames left from a previous read are stale by now
+        self.decoder.reset()
+        while True:
+            chunk = self.read_chunk()
+            self.bytes_read += len(chunk)
+            frames = self.decoder.feed(chunk)
+            now = time()
+            if frames:
+                self.superseded += len(frames) - 1
+                self.record_latency(now - start)
+                return frames[-1]
+            if now > deadline:
+                self.timeouts += 1
+                raise IOError("No IR frame within {} s".format(
+                    self.frame_timeout))
+
+    def record_latency(self, latency):
+        self.frames_read += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def stats(self):
+        """Summarize link health since it was created.
+
+        :returns: Dict of frame, error and latency (ms) counters.
+
+        """
+        if self.frames_read:
+            mean_latency = self.total_latency / self.frames_read
+        else:
+            mean_latency = 0.0
+        return {
+            "frames": self.frames_read,
+            "resyncs": self.decoder.resyncs,
+            "timeouts": self.timeouts,
+            "dropped_frames": self.timeouts + self.superseded,
+            "skipped_bytes": self.decoder.skipped_bytes,
+            "bytes_read": self.bytes_read,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": mean_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+        }
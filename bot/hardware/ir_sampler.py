@@ -0,0 +1,164 @@
+"""Background acquisition of IR rangefinder frames.
+
+The IR hub is read over I2C, which is slow and must not be shared between
+threads. IRSampler owns the bus reads in its own thread and keeps the most
+recent frames in a preallocated ring, so consumers can grab the newest
+frame without waiting on (or contending for) the bus.
+
+"""
+
+import threading
+from time import sleep
+from time import time
+
+import bot.lib.lib as lib
+
+
+class IRSnapshot(dict):
+
+    """IR distances from a single read of the rangefinder hub.
+
+    Behaves exactly like the dict returned by IR.read_values, with the
+    time the values were read attached, so that every consumer within one
+    control tick works off the same readings.
+
+    """
+
+    def __init__(self, values, timestamp):
+        """Store IR values and the time they were read.
+
+        :param values: Map of sensor name to distance.
+        :type values: dict
+        :param timestamp: Time (seconds since epoch) values were read.
+        :type timestamp: float
+
+        """
+        super(IRSnapshot, self).__init__(values)
+        self.timestamp = timestamp
+
+    def age(self):
+        """Seconds elapsed since this snapshot was read."""
+        return time() - self.timestamp
+
+
+class IRSampler(threading.Thread):
+
+    """Thread that reads IR frames at a fixed rate into a ring buffer.
+
+    The ring is allocated once. The sampler only ever writes into the slot
+    after the newest one and publishes it by updating a single index, so
+    readers never take a lock. A frame returned by latest() stays valid
+    for ring_size - 1 sample periods; copy it if it must be kept longer.
+
+    """
+
+    def __init__(self, read_func, rate=100, ring_size=16):
+        """Build the frame ring, don't start sampling yet.
+
+        :param read_func: Callable that polls the bus, returns a value dict.
+        :type read_func: callable
+        :param rate: Sampling rate in Hz.
+        :type rate: float
+        :param ring_size: Number of frames to keep (at least 2).
+        :type ring_size: int
+
+        """
+        threading.Thread.__init__(self)
+        self.logger = lib.get_logger()
+
+        if ring_size < 2:
+            raise ValueError("Ring needs at least 2 frames")
+        if rate <= 0:
+            raise ValueError("Sample rate must be positive")
+
+        self.read_func = read_func
+        self.period = 1.0 / rate
+        self.frames = [IRSnapshot({}, 0.0) for i in xrange(ring_size)]
+
+        # Index of the newest complete frame, -1 until the first one
+        self.newest = -1
+        self.frame_count = 0
+        self.read_errors = 0
+        self.stopped = True
+        self.first_frame = threading.Event()
+
+    def start(self):
+        """Start sampling in the background."""
+        self.stopped = False
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Ask the sampler thread to exit after its current read."""
+        self.stopped = True
+
+    def run(self):
+        """Entry point for thread, reads frames until stopped."""
+        next_time = time()
+        while not self.stopped:
+            self.sample()
+
+            # Schedule off the previous deadline, not the time the read
+            # finished, so bus timing doesn't drift the sample rate
+            next_time += self.period
+            delay = next_time - time()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_time = time()
+
+    def sample(self):
+        """Read one frame into the slot after the newest one.
+
+        :returns: True if a frame was stored, False if the read failed.
+
+        """
+        timestamp = time()
+        try:
+            values = self.read_func()
+        except IOError as e:
+            self.read_errors += 1
+            self.logger.warning("IR sampler read failed: {}".format(e))
+            return False
+
+        slot_index = (self.newest + 1) % len(self.frames)
+        slot = self.frames[slot_index]
+        slot.clear()
+        slot.update(values)
+        slot.timestamp = timestamp
+
+        # Publishing the index is the only thing readers look at
+        self.newest = slot_index
+        self.frame_count += 1
+        self.first_frame.set()
+        return True
+
+    def latest(self, timeout=None):
+        """Get the newest frame without touching the bus.
+
+        :param timeout: Seconds to wait for the first frame, None for no wait.
+        :type timeout: float
+        :returns: Newest IRSnapshot, or None if no frame is available yet.
+
+        """
+        newest = self.newest
+        if newest < 0:
+            if timeout is None or not self.first_frame.wait(timeout):
+                return None
+            newest = self.newest
+        return self.frames[newest]
+
+    def history(self, count=None):
+        """Get the most recent frames, newest first.
+
+        :param count: Number of frames wanted, defaults to the whole ring.
+        :type count: int
+        :returns: List of IRSnapshot, newest first.
+
+        """
+        newest = self.newest
+        # The oldest slot may be mid-write, never hand it out
+        available = min(self.frame_count, len(self.frames) - 1)
+        if count is None or count > available:
+            count = available
+        return [self.frames[(newest - i) % len(self.frames)]
+                for i in xrange(count)]
@@ -1,7 +1,9 @@
 """Library of useful functions that apply to many modules."""
 
 from os import path
+import ctypes
 import logging.handlers
+import time
 
 try:
     import yaml
@@ -18,6 +20,20 @@ _logger = None
 default_config = "/root/bot/bot/config.yaml"
 
 
+# Monotonic clock. Python 2 has no time.monotonic, so ask librt directly and
+# fall back to wall-clock time where that isn't available.
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+_CLOCK_MONOTONIC = 1
+try:
+    # By soname, find_library would run ldconfig or gcc on every import
+    _clock_gettime = ctypes.CDLL("librt.so.1", use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
 # Types
 class Enum(tuple):
     """Simple enumeration type based on tuple with integer values."""
@@ -62,6 +78,24 @@ def get_config(config_file=None):
         return _config
 
 
+def monotonic():
+    """Seconds from a clock that never jumps, for measuring intervals.
+
+    Unlike time.time(), this isn't affected by NTP or manual clock changes,
+    so it's safe to schedule control loops off. Only differences between
+    two readings are meaningful.
+
+    :returns: Current reading of the monotonic clock, in seconds.
+
+    """
+    if _clock_gettime is None:
+        return time.time()
+    timespec = _Timespec()
+    if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+        return time.time()
+    return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+
 def write_config(new_config):
     """Write an updated version of config to global _config.
 
@@ -11,7 +11,8 @@ bot servers and clients.
 Note that only messages intended to be sent over REQ/REP sockets, like
 the ones used by CtrlClient/CtrlServer, have message specs. PUB/SUB
 sockets are one-way, and since topic matching is required to be
-prefixed-based, PubServer always uses the format "{topic} {data}".
+prefixed-based, PubServer sends either "{topic} {data}" or, in binary
+mode, a topic frame followed by a record from bot.lib.telemetry.
 
 """
 
@@ -102,6 +103,37 @@ def call_reply(msg, call_return):
     return {"type": "call_reply", "msg": msg, "call_return": call_return}
 
 
+def batch_req(calls, stop_on_error=False):
+    """Construct message used when sending several API calls at once.
+
+    CtrlServer runs the calls in order and answers with one batch_reply.
+
+    :param calls: call_req messages, in the order to run them.
+    :type calls: list
+    :param stop_on_error: Don't run the calls after one that fails.
+    :type stop_on_error: boolean
+    :returns: Constructed batch_req dict, ready to be sent over the wire.
+
+    """
+    return {
+        "type": "batch_req",
+        "calls": calls,
+        "stop_on_error": stop_on_error
+    }
+
+
+def batch_reply(replies):
+    """Construct message used by CtrlServer when replying to batches.
+
+    :param replies: call_reply or error message for each call that was
+        run, in order. Shorter than the batch if it stopped on an error.
+    :type replies: list
+    :returns: Constructed batch_reply dict, ready to be sent over the wire.
+
+    """
+    return {"type": "batch_reply", "replies": replies}
+
+
 def exit_req():
     """Construct message used when asking CtrlServer to exit.
 
@@ -0,0 +1,112 @@
+"""Batched, timestamped samples recorded by control loops for telemetry.
+
+Control loops record a row of numbers per tick (IR distances, PID terms,
+motor commands) into a SampleStream. Rows go into a preallocated batch.
+When the batch is full it's swapped out onto a queue of full batches and
+a fresh one takes its place, so recording never waits on the publisher:
+PubServer drains full batches from its own thread whenever it gets to
+them. Streams only record while PubServer has a subscriber for them.
+
+PubServer starts and stops a stream from its own thread while the loop
+may be recording, so recording, flushing and stopping share one small
+lock. Taking it is cheap next to a control tick, and it's never taken
+while the stream is inactive.
+
+"""
+
+from collections import deque
+from threading import Lock
+from time import time
+
+import numpy as np
+
+
+class SampleStream(object):
+
+    """Fixed-width rows of samples, handed over in batches of batch_size."""
+
+    def __init__(self, name, fields, batch_size=50, max_batches=20):
+        """Build the stream, inactive until a subscriber turns it on.
+
+        :param name: Topic the stream is published as.
+        :type name: string
+        :param fields: Names of the columns of each sample, a timestamp
+            column is added in front.
+        :type fields: list
+        :param batch_size: Samples per published batch.
+        :type batch_size: int
+        :param max_batches: Full batches kept waiting for the publisher,
+            the oldest are dropped past this.
+        :type max_batches: int
+
+        """
+        if batch_size < 1:
+            raise ValueError("Batches need at least 1 sample")
+        self.name = name
+        self.fields = ["timestamp"] + list(fields)
+        self.batch_size = batch_size
+        self.full = deque(maxlen=max_batches)
+        self.active = False
+        # Guards batch, count and the clearing of full, see module doc
+        self.lock = Lock()
+        self.batch = self.new_batch()
+        self.count = 0
+
+    def new_batch(self):
+        return np.empty((self.batch_size, len(self.fields)))
+
+    def record(self, values, timestamp=None):
+        """Add a sample, if anyone is listening.
+
+        :param values: One value per field, in order.
+        :type values: sequence
+        :param timestamp: When the values were read, now if not given.
+        :type timestamp: float
+
+        """
+        if not self.active:
+            return
+        with self.lock:
+            # Stopped while waiting for the lock
+            if not self.active:
+                return
+            row = self.batch[self.count]
+            row[0] = time() if timestamp is None else timestamp
+            row[1:] = values
+            self.count += 1
+            if self.count == self.batch_size:
+                self.full.append(self.batch)
+                self.batch = self.new_batch()
+                self.count = 0
+
+    def flush(self):
+        """Queue the partly filled batch, so its samples aren't held back."""
+        with self.lock:
+            if self.count:
+                self.full.append(self.batch[:self.count])
+                self.batch = self.new_batch()
+                self.count = 0
+
+    def drain(self):
+        """Take every full batch, oldest first.
+
+        :returns: List of (samples, fields) arrays, one per batch.
+
+        """
+        batches = []
+        while True:
+            try:
+                batches.append(self.full.popleft())
+            except IndexError:
+                return batches
+
+    def start(self):
+        """Start recording samples."""
+        self.active = True
+
+    def stop(self):
+        """Stop recording and drop anything not yet published."""
+        with self.lock:
+            self.active = False
+            self.full.clear()
+            self.count = 0
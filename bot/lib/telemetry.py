@@ -0,0 +1,154 @@
+"""Compact binary encoding of published telemetry values.
+
+PubServer's text mode sends "topic value", with the value formatted by
+str() on the bot and parsed back by whoever listens. In binary mode the
+topic and the payload are separate ZMQ frames, and the payload is a packed
+record: a type code, the time the value was sampled and the value itself.
+
+Record layouts, all little-endian:
+
+    header       B type, d timestamp (seconds since the epoch)
+    NUMBER       d value
+    INTEGER      q value
+    NUMBERS      H count, count * d
+    NAMED        H count, H length of names, names joined by NUL,
+                 count * d values, in the order of the names
+    TEXT         rest of the payload, UTF-8
+    BATCH        H rows, H columns, H length of names, column names
+                 joined by NUL, rows * columns d values, row by row
+
+"""
+
+import numbers
+import struct
+from time import time
+
+import numpy as np
+
+
+NUMBER = 1
+INTEGER = 2
+NUMBERS = 3
+NAMED = 4
+TEXT = 5
+BATCH = 6
+
+HEADER = struct.Struct("<Bd")
+COUNT = struct.Struct("<H")
+
+
+def encode(value, timestamp=None):
+    """Pack a value into a typed, timestamped record.
+
+    Ints and bools become INTEGER, other numbers NUMBER. Lists, tuples and
+    arrays of numbers become NUMBERS, dicts of numbers NAMED. Anything else
+    is sent as the TEXT of str(value).
+
+    :param value: Value to pack.
+    :param timestamp: When the value was sampled, now if not given.
+    :type timestamp: float
+    :returns: Packed record.
+    :rtype: string
+
+    """
+    if timestamp is None:
+        timestamp = time()
+
+    if isinstance(value, (bool, int, long, np.integer)):
+        return HEADER.pack(INTEGER, timestamp) + struct.pack("<q", value)
+    if isinstance(value, numbers.Real):
+        return HEADER.pack(NUMBER, timestamp) + struct.pack("<d", value)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            values = np.asarray(value, dtype="<f8").ravel()
+        except (TypeError, ValueError):
+            pass
+        else:
+            return HEADER.pack(NUMBERS, timestamp) + \
+                COUNT.pack(len(values)) + values.tostring()
+    if isinstance(value, dict):
+        try:
+            names = sorted(value)
+            values = np.array([value[name] for name in names], dtype="<f8")
+        except (TypeError, ValueError):
+            pass
+        else:
+            joined = "\0".join(str(name) for name in names)
+            return HEADER.pack(NAMED, timestamp) + COUNT.pack(len(names)) + \
+                COUNT.pack(len(joined)) + joined + values.tostring()
+
+    if not isinstance(value, unicode):
+        value = str(value).decode("utf-8", "replace")
+    return HEADER.pack(TEXT, timestamp) + value.encode("utf-8")
+
+
+def encode_batch(fields, samples, timestamp=None):
+    """Pack a batch of samples, one row per sample, into a BATCH record.
+
+    :param fields: Name of each column.
+    :type fields: list
+    :param samples: (rows, columns) array of samples.
+    :type samples: numpy.ndarray
+    :param timestamp: When the batch was sent, now if not given.
+    :type timestamp: float
+    :returns: Packed record.
+    :rtype: string
+
+    """
+    if timestamp is None:
+        timestamp = time()
+    samples = np.asarray(samples, dtype="<f8").reshape(-1, len(fields))
+    joined = "\0".join(fields)
+    return HEADER.pack(BATCH, timestamp) + \
+        struct.pack("<HHH", samples.shape[0], samples.shape[1],
+                    len(joined)) + joined + samples.tostring()
+
+
+def decode(payload):
+    """Unpack a record made by encode or encode_batch.
+
+    :param payload: Packed record.
+    :type payload: string
+    :returns: (timestamp, value). NUMBERS decode to a list of floats,
+        NAMED to a dict of floats and TEXT to unicode. BATCH decodes to
+        a dict with the column names as "fields" and the rows, as lists
+        of floats, as "samples".
+    :raises ValueError: If the payload isn't a valid record.
+
+    """
+    try:
+        kind, timestamp = HEADER.unpack_from(payload)
+        offset = HEADER.size
+        if kind == INTEGER:
+            return timestamp, struct.unpack_from("<q", payload, offset)[0]
+        if kind == NUMBER:
+            return timestamp, struct.unpack_from("<d", payload, offset)[0]
+        if kind == NUMBERS:
+            count, = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            return timestamp, list(struct.unpack_from(
+                "<{}d".format(count), payload, offset))
+        if kind == NAMED:
+            count, length = struct.unpack_from("<HH", payload, offset)
+            offset += 2 * COUNT.size
+            names = payload[offset:offset + length].split("\0")
+            values = struct.unpack_from("<{}d".format(count), payload,
+                                        offset + length)
+            if count == 0:
+                names = []
+            return timestamp, dict(zip(names, values))
+        if kind == BATCH:
+            rows, columns, length = struct.unpack_from("<HHH", payload,
+                                                       offset)
+            offset += 3 * COUNT.size
+            fields = payload[offset:offset + length].split("\0")
+            values = struct.unpack_from("<{}d".format(rows * columns),
+                                        payload, offset + length)
+            samples = [list(values[row * columns:(row + 1) * columns])
+                       for row in xrange(rows)]
+            return timestamp, {"fields": fields, "samples": samples}
+        if kind == TEXT:
+            return timestamp, payload[offset:].decode("utf-8")
+    except struct.error as e:
+        raise ValueError("Truncated telemetry record: {}".format(e))
+    raise ValueError("Unknown telemetry record type {}".format(kind))
@@ -0,0 +1,127 @@
+"""Fixed-rate scheduling for navigation control loops.
+
+PID gains are only meaningful if the loop runs at the rate they were tuned
+at. ControlLoop calls a step function on a fixed period measured with a
+monotonic clock, schedules each tick off the previous deadline so sleep and
+I2C jitter don't accumulate, and records how well it kept to the schedule.
+
+"""
+
+from time import sleep
+
+import bot.lib.lib as lib
+
+
+class ControlLoop(object):
+
+    """Runs a step function at a fixed rate and tracks timing quality."""
+
+    def __init__(self, rate=50):
+        """Set the loop rate.
+
+        :param rate: Ticks per second.
+        :type rate: float
+
+        """
+        if rate <= 0:
+            raise ValueError("Loop rate must be positive")
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.running = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zero the timing counters."""
+        self.ticks = 0
+        self.overruns = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+        self.total_step_time = 0.0
+        self.max_step_time = 0.0
+
+    def run(self, step, duration=None):
+        """Call step(timestep) once per period until it returns False.
+
+        timestep is the measured time since the previous tick started (one
+        period on the first tick), so controllers see the real interval.
+        If a step overruns the next deadline, the missed ticks are dropped
+        instead of being run back to back, and an overrun is counted.
+
+        :param step: Function of timestep, returns True to keep running.
+        :type step: callable
+        :param duration: Stop after this many seconds, None to run until
+            step returns False or stop() is called.
+        :type duration: float
+        :returns: Number of ticks run.
+
+        """
+        self.reset_stats()
+        self.running = True
+        start = lib.monotonic()
+        deadline = start
+        last_tick = None
+        if duration is not None:
+            end = start + duration
+
+        while self.running:
+            tick = lib.monotonic()
+            if duration is not None and tick >= end:
+                break
+
+            jitter = tick - deadline
+            self.total_jitter += jitter
+            if jitter > self.max_jitter:
+                self.max_jitter = jitter
+
+            if last_tick is None:
+                timestep = self.period
+            else:
+                timestep = tick - last_tick
+            keep_going = step(timestep)
+            last_tick = tick
+            self.ticks += 1
+
+            done = lib.monotonic()
+            step_time = done - tick
+            self.total_step_time += step_time
+            if step_time > self.max_step_time:
+                self.max_step_time = step_time
+            if not keep_going:
+                break
+
+            deadline += self.period
+            if done > deadline:
+                # Missed at least one tick, re-phase instead of catching up
+                self.overruns += 1
+                deadline = done
+            else:
+                sleep(deadline - done)
+
+        self.running = False
+        return self.ticks
+
+    def stop(self):
+        """Make a running loop exit after its current tick."""
+        self.running = False
+
+    def stats(self):
+        """Timing summary of the current or most recent run.
+
+        :returns: Dict with tick and overrun counts and jitter/step times
+            in milliseconds.
+
+        """
+        if self.ticks:
+            mean_jitter = self.total_jitter / self.ticks
+            mean_step_time = self.total_step_time / self.ticks
+        else:
+            mean_jitter = mean_step_time = 0.0
+        return {
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "mean_jitter_ms": mean_jitter * 1000,
+            "max_jitter_ms": self.max_jitter * 1000,
+            "mean_step_ms": mean_step_time * 1000,
+            "max_step_ms": self.max_step_time * 1000,
+        }
@@ -1,9 +1,12 @@
-from bot.hardware.IR import IR
-from side import Side
+from bot.hardware.IR import IR, IRSnapshot
+from bot.hardware.ir_filter import build_filter
+from side import Side, PID_FIELDS
+from control_loop import ControlLoop
 from bot.driver.omni_driver import OmniDriver
 import bot.lib.lib as lib
+from bot.lib.sample_stream import SampleStream
+from threading import RLock
 from time import sleep
-from time import time
 from pid import PID
 import os.path
 import yaml
@@ -13,41 +16,132 @@ bound = lambda x, l, u: l if x < l else u if x > u else x
 MAX_VALUE = 800
 
 class Navigation(object):
-    def __init__(self, rail_cars=0):
+    def __init__(self, rail_cars=0, driver=None, ir=None):
+        """Build the Sides and control loop over the drive and IR sensors.
+
+        :param rail_cars: Slider switch orientation, picks the rail side.
+        :type rail_cars: int
+        :param driver: OmniDriver to drive with, a new one if None.
+        :param ir: IR to read distances from, a new one if None.
+
+        """
         self.config = lib.get_config()
         self.PID_values = self.config["IR_PID"]
 
 
-        self.device = IR() # INSTANTIATE ONLY ONCE
-        self.north = Side("North Left", "North Right",  self.device.read_values, self.PID_values["North"]["diff"], self.PID_values["North"]["dist"])
-        self.south = Side("South Left", "South Right",  self.device.read_values, self.PID_values["South"]["diff"], self.PID_values["South"]["dist"])
-        self.east = Side("East Top", "East Bottom",  self.device.read_values, self.PID_values["East"]["diff"], self.PID_values["East"]["dist"])
-        self.west = Side("West Top", "West Bottom",  self.device.read_values, self.PID_values["West"]["diff"], self.PID_values["West"]["dist"])
-
-        self.driver = OmniDriver()
+        # Share these with other systems, each one probes hardware
+        self.device = ir if ir is not None else IR()
+        # Every Side reads from the same per-tick snapshot, see update_snapshot
+        self.snapshot = None
+        self.filtered_snapshot = None
+        filter_config = self.config.get("IR_Filter", {})
+        self.filter = build_filter(self.config["IR"].keys(), filter_config)
+        filtered_sides = filter_config.get("sides", [])
+        pid_params = self.config.get("IR_PID_bank", {})
+        self.north = Side("North Left", "North Right",  self.get_snapshot, self.PID_values["North"]["diff"], self.PID_values["North"]["dist"], self.get_filtered_snapshot, "north" in filtered_sides, pid_params)
+        self.south = Side("South Left", "South Right",  self.get_snapshot, self.PID_values["South"]["diff"], self.PID_values["South"]["dist"], self.get_filtered_snapshot, "south" in filtered_sides, pid_params)
+        self.east = Side("East Top", "East Bottom",  self.get_snapshot, self.PID_values["East"]["diff"], self.PID_values["East"]["dist"], self.get_filtered_snapshot, "east" in filtered_sides, pid_params)
+        self.west = Side("West Top", "West Bottom",  self.get_snapshot, self.PID_values["West"]["diff"], self.PID_values["West"]["dist"], self.get_filtered_snapshot, "west" in filtered_sides, pid_params)
+
+        self.driver = driver if driver is not None else OmniDriver()
         self.sides = {"north": self.north,
                       "south": self.south,
                       "west": self.west,
                       "east": self.east}
+        # Telemetry of every control tick, recorded while subscribed to
+        stream_config = self.config.get("telemetry_streams", {})
+        self.ir_stream = SampleStream("nav_ir", sorted(self.config["IR"]),
+                                      **stream_config)
+        self.streams = [self.ir_stream]
+        for name, side in sorted(self.sides.items()):
+            side.stream = SampleStream("nav_pid_" + name, PID_FIELDS,
+                                       **stream_config)
+            self.streams.append(side.stream)
         self.moving = False
+        # Held by each control tick and by stop(), so a stop from another
+        # thread can't land in the middle of a tick's motor writes
+        self.motion_lock = RLock()
+        # Every closed-loop routine runs through this, at one fixed rate
+        self.loop = ControlLoop(self.config.get("nav_loop", {}).get("rate", 50))
         self.logger = lib.get_logger()
         mapping = ["EXIT", "west", "east", "EXIT"]
         self.rail_cars_side = mapping[rail_cars]
 
+    def update_snapshot(self):
+        """Read the IR sensors once for the current control tick.
+
+        Control loops call this once at the top of each iteration. Every
+        Side then works off the returned snapshot until the next call, so
+        a tick costs a single IR read and all corrections use readings
+        taken at the same time.
+
+        :returns: IRSnapshot that is now current.
+
+        """
+        self.snapshot = self.device.read_snapshot()
+        if self.ir_stream.active:
+            self.ir_stream.record(
+                [self.snapshot[name] for name in self.ir_stream.fields[1:]],
+                self.snapshot.timestamp)
+        return self.snapshot
+
+    def get_snapshot(self):
+        """Get the current IR snapshot, reading one if none exists yet.
+
+        :returns: IRSnapshot for the current control tick.
+
+        """
+        if self.snapshot is None:
+            return self.update_snapshot()
+        return self.snapshot
+
+    def get_filtered_snapshot(self):
+        """Get the current IR snapshot passed through the IR filter.
+
+        The filter is fed at most once per snapshot, so several filtered
+        Sides in one tick don't skew its state.
+
+        :returns: IRSnapshot of filtered distances for the current tick.
+
+        """
+        snapshot = self.get_snapshot()
+        if self.filtered_snapshot is None or \
+                self.filtered_snapshot.timestamp != snapshot.timestamp:
+            self.filtered_snapshot = IRSnapshot(self.filter.update(snapshot),
+                                                snapshot.timestamp)
+        return self.filtered_snapshot
+
+    @lib.api_call
+    def set_side_filtering(self, side, enabled=True):
+        """Choose whether a Side works off filtered or raw IR values."""
+        self.sides[side.lower()].use_filtered = bool(enabled)
+
+    @lib.api_call
+    def set_IR_filter(self, filter_type, **params):
+        """Replace the IR filter, e.g. set_IR_filter("median", window=5)."""
+        params["type"] = filter_type
+        self.filter = build_filter(self.config["IR"].keys(), params)
+        self.filtered_snapshot = None
+
     def stop_unused_motors(self, direction):
         direction = direction.lower()
+        powers = {}
         if direction == "north" or direction == "south":
-            self.driver.set_motor("north", 0)
-            self.driver.set_motor("south", 0)
+            powers["north"] = 0
+            powers["south"] = 0
         elif direction == "east" or direction == "west":
-            self.driver.set_motor("east", 0)
-            self.driver.set_motor("west", 0)
+            powers["east"] = 0
+            powers["west"] = 0
+        self.driver.set_motors(powers)
 
     @lib.api_call
-    def move_correct(self, direction, side, target, speed, timestep, threshold=1000000):
+    def move_correct(self, direction, side, target, speed, timestep, threshold=1000000, refresh=True):
         # speed >= 0
+        # Loops that already took this tick's snapshot pass refresh=False
+        if refresh:
+            self.update_snapshot()
         side = side.lower()
-        diff_err = self.sides[side].get_diff_correction( timestep, threshold)
+        diff_err, dist_err = self.sides[side].get_corrections(target, timestep, threshold)
 
         # setting speed bounds
         sne = bound(speed-diff_err, -100, 100)
@@ -56,47 +150,49 @@ class Navigation(object):
         #spe = -100 if spe < -100 else 100 if spe > 100 else spe
         #self.logger.info("Error from PID : %d", diff_err)
 
-        dist_err = self.sides[side].get_dist_correction(target, timestep)
         #self.logger.info("dist Error from PID : %d", dist_err)
         dist_err = bound(dist_err, -100, 100)
+        # Whole command goes to the driver at once, see OmniDriver.set_motors
+        powers = {}
         if side == "north":
-            self.driver.set_motor("east", -dist_err)
-            self.driver.set_motor("west", -dist_err)
+            powers["east"] = -dist_err
+            powers["west"] = -dist_err
             if direction == "west":
-                self.driver.set_motor("north", -spe)
-                self.driver.set_motor("south", -sne)
+                powers["north"] = -spe
+                powers["south"] = -sne
             if direction == "east":
-                self.driver.set_motor("north", sne)
-                self.driver.set_motor("south", spe)
+                powers["north"] = sne
+                powers["south"] = spe
         elif side == "south":
-            self.driver.set_motor("east", dist_err)
-            self.driver.set_motor("west", dist_err)
+            powers["east"] = dist_err
+            powers["west"] = dist_err
             if direction == "west":
-                self.driver.set_motor("north", sne)
-                self.driver.set_motor("south", spe)
+                powers["north"] = sne
+                powers["south"] = spe
             if direction == "east":
-                self.driver.set_motor("north", sne)
-                self.driver.set_motor("south", -spe)
+                powers["north"] = sne
+                powers["south"] = -spe
         elif side == "east":
-            self.driver.set_motor("north", -dist_err)
-            self.driver.set_motor("south", -dist_err)
+            powers["north"] = -dist_err
+            powers["south"] = -dist_err
             if direction == "north":
-                self.driver.set_motor("west", sne)
-                self.driver.set_motor("east", spe)
+                powers["west"] = sne
+                powers["east"] = spe
             elif direction == "south":
-                self.driver.set_motor("west", -spe)
-                self.driver.set_motor("east", -sne)
+                powers["west"] = -spe
+                powers["east"] = -sne
         elif side == "west":
-            self.driver.set_motor("north", dist_err)
-            self.driver.set_motor("south", dist_err)
+            powers["north"] = dist_err
+            powers["south"] = dist_err
             if direction == "north":
-                self.driver.set_motor("west", spe)
-                self.driver.set_motor("east", sne)
+                powers["west"] = spe
+                powers["east"] = sne
             elif direction == "south":
-                self.driver.set_motor("west", -sne)
-                self.driver.set_motor("east", -spe)
+                powers["west"] = -sne
+                powers["east"] = -spe
         else:
             raise Exception()
+        self.driver.set_motors(powers)
 
     def move_dead(self, direction, speed):
         direction = direction.lower()
@@ -110,16 +206,17 @@ class Navigation(object):
 
     @lib.api_call
     def drive_along_wall(self, direction, side, duration):
-        time_elapsed = time()
-        final_time = time_elapsed + duration
-        while time_elapsed < final_time:
-            timestep = time()-time_elapsed
-            time_elapsed = time()
-            if direction == "west" or direction == "east": 
-                self.move_correct(direction, side, 300, 65, timestep)
-            else:
-                self.move_correct(direction, side, 300, 50, timestep)
-            sleep(0.01)
+        if direction == "west" or direction == "east": 
+            speed = 65
+        else:
+            speed = 50
+        self.moving = True
+
+        def step(timestep):
+            self.update_snapshot()
+            self.move_correct(direction, side, 300, speed, timestep, refresh=False)
+            return self.moving
+        self.run_loop(step, duration)
         self.stop()
 
 
@@ -134,13 +231,14 @@ class Navigation(object):
         mov_side = self.sides[direction]
         mov_target = dist
         self.moving = True
-        time_elapsed = time()
-        while self.moving:
-            timestep = time() - time_elapsed
-            time_elapsed = time()
-            self.move_correct(direction, side, mov_target, 60, timestep)
+
+        def step(timestep):
+            self.update_snapshot()
+            self.move_correct(direction, side, mov_target, 60, timestep, refresh=False)
             if mov_side.get_distance() <= target:
                 self.stop()
+            return self.moving
+        self.run_loop(step)
 
     #TODO: Update the controller in this function
     @lib.api_call
@@ -149,22 +247,22 @@ class Navigation(object):
         mov_side = self.sides[direction]
         mov_target = dist
         self.moving = True
-        time_elapsed = time()
-        speed = 0
         speed_pid = PID()
         speed_pid.set_k_values(4, 0.01, 0)
-        while self.moving:
-            timestep = time() - time_elapsed
-            time_elapsed = time()
+
+        def step(timestep):
+            self.update_snapshot()
             speed = speed_pid.pid(0, target - mov_side.get_distance(), timestep)
             if direction == "east" or direction == "west":
                 speed = bound(speed, -65, 65)
             else:
                 speed = bound(speed, -65, 65)
 
-            self.move_correct(direction, side, mov_target, speed, timestep)
+            self.move_correct(direction, side, mov_target, speed, timestep, refresh=False)
             if mov_side.get_distance(t_type) <= target:
                 self.stop()
+            return self.moving
+        self.run_loop(step)
 
     def move_to_position(self, x, y):
         self.move_until_wall(self, "west", "north", x)
@@ -174,16 +272,45 @@ class Navigation(object):
 
     @lib.api_call
     def stop(self):
-        self.driver.move(0)
-        self.moving = False
+        with self.motion_lock:
+            # Running ticks see this first, then the motors are zeroed
+            self.moving = False
+            self.loop.stop()
+            self.driver.move(0)
+
+    def run_loop(self, step, duration=None):
+        """Run a control loop from clean PID state, see ControlLoop.run.
+
+        Each tick runs holding motion_lock, and is skipped once moving is
+        cleared, so it can't write powers after a stop(). The motors are
+        stopped when the loop ends, however it ends.
+
+        """
+        def locked_step(timestep):
+            with self.motion_lock:
+                if not self.moving:
+                    return False
+                return step(timestep)
+
+        for side in self.sides.values():
+            side.reset()
+        try:
+            return self.loop.run(locked_step, duration)
+        finally:
+            # Whatever ended the loop, don't leave the motors driving
+            self.driver.move(0)
+            # Publish the loop's last samples now, not with the next loop's
+            for stream in self.streams:
+                stream.flush()
+
+    @lib.api_call
+    def get_loop_stats(self):
+        """Timing of the current or last control loop (jitter in ms)."""
+        return self.loop.stats()
 
     @lib.api_call
     def set_PID_values(self, side_to_set, pid, kp, kd, ki):
-        set_side = self.sides[side_to_set]
-        if (pid == "diff"):
-            set_side.diff_pid.set_k_values(kp, kd, ki)
-        elif(pid == "dist"):
-            set_side.dist_pid.set_k_values(kp, kd, ki)
+        self.sides[side_to_set].set_k_values(pid, kp, kd, ki)
         # write updated PID values to the IR_config file
         # with open("IR_config.yaml") as f:
         #    a = yaml.load(f)
@@ -198,18 +325,26 @@ class Navigation(object):
         
 
 
+    @lib.api_call
+    def start_IR_sampling(self, rate=100):
+        self.device.start_sampling(rate)
+
+    @lib.api_call
+    def stop_IR_sampling(self):
+        self.device.stop_sampling()
+
+    @lib.api_call
+    def get_IR_link_stats(self):
+        return self.device.get_link_stats()
+
     @lib.api_call
     def move_until_color(self, direction, side, color):
         direction = direction.lower()
-        mov_side = self.sides[direction]
-        self.logger.info
         self.moving = True
-        time_elapsed = time()
-        while self.moving:
-            timestep = time() - time_elapsed
-            time_elapsed = time()
-            self.move_correct(direction, side, 180, 55, timestep)
-            ir_values = mov_side.get_values()
+
+        def step(timestep):
+            ir_values = self.update_snapshot()
+            self.move_correct(direction, side, 180, 55, timestep, refresh=False)
             # IR sensor for line detection is attached to South Left
             ir_value = ir_values["South Left"]
             if color == "white":
@@ -218,6 +353,8 @@ class Navigation(object):
             else:
                 if ir_value <= 1000:
                     self.stop()
+            return self.moving
+        self.run_loop(step)
 
     @lib.api_call
     def rotate_start(self):
@@ -249,6 +386,7 @@ class Navigation(object):
 
     @lib.api_call
     def goto_top(self):
+        self.update_snapshot()
         if self.east.get_distance() < MAX_VALUE:
             self.move_smooth_until_wall("north", "east", 300)
         elif self.west.get_distance() < MAX_VALUE:
@@ -293,6 +431,7 @@ class Navigation(object):
     @lib.api_call
     def goto_block_zone_B(self):
         self.goto_top()
+        self.update_snapshot()
         self.logger.info("sensor value: %d",self.east.get_distance())
         self.logger.info("sensor value: %d", self.west.get_distance())
         if self.east.get_distance() < MAX_VALUE:
@@ -367,27 +506,19 @@ class Navigation(object):
         last_value = self.get_sensor_value(sensor)
         self.logger.info("sensor value: %d", last_value)
         last_set = [last_value for i in xrange(10)]
-        time_elapsed = time()
         self.move_dead("south", speed)
-        while self.moving:
-            timestep = time() - time_elapsed
-            time_elapsed = time()
-            curr_value = self.get_sensor_value(sensor)
+
+        def step(timestep):
+            curr_value = self.update_snapshot()[sensor]
             self.logger.info("sensor Type: %s, sensor value: %d, avg: %d", sensor, curr_value, avg(last_set))
             diff = curr_value - avg(last_set)
-            self.move_correct("south", self.rail_cars_side, 150, speed, timestep, threshold=100)
+            self.move_correct("south", self.rail_cars_side, 150, speed, timestep, threshold=100, refresh=False)
             if diff > 50:
-                break
-                if sensor == "West Bottom":
-                    sensor = "West Top"
-                    speed = 35
-                    last_set = [curr_value for i in xrange(10)]
-                else:
-                    self.moving = False
-                    break
+                return False
             last_set.pop(0)
             last_set.append(curr_value)
-            sleep(0.01)
+            return self.moving
+        self.run_loop(step)
         self.stop()
         
     @lib.api_call
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class PID(object):
 
     def __init__(self):
@@ -15,7 +18,7 @@ class PID(object):
 
     def clear_error(self):
         self.previous_error = 0
-        self.integeral_error = 0
+        self.integral_error = 0
 
     def pid(self, target, process_var, timestep):
         current_error = (target - process_var)
@@ -29,3 +32,120 @@ class PID(object):
         total_error = p_error + d_error + i_error
         self.previous_error = current_error
         return total_error
+
+
+class PIDBank(object):
+
+    """Several PID controllers stepped together with NumPy.
+
+    Gains and state live in preallocated arrays, one element per channel,
+    so stepping every channel is a handful of in-place array operations
+    instead of one Python call per controller. Each channel behaves like
+    PID (trapezoidal integral, derivative of the error over timestep), with
+    optional integral clamping against windup, a low-pass filter on the
+    derivative term and clamping of the output.
+
+    """
+
+    def __init__(self, channels, integral_limit=None, derivative_alpha=1.0,
+                 output_limit=None):
+        """Allocate gains and state for the given number of channels.
+
+        :param channels: Number of controllers in the bank.
+        :type channels: int
+        :param integral_limit: Clamp the accumulated error to +/- this,
+            None to let it grow without bound.
+        :type integral_limit: float
+        :param derivative_alpha: Weight of the newest derivative sample,
+            1.0 disables derivative filtering.
+        :type derivative_alpha: float
+        :param output_limit: Clamp outputs to +/- this, None to disable.
+        :type output_limit: float
+
+        """
+        self.channels = channels
+        self.integral_limit = integral_limit
+        self.derivative_alpha = derivative_alpha
+        self.output_limit = output_limit
+        self.kp = np.ones(channels)
+        self.kd = np.zeros(channels)
+        self.ki = np.zeros(channels)
+        self.error = np.zeros(channels)
+        self.previous_error = np.zeros(channels)
+        self.integral_error = np.zeros(channels)
+        self.derivative = np.zeros(channels)
+        self.output = np.zeros(channels)
+        self.scratch = np.zeros(channels)
+
+    def select(self, channels):
+        """Turn a channel selection into a slice, so state stays a view."""
+        if channels is None:
+            return slice(None)
+        if isinstance(channels, slice):
+            return channels
+        return slice(channels, channels + 1)
+
+    def set_k_values(self, channel, kp, kd, ki):
+        self.kp[channel] = kp
+        self.kd[channel] = kd
+        self.ki[channel] = ki
+
+    def reset(self, channels=None):
+        """Clear accumulated state, so the next step starts fresh.
+
+        :param channels: Channel index or slice, None for all.
+
+        """
+        selected = self.select(channels)
+        self.previous_error[selected] = 0
+        self.integral_error[selected] = 0
+        self.derivative[selected] = 0
+        self.output[selected] = 0
+
+    def step(self, targets, values, timestep, channels=None):
+        """Step the selected controllers by one tick.
+
+        :param targets: Set points, one per selected channel (or a scalar).
+        :param values: Process variables, one per selected channel.
+        :param timestep: Seconds since the previous step.
+        :type timestep: float
+        :param channels: Channel index or slice, None for all.
+        :returns: numpy.ndarray view of the selected outputs. It is
+            overwritten by the next step, copy it to keep it.
+
+        """
+        selected = self.select(channels)
+        error = self.error[selected]
+        previous = self.previous_error[selected]
+        integral = self.integral_error[selected]
+        derivative = self.derivative[selected]
+        output = self.output[selected]
+        scratch = self.scratch[selected]
+
+        np.subtract(targets, values, out=error)
+
+        # derivative += alpha * (raw derivative - derivative)
+        np.subtract(error, previous, out=scratch)
+        scratch /= timestep
+        scratch -= derivative
+        scratch *= self.derivative_alpha
+        derivative += scratch
+
+        np.add(error, previous, out=scratch)
+        scratch /= 2
+        integral += scratch
+        if self.integral_limit is not None:
+            np.clip(integral, -self.integral_limit, self.integral_limit,
+                    out=integral)
+
+        np.multiply(self.kp[selected], error, out=output)
+        np.multiply(self.kd[selected], derivative, out=scratch)
+        output += scratch
+        np.multiply(self.ki[selected], integral, out=scratch)
+        output += scratch
+        if self.output_limit is not None:
+            np.clip(output, -self.output_limit, self.output_limit,
+                    out=output)
+
+        previous[:] = error
+        return output
@@ -1,23 +1,59 @@
-from pid import PID
+import numpy as np
+
+from pid import PIDBank
 import bot.lib.lib as lib
 
+# Channels of a Side's PID bank
+DIFF = 0
+DIST = 1
+
+# Columns a Side records into its stream on every get_corrections
+PID_FIELDS = ["{}_{}".format(channel, term)
+              for channel in ("diff", "dist")
+              for term in ("target", "input", "error", "integral",
+                           "derivative", "output")]
+
 
 class Side(object):
     """
     Side of the robot with 2 IR sensors
     """
 
-    def __init__(self, sensor1, sensor2, ir_device_func, diff_k_values=(0,0,0), dist_k_values=(0,0,0)):
+    def __init__(self, sensor1, sensor2, ir_device_func, diff_k_values=(0,0,0), dist_k_values=(0,0,0), filtered_func=None, use_filtered=False, pid_params=None):
         self.sensor1 = sensor1
         self.sensor2 = sensor2
-        self.get_values = ir_device_func
-        self.diff_pid = PID()
-        p1,d1,i1 = diff_k_values
-        # self.diff_pid.set_k_values(1.1, 0.04, 0.0)
-        self.diff_pid.set_k_values(p1, d1, i1)
-        self.dist_pid = PID()
-        p2,d2,i2 = dist_k_values
-        self.dist_pid.set_k_values(p2, d2, i2)
+        self.raw_values = ir_device_func
+        self.filtered_values = filtered_func
+        self.use_filtered = use_filtered
+        # Sensor difference and distance controllers, stepped together
+        self.pid = PIDBank(2, **(pid_params or {}))
+        self.pid.set_k_values(DIFF, *diff_k_values)
+        self.pid.set_k_values(DIST, *dist_k_values)
+        self.targets = np.zeros(2)
+        self.inputs = np.zeros(2)
+        # SampleStream of PID terms (PID_FIELDS), set by Navigation
+        self.stream = None
+
+    def set_k_values(self, pid, kp, kd, ki):
+        """
+        Set gains of the "diff" or "dist" controller
+        """
+        channels = {"diff": DIFF, "dist": DIST}
+        self.pid.set_k_values(channels[pid], kp, kd, ki)
+
+    def reset(self):
+        """
+        Clear PID state, call before starting a new control loop
+        """
+        self.pid.reset()
+
+    def get_values(self):
+        """
+        Get the IR values this side works off, filtered if requested
+        """
+        if self.use_filtered and self.filtered_values is not None:
+            return self.filtered_values()
+        return self.raw_values()
 
     def get_diff(self):
         """
@@ -35,7 +71,42 @@ class Side(object):
         get the motor correction values
         """
         diff = self.get_diff()
-        error = self.diff_pid.pid(0, diff, timestep)
+        error = self.pid.step(0, diff, timestep, DIFF)[0]
+        return self.apply_threshold(error, threshold)
+
+    def get_dist_correction(self, target, timestep):
+        dist = self.get_distance()
+        error = self.pid.step(target, dist, timestep, DIST)[0]
+
+        return error
+
+    def get_corrections(self, target, timestep, threshold=1000000):
+        """
+        Step both controllers off one reading
+        Returns (diff correction, dist correction)
+        """
+        vals = self.get_values()
+        sens1 = vals[self.sensor1]
+        sens2 = vals[self.sensor2]
+        self.targets[DIST] = target
+        self.inputs[DIFF] = sens1 - sens2
+        self.inputs[DIST] = (sens1 + sens2) / 2
+        diff_err, dist_err = self.pid.step(self.targets, self.inputs, timestep)
+        if self.stream is not None and self.stream.active:
+            self.record_terms()
+        return self.apply_threshold(diff_err, threshold), dist_err
+
+    def record_terms(self):
+        """
+        Record the last step's PID terms, in PID_FIELDS order
+        """
+        pid = self.pid
+        terms = (self.targets, self.inputs, pid.error, pid.integral_error,
+                 pid.derivative, pid.output)
+        self.stream.record([term[channel] for channel in (DIFF, DIST)
+                            for term in terms])
+
+    def apply_threshold(self, error, threshold):
         #print threshold, error
         if abs(error) < threshold:
             return error
@@ -43,12 +114,6 @@ class Side(object):
             print "OUT OF THRESHOLD"
             return 0
 
-    def get_dist_correction(self, target, timestep):
-        dist = self.get_distance()
-        error = self.dist_pid.pid(target, dist, timestep)
-
-        return error
-
     def get_distance(self, style="avg"):
         vals = self.get_values()
         sens1 = vals[self.sensor1]
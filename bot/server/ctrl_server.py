@@ -3,9 +3,11 @@
 
 import sys
 import os
-from inspect import getmembers, ismethod
+from Queue import Queue
+from threading import Thread, RLock
 from simplejson.decoder import JSONDecodeError
 import zmq
+from zmq.utils import jsonapi
 import signal
 
 # This is required to make imports work
@@ -14,7 +16,9 @@ sys.path = [os.getcwd()] + sys.path
 import bot.lib.lib as lib
 import pub_server as pub_server_mod
 import bot.lib.messages as msgs
+from bot.server.registry import SubsystemRegistry
 
+from bot.hardware.IR import IR
 from bot.hardware.switch import Switch
 from bot.driver.omni_driver import OmniDriver
 from bot.navigation.nav import Navigation
@@ -22,21 +26,99 @@ from bot.navigation.nav import Navigation
 from bot.hardware.complex_hardware.robot_arm import RobotArm
 from bot.hardware.servo_cape import ServoCape
 
-def is_api_method(obj, name):
-    """Tests whether named method exists in obj and is flagged for API export.
+# Where SystemWorkers hand replies back to the ROUTER loop
+reply_addr = "inproc://ctrl_replies"
 
-    :param obj: API-exported object to search for the given method on.
-    :type ojb: string
-    :param name: Name of method to check for.
-    :type name: string
-    :returns: True if given method is on given obj and is exported, else False.
+
+def check_params(argspec, params):
+    """Check call params against a method's signature without calling it.
+
+    :param argspec: Result of inspect.getargspec for the bound method.
+    :type argspec: inspect.ArgSpec
+    :param params: Keyword params the method would be called with.
+    :type params: dict
+    :returns: None if the params fit, else a string describing the problem.
 
     """
-    try:
-        method = getattr(obj, name)
-    except AttributeError:
-        return False
-    return (ismethod(method) and hasattr(method, "__api_call"))
+    args = argspec.args[1:]  # Drop self
+    required = args[:len(args) - len(argspec.defaults or ())]
+    missing = [arg for arg in required if arg not in params]
+    if missing:
+        return "missing {}".format(", ".join(missing))
+    if argspec.keywords is None:
+        unknown = [key for key in params if key not in args]
+        if unknown:
+            return "unexpected {}".format(", ".join(sorted(unknown)))
+    return None
+
+
+class SystemWorker(Thread):
+
+    """Runs API calls for one system, one at a time, off a queue.
+
+    Used by CtrlServer in router mode, so a long call on one system only
+    queues further calls to that system. Replies are pushed back to the
+    ROUTER loop over an inproc socket, since ZMQ sockets can't be shared
+    between threads.
+
+    """
+
+    def __init__(self, name, call_func, context):
+        """Build queue and lock, socket is made in the worker's thread.
+
+        :param name: Name of the system this worker runs calls for.
+        :type name: string
+        :param call_func: Function of (name, method, params) that returns
+            the reply message for a call.
+        :type call_func: callable
+        :param context: ZMQ context shared with the ROUTER loop.
+        :type context: zmq.Context
+
+        """
+        super(SystemWorker, self).__init__(name="ctrl_" + name)
+        self.system = name
+        self.call_func = call_func
+        self.context = context
+        self.logger = lib.get_logger()
+        self.queue = Queue()
+        # Held for the duration of every call on this system
+        self.lock = RLock()
+        self.stopped = False
+        self.setDaemon(True)
+
+    def submit(self, envelope, msg):
+        """Queue a call_req, its reply is sent with the given envelope."""
+        self.queue.put((envelope, msg))
+
+    def stop(self):
+        """Let the worker exit after its current call, dropping queued ones.
+
+        Calls still queued when the server shuts down get no reply, rather
+        than driving the bot after a stop.
+
+        """
+        self.stopped = True
+        self.queue.put(None)
+
+    def run(self):
+        reply_sock = self.context.socket(zmq.PUSH)
+        reply_sock.connect(reply_addr)
+        while True:
+            job = self.queue.get()
+            if job is None or self.stopped:
+                break
+            envelope, msg = job
+            try:
+                with self.lock:
+                    reply = self.call_func(self.system, msg["method"],
+                                           msg["params"])
+            except Exception as e:
+                # A dead worker would leave every later call unanswered
+                err_msg = "Exception: '{}'".format(str(e))
+                self.logger.warning(err_msg)
+                reply = msgs.error(err_msg)
+            reply_sock.send_multipart(envelope + [jsonapi.dumps(reply)])
+        reply_sock.close()
 
 
 class CtrlServer(object):
@@ -56,13 +138,24 @@ class CtrlServer(object):
     and exit messages.
 
     CtrlServer is the primary owner of bot resources, which we call
-    systems. For example, it's CtrlServer that instantiates gunner
-    and follower. Through those two, CtrlServer owns the gun, the
-    IR hub, the turret and basically every other bot system.
+    systems. They're built through a SubsystemRegistry, which shares
+    hardware like the drive motors and IR sensors between the systems
+    that use them, builds independent systems concurrently and leaves
+    systems named in config lazy_systems until their first call.
 
     The messages that CtrlServer accepts and responds with are fully
     specified in lib.messages. Make any changes to messages there.
 
+    In router mode (config ctrl_server_mode), calls to each system run on
+    that system's own SystemWorker thread, so a slow call on one system
+    doesn't hold up the others. Ping, list and exit messages and calls on
+    ctrl itself (like stop_full) are still answered by the listening
+    thread, so they're never stuck behind a busy system. Batches run on a
+    thread of their own, taking each system's worker lock for its calls.
+
+    Routing frames in front of a request, like the request ids
+    AsyncCtrlClient sends, are sent back in front of its reply.
+
     CtrlServer can be instructed (via the API) to spawn a new thread
     for a PubServer. When that happens, CtrlServer passes its systems
     to PubServer, which can read their state and publish it over a
@@ -70,6 +163,9 @@ class CtrlServer(object):
 
     """
 
+    # Seconds clean_up waits for each worker and batch to finish
+    join_timeout = 5
+
     def __init__(self, testing=None, config_file="bot/config.yaml"):
         """Build ZMQ REP socket and instantiate bot systems.
 
@@ -100,8 +196,12 @@ class CtrlServer(object):
             lib.set_testing(False)
 
         # Build socket to listen for requests
+        self.mode = self.config.get("ctrl_server_mode", "rep")
         self.context = zmq.Context()
-        self.ctrl_sock = self.context.socket(zmq.REP)
+        if self.mode == "router":
+            self.ctrl_sock = self.context.socket(zmq.ROUTER)
+        else:
+            self.ctrl_sock = self.context.socket(zmq.REP)
         self.server_bind_addr = "{protocol}://{host}:{port}".format(
             protocol=self.config["server_protocol"],
             host=self.config["server_bind_host"],
@@ -114,6 +214,15 @@ class CtrlServer(object):
             sys.exit(1)
 
         self.systems = self.assign_subsystems()
+        self.build_dispatch_table()
+        self.workers = {}
+        # Batch threads in router mode, see route_msg
+        self.batches = []
+        # Where workers push replies in router mode, see listen_router
+        self.reply_sock = None
+        # Held by calls on ctrl itself, which in router mode come from
+        # both the listening thread and batch threads
+        self.ctrl_lock = RLock()
         self.logger.info("Control server initialized")
 
         # Don't spawn pub_server until told to
@@ -126,37 +235,63 @@ class CtrlServer(object):
         sys.exit(0)
 
     def assign_subsystems(self):
-        """Instantiates and stores references to bot subsystems.
+        """Register bot subsystems and build the ones needed at startup.
 
-        :returns: Dict of subsystems, maps system name to instantiated object.
+        :returns: SubsystemRegistry, maps system name to system.
 
         """
+        lazy = self.config.get("lazy_systems", [])
+        arm_config = self.config["dagu_arm"]
+
+        def build_nav(switch, driver, ir):
+            orientation = switch.detect_switch_orientation()
+            return Navigation(orientation, driver=driver, ir=ir)
+
+        systems = SubsystemRegistry()
+        systems.add("ctrl", self)
+        systems.register("switch", Switch, lazy="switch" in lazy)
+        systems.register("driver", OmniDriver, lazy="driver" in lazy)
+        # Shared by nav and arm, not called directly
+        systems.register("ir", IR, lazy="ir" in lazy, export=False)
+        systems.register("nav", build_nav, cls=Navigation,
+                         deps=("switch", "driver", "ir"),
+                         lazy="nav" in lazy)
+        systems.register("arm", lambda ir: RobotArm(arm_config, ir=ir),
+                         cls=RobotArm, deps=("ir",), lazy="arm" in lazy)
+        systems.start()
+
+        self.logger.debug("Systems: {}".format(systems.exported()))
+        return systems
 
-        self.switch = Switch()
-        self.driver = OmniDriver()
-        orientation = self.switch.detect_switch_orientation()
-        self.nav = Navigation(orientation)
-        self.arm = RobotArm(self.config["dagu_arm"])
-
-        systems = {}
-        systems["ctrl"] = self
-        systems["driver"] = self.driver
-        systems["switch"] = self.switch
-        systems["nav"] = self.nav
-        systems["arm"] = self.arm
+    def build_dispatch_table(self):
+        """Find every exported method once, so calls don't introspect.
 
+        Methods are read off each system's class, so lazy systems are
+        listed before they're built. Fills self.dispatch, mapping (system
+        name, method name) to the method's argspec, and self.list_reply,
+        the reply to list_req.
 
-        self.logger.debug("Systems: {}".format(systems))
-        return systems
+        """
+        self.dispatch = {}
+        callables = {}
+        for name in self.systems.exported():
+            methods = self.systems.api_methods(name)
+            for member_name, argspec in methods.items():
+                self.dispatch[(name, member_name)] = argspec
+            callables[name] = sorted(methods)
+        self.list_reply = msgs.list_reply(callables)
 
     def listen(self):
         """Perpetually listen for messages, pass them to generic handler."""
         self.logger.info("Control server: {}".format(self.server_bind_addr))
+        if self.mode == "router":
+            self.listen_router()
+            return
         while True:
             try:
                 msg = self.ctrl_sock.recv_json()
                 reply = self.handle_msg(msg)
-                self.logger.debug("Sending: {}".format(reply))
+                self.logger.debug("Sending: %s", reply)
                 self.ctrl_sock.send_json(reply)
             except JSONDecodeError:
                 err_msg = "Not a JSON message!"
@@ -172,6 +307,103 @@ class CtrlServer(object):
             #    self.logger.info("massive server error")
             #    self.logger.info(e)
 
+    def start_workers(self):
+        """Start a SystemWorker for every system but ctrl itself."""
+        for name in self.systems.exported():
+            if name == "ctrl":
+                continue
+            worker = SystemWorker(name, self.call_method, self.context)
+            worker.start()
+            self.workers[name] = worker
+
+    def listen_router(self):
+        """Listen on a ROUTER socket, running system calls on workers.
+
+        Replies from workers are forwarded to clients as they finish, so
+        they may go out in a different order than requests came in.
+
+        """
+        # inproc needs the bind to happen before workers connect
+        self.reply_sock = self.context.socket(zmq.PULL)
+        self.reply_sock.bind(reply_addr)
+        self.start_workers()
+
+        poller = zmq.Poller()
+        poller.register(self.ctrl_sock, zmq.POLLIN)
+        poller.register(self.reply_sock, zmq.POLLIN)
+        while True:
+            try:
+                events = dict(poller.poll())
+                if self.reply_sock in events:
+                    self.ctrl_sock.send_multipart(
+                        self.reply_sock.recv_multipart())
+                if self.ctrl_sock in events:
+                    self.route_msg(self.ctrl_sock.recv_multipart())
+            except KeyboardInterrupt:
+                self.logger.info("Exiting control server. Bye!")
+                self.clean_up()
+                sys.exit(0)
+
+    def route_msg(self, frames):
+        """Hand a message from the ROUTER socket to a worker or answer it.
+
+        :param frames: Multipart message, routing envelope then JSON body.
+        :type frames: list
+
+        """
+        envelope, body = frames[:-1], frames[-1]
+        try:
+            msg = jsonapi.loads(body)
+        except ValueError:
+            err_msg = "Not a JSON message!"
+            self.logger.warning(err_msg)
+            self.send_routed(envelope, msgs.error(err_msg))
+            return
+
+        if msg.get("type") == "call_req" and \
+                msg.get("obj_name") in self.workers:
+            if "method" in msg and "params" in msg:
+                self.workers[msg["obj_name"]].submit(envelope, msg)
+                return
+
+        if msg.get("type") == "batch_req":
+            # Batches may span systems, so they can't go to one worker
+            batch = Thread(target=self.run_routed_batch,
+                           args=(envelope, msg), name="ctrl_batch")
+            batch.setDaemon(True)
+            batch.start()
+            # Kept so clean_up can wait for them, finished ones dropped
+            self.batches = [thread for thread in self.batches
+                            if thread.is_alive()] + [batch]
+            return
+
+        if msg.get("type") == "exit_req":
+            self.logger.info("Received message to die. Bye!")
+            self.send_routed(envelope, msgs.exit_reply())
+            self.clean_up()
+            sys.exit(0)
+        self.send_routed(envelope, self.handle_msg(msg))
+
+    def run_routed_batch(self, envelope, msg):
+        """Run a batch off the listening thread, push back its reply.
+
+        :param envelope: Routing frames to send the reply with.
+        :type envelope: list
+        :param msg: The batch_req message.
+        :type msg: dict
+
+        """
+        reply = self.run_batch(msg)
+        reply_sock = self.context.socket(zmq.PUSH)
+        reply_sock.connect(reply_addr)
+        reply_sock.send_multipart(envelope + [jsonapi.dumps(reply)])
+        reply_sock.close()
+
+    def send_routed(self, envelope, reply):
+        """Send a reply from the listening thread in router mode."""
+        self.logger.debug("Sending: %s", reply)
+        self.ctrl_sock.send_multipart(envelope + [jsonapi.dumps(reply)])
+
     def handle_msg(self, msg):
         """Generic message handler. Hands-off based on type of message.
 
@@ -180,7 +412,7 @@ class CtrlServer(object):
         :returns: An appropriate message reply dict, from lib.messages.
 
         """
-        self.logger.debug("Received: {}".format(msg))
+        self.logger.debug("Received: %s", msg)
 
         try:
             msg_type = msg["type"]
@@ -196,14 +428,16 @@ class CtrlServer(object):
                 obj_name = msg["obj_name"]
                 method = msg["method"]
                 params = msg["params"]
-                reply = self.call_method(obj_name, method, params)
+                reply = self.call_locked(obj_name, method, params)
             except KeyError as e:
                 return msgs.error(e)
+        elif msg_type == "batch_req":
+            reply = self.run_batch(msg)
         elif msg_type == "exit_req":
             self.logger.info("Received message to die. Bye!")
             reply = msgs.exit_reply()
             # Need to actually send reply here as we're about to exit
-            self.logger.debug("Sending: {}".format(reply))
+            self.logger.debug("Sending: %s", reply)
             self.ctrl_sock.send_json(reply)
             self.clean_up()
             sys.exit(0)
@@ -214,26 +448,62 @@ class CtrlServer(object):
         return reply
 
     def list_callables(self):
-        """Build list of callable methods on each exported subsystem object.
+        """List the callable methods on each exported subsystem object.
 
-        Uses introspection to create a list of callable methods for each
-        registered subsystem object. Only methods which are flagged using the
-        @lib.api_call decorator will be included.
+        Only methods which are flagged using the @lib.api_call decorator are
+        included. The reply is built once, by build_dispatch_table.
 
         :returns: list_reply message with callable objects and their methods.
 
         """
         self.logger.debug("List of callable API objects requested")
-        # Dict of subsystem object names to their callable methods.
-        callables = {}
-        for name, obj in self.systems.items():
-            methods = []
-            # Filter out methods which are not explicitly flagged for export
-            for member in getmembers(obj):
-                if is_api_method(obj, member[0]):
-                    methods.append(member[0])
-            callables[name] = methods
-        return msgs.list_reply(callables)
+        return self.list_reply
+
+    def run_batch(self, msg):
+        """Run the calls of a batch_req in order.
+
+        Each call holds its system's lock while it runs (see call_locked),
+        so batched calls never overlap other calls to that system.
+
+        :param msg: The batch_req message.
+        :type msg: dict
+        :returns: batch_reply message, or error if the batch is malformed.
+
+        """
+        calls = msg.get("calls")
+        if not isinstance(calls, list):
+            return msgs.error("Batch has no list of calls")
+        stop_on_error = msg.get("stop_on_error", False)
+
+        replies = []
+        for call in calls:
+            try:
+                name = call["obj_name"]
+                reply = self.call_locked(name, call["method"],
+                                         call["params"])
+            except (KeyError, TypeError) as e:
+                reply = msgs.error("Bad call in batch: {}".format(e))
+            replies.append(reply)
+            if stop_on_error and reply["type"] == "error":
+                break
+        return msgs.batch_reply(replies)
+
+    def call_locked(self, name, method, params):
+        """Call a method holding its system's lock, see call_method.
+
+        Calls on a system with a worker hold the worker's lock, calls on
+        ctrl hold ctrl_lock. Other calls only happen in rep mode, where
+        calls already run one at a time.
+
+        """
+        if name == "ctrl":
+            lock = self.ctrl_lock
+        elif name in self.workers:
+            lock = self.workers[name].lock
+        else:
+            return self.call_method(name, method, params)
+        with lock:
+            return self.call_method(name, method, params)
 
     def call_method(self, name, method, params):
         """Call a previously registered subsystem method by name. Only
@@ -248,36 +518,46 @@ class CtrlServer(object):
         :returns: call_reply or error message dict to be sent to caller.
 
         """
-        self.logger.debug("API call: {}.{}({})".format(name, method, params))
-        if name in self.systems:
-            obj = self.systems[name]
-            if is_api_method(obj, method):
-                try:
-                    # Calls given obj.method, unpacking and passing params dict
-                    call_return = getattr(obj, method)(**params)
-                    msg = "Called {}.{}".format(name, method)
-                    self.logger.debug(msg + ",returned:{}".format(call_return))
-                    return msgs.call_reply(msg, call_return)
-                except TypeError:
-                    # Raised when we have a mismatch of the method's kwargs
-                    # TODO: Return argspec here?
-                    err_msg = "Invalid params for {}.{}".format(name, method)
-                    self.logger.warning(err_msg)
-                    return msgs.error(err_msg)
-                except Exception as e:
-                    # Catch exception raised by called method, notify client
-                    err_msg = "Exception: '{}'".format(str(e))
-                    self.logger.warning(err_msg)
-                    return msgs.error(err_msg)
-            else:
+        self.logger.debug("API call: %s.%s(%s)", name, method, params)
+        try:
+            argspec = self.dispatch[(name, method)]
+        except KeyError:
+            if name in self.systems.exported():
                 err_msg = "Invalid method: '{}.{}'".format(name, method)
-                self.logger.warning(err_msg)
-                return msgs.error(err_msg)
-        else:
-            err_msg = "Invalid object: '{}'".format(name)
+            else:
+                err_msg = "Invalid object: '{}'".format(name)
+            self.logger.warning(err_msg)
+            return msgs.error(err_msg)
+
+        if not isinstance(params, dict):
+            err_msg = "Invalid params for {}.{}: not a dict".format(
+                name, method)
+            self.logger.warning(err_msg)
+            return msgs.error(err_msg)
+
+        problem = check_params(argspec, params)
+        if problem is not None:
+            # TODO: Return argspec here?
+            err_msg = "Invalid params for {}.{}: {}".format(
+                name, method, problem)
             self.logger.warning(err_msg)
             return msgs.error(err_msg)
 
+        try:
+            # Lazy systems are built here, on their first call
+            func = getattr(self.systems[name], method)
+            # Calls given obj.method, unpacking and passing params dict
+            call_return = func(**params)
+        except Exception as e:
+            # Catch exception raised by called method, notify client
+            err_msg = "Exception: '{}'".format(str(e))
+            self.logger.warning(err_msg)
+            return msgs.error(err_msg)
+        self.logger.debug("Called %s.%s, returned: %s",
+                          name, method, call_return)
+        return msgs.call_reply("Called {}.{}".format(name, method),
+                               call_return)
+
     @lib.api_call
     def echo(self, msg=None):
         """Echo a message back to the caller.
@@ -311,12 +591,34 @@ class CtrlServer(object):
 
     @lib.api_call
     def stop_full(self):
-        """Stop all drive and gun motors, set turret to safe state."""
-        self.systems["driver"].move(0, 0)
+        """Stop all drive and gun motors, set turret to safe state.
+
+        Also ends any running navigation loop, which in router mode may be
+        running on the nav worker while this is called.
+
+        """
+        # Nothing to stop on systems that were never built
+        if self.systems.is_built("nav"):
+            self.systems["nav"].stop()
+        if self.systems.is_built("driver"):
+            self.systems["driver"].move(0, 0)
 
     def clean_up(self):
-        """Tear down ZMQ socket."""
+        """Stop the bot, then workers and batches, then tear down ZMQ."""
         self.stop_full()
+        for worker in self.workers.values():
+            worker.stop()
+        threads = self.workers.values() + self.batches
+        for thread in threads:
+            thread.join(self.join_timeout)
+        if any(thread.is_alive() for thread in threads):
+            # A call that won't finish still holds its socket, and term()
+            # would wait on it forever
+            self.logger.warning("Calls still running, closing sockets")
+            self.context.destroy(linger=0)
+            return
+        if self.reply_sock is not None:
+            self.reply_sock.close()
         self.ctrl_sock.close()
         self.context.term()
 
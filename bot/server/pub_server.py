@@ -1,11 +1,9 @@
-"""Server for publishing data about the bot.
-
-UPDATE (Vijay - 9/27/15): PubServer is outdated.
-"""
+"""Server for publishing data about the bot."""
 
+import heapq
+import numbers
 import sys
 import threading
-from time import sleep
 
 try:
     import zmq
@@ -14,33 +12,236 @@ except ImportError:
     raise
 
 import bot.lib.lib as lib
+import bot.lib.telemetry as telemetry
+
+
+class Subscriptions(object):
+
+    """Topic prefixes that currently have at least one subscriber.
+
+    Fed the subscription messages an XPUB socket receives. ZMQ only
+    passes on the last unsubscribe for each prefix, so a set of prefixes
+    is all that's needed. With XPUB_VERBOSE every subscribe comes through,
+    repeats just don't change the set.
+
+    """
+
+    def __init__(self):
+        self.prefixes = set()
+
+    def update(self, msg):
+        """Apply a subscription message from an XPUB socket.
+
+        :param msg: First byte 1 to subscribe or 0 to unsubscribe, then
+            the topic prefix.
+        :type msg: string
+        :returns: True if the set of prefixes changed.
+
+        """
+        if not msg:
+            return False
+        prefix = msg[1:]
+        if msg[0] == "\x01":
+            if prefix in self.prefixes:
+                return False
+            self.prefixes.add(prefix)
+            return True
+        if msg[0] == "\x00" and prefix in self.prefixes:
+            self.prefixes.discard(prefix)
+            return True
+        return False
+
+    def wanted(self, topic):
+        """Check if anyone is subscribed to a topic.
+
+        :param topic: Name of the topic.
+        :type topic: string
+        :returns: True if some subscribed prefix matches the topic.
+
+        """
+        return any(topic.startswith(prefix) for prefix in self.prefixes)
+
+    def __len__(self):
+        return len(self.prefixes)
+
+
+def difference(old, new):
+    """Largest change between two samples of a topic's value.
+
+    :param old: Previous value, a number or a dict or sequence of numbers.
+    :param new: Current value, same shape as old.
+    :returns: Largest absolute change, or None if the values can't be
+        compared numerically.
+
+    """
+    if isinstance(old, numbers.Number) and isinstance(new, numbers.Number):
+        return abs(new - old)
+    if isinstance(old, dict) and isinstance(new, dict):
+        if sorted(old) != sorted(new):
+            return None
+        old, new = [old[key] for key in sorted(old)], \
+            [new[key] for key in sorted(old)]
+    if isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+        if len(old) != len(new):
+            return None
+        changes = [difference(a, b) for a, b in zip(old, new)]
+        if None in changes:
+            return None
+        return max(changes or [0])
+    return None
+
+
+class Topic(object):
+
+    """A published value, how often it's sampled and when it's sent."""
+
+    def __init__(self, name, getter, rate=1, epsilon=None, serializer=str):
+        """Describe a topic.
+
+        :param name: Topic name, the prefix clients subscribe with.
+        :type name: string
+        :param getter: Called with no arguments to sample the value.
+        :type getter: callable
+        :param rate: Samples per second while subscribed.
+        :type rate: float
+        :param epsilon: Only send a sample when it differs from the last
+            one sent by more than this. None sends every sample.
+        :type epsilon: float
+        :param serializer: Turns a value into the string that's sent.
+        :type serializer: callable
+
+        """
+        if rate <= 0:
+            raise ValueError("Topic rate must be positive")
+        self.name = name
+        self.getter = getter
+        self.period = 1.0 / rate
+        self.epsilon = epsilon
+        self.serializer = serializer
+        self.reset()
+
+    def reset(self):
+        """Forget the last value sent, so the next sample is sent."""
+        self.last_value = None
+        self.sent = False
+
+    def start(self):
+        """Called when the topic gets its first subscriber."""
+        # New subscribers get the current value straight away
+        self.reset()
+
+    def stop(self):
+        """Called when the topic loses its last subscriber."""
+        pass
+
+    def changed(self, value):
+        """Check if a sample should be sent, given the last one sent.
+
+        :param value: New sample.
+        :returns: True if the sample should be sent.
+
+        """
+        if self.epsilon is None or not self.sent:
+            return True
+        change = difference(self.last_value, value)
+        if change is None:
+            return value != self.last_value
+        return change > self.epsilon
+
+    def sample(self):
+        """Read the value and serialize it, if it changed enough.
+
+        :returns: Serialized value, or None if it isn't worth sending.
+
+        """
+        value = self.getter()
+        if not self.changed(value):
+            return None
+        self.last_value = value
+        self.sent = True
+        return self.serializer(value)
+
+    def payloads(self):
+        """Get the messages to send this time the topic is due.
+
+        :returns: List of serialized values, empty if nothing changed.
+
+        """
+        payload = self.sample()
+        return [] if payload is None else [payload]
+
+
+class StreamTopic(Topic):
+
+    """Publishes the batches a SampleStream collects, as they fill up.
+
+    Each time the topic is due, every full batch is sent as a message of
+    its own. The stream only records while the topic is subscribed to.
+
+    """
+
+    def __init__(self, stream, rate=1, serializer=None):
+        """Describe a topic for a stream.
+
+        :param stream: Stream to publish, the topic takes its name.
+        :type stream: bot.lib.sample_stream.SampleStream
+        :param rate: How often per second to check for full batches.
+        :type rate: float
+        :param serializer: Turns a (samples, fields) array into the string
+            that's sent, defaults to str of the fields and samples.
+        :type serializer: callable
+
+        """
+        if serializer is None:
+            serializer = lambda batch: str({"fields": stream.fields,
+                                            "samples": batch.tolist()})
+        Topic.__init__(self, stream.name, stream.drain, rate,
+                       serializer=serializer)
+        self.stream = stream
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def payloads(self):
+        return [self.serializer(batch) for batch in self.stream.drain()]
 
 
 class PubServer(threading.Thread):
 
     """Publish information about the state of the bot.
 
-    Note that with ZMQ (libzmq) >= 3.0, only topics that are actually
-    subscribed to will be published. In other words, topic filtering
-    happens here, at the publisher. This saves bot resources, so it's
-    strongly suggested that ZMQ >= 3.0 is used.
+    The socket is an XPUB, so PubServer sees subscribe and unsubscribe
+    messages from clients. It keeps the set of subscribed prefixes and only
+    calls the getters of topics that match one. Getters are often bus reads
+    (motor velocity is an I2C transaction), so an idle PubServer costs no
+    bus traffic.
 
     The PubServer is a thread, and is meant to be spawned by CtrlServer.
 
     CtrlServer passes a dict of the bot's systems to PubServer when it's
     created, which gives PubServer access to the state of the bot.
 
-    Note that the "ir" topic isn't quite a read-only operation, as it
-    must cycle through ADCs and actually use the IR sensors. If the bot
-    is following line, it's likely a bad idea to publish this topic.
-    Using ir_cached is an alternative, as it will returned cached IR
-    values if the are fresher than some given staleness (defaults to
-    one second). This could still cause problems, but it's less likely.
+    Each topic has its own rate, and can be set to only send values that
+    changed by more than some epsilon (config pub_topics). Subscribed
+    topics are kept on a heap ordered by when they're next due, and the
+    thread sleeps in a poll on the XPUB socket until the first one is, so
+    fast topics don't make slow ones cost more.
+
+    Systems can also have streams, batches of samples recorded by control
+    loops on every tick (see bot.lib.sample_stream). Those are published
+    a batch per message, and only record while they're subscribed to.
+
+    With config pub_encoding set to binary, each message is two frames,
+    the topic and a telemetry record (see bot.lib.telemetry) with the value
+    and when it was sampled. Otherwise it's one "topic value" text frame.
 
     """
 
-    # How often topics are published, in seconds.
-    pub_delay = 1
+    # Samples per second of topics with no rate in config
+    default_rate = 1
 
     def __init__(self, systems):
         """Override Thread.__init__, build ZMQ PUB socket.
@@ -59,65 +260,198 @@ class PubServer(threading.Thread):
         # Unpack required objects from systems
         self.driver = systems["driver"]
 
-        # Build ZMQ publisher socket
+        # Build ZMQ publisher socket, XPUB to see subscriptions
         self.context = zmq.Context()
-        self.pub_sock = self.context.socket(zmq.PUB)
+        self.pub_sock = self.context.socket(zmq.XPUB)
+        # Pass on every subscribe, so each new client gets current values
+        self.pub_sock.setsockopt(zmq.XPUB_VERBOSE, 1)
         self.pub_addr = "{protocol}://{host}:{port}".format(
             protocol=self.config["server_protocol"],
             host=self.config["server_bind_host"],
             port=self.config["pub_server_port"])
         self.pub_sock.bind(self.pub_addr)
 
-        # Mapping of published topics to methods that give their value
-        # I know some of these lines are too long. Fuck it, it's clean code.
-        self.topics = {
-            "drive_motor_detail_br": self.driver.motors["back_right"].__str__,
-            "drive_motor_detail_fr": self.driver.motors["front_right"].__str__,
-            "drive_motor_detail_bl": self.driver.motors["back_left"].__str__,
-            "drive_motor_detail_fl": self.driver.motors["front_left"].__str__,
-            "drive_motor_vel_br":
-                self.driver.motors["back_right"].get_velocity,
-            "drive_motor_vel_fr":
-                self.driver.motors["front_right"].get_velocity,
-            "drive_motor_vel_bl":
-                self.driver.motors["back_left"].get_velocity,
-            "drive_motor_vel_fl":
-                self.driver.motors["front_left"].get_velocity,
-            "drive_motor_speed_br":
-                self.driver.motors["back_right"].get_speed,
-            "drive_motor_speed_fr":
-                self.driver.motors["front_right"].get_speed,
-            "drive_motor_speed_bl":
-                self.driver.motors["back_left"].get_speed,
-            "drive_motor_speed_fl":
-                self.driver.motors["front_left"].get_speed,
-            "drive_motor_dir_br":
-                self.driver.motors["back_right"].get_direction,
-            "drive_motor_dir_fr":
-                self.driver.motors["front_right"].get_direction,
-            "drive_motor_dir_bl":
-                self.driver.motors["back_left"].get_direction,
-            "drive_motor_dir_fl":
-                self.driver.motors["front_left"].get_direction,
-        }
+        # text: "topic value" frames; binary: [topic, telemetry record]
+        self.encoding = self.config.get("pub_encoding", "text")
+        if self.encoding not in ("text", "binary"):
+            raise ValueError("Unknown pub_encoding: {}".format(self.encoding))
+
+        # Prefixes clients are subscribed to, see handle_subscriptions
+        self.subscriptions = Subscriptions()
+
+        # Mapping of topic names to Topics, see add_topic
+        self.topics = {}
+        # (due time, topic name) of each subscribed topic
+        self.schedule = []
+        for name, motor in self.driver.motors.motors.items():
+            self.add_topic("drive_motor_detail_" + name, motor.__str__)
+            self.add_topic("drive_motor_power_" + name,
+                           lambda motor=motor: motor.power)
+            self.add_topic("drive_motor_velocity_" + name,
+                           lambda motor=motor: motor.velocity)
+        # Batches of samples recorded by the control loops themselves
+        for name in ("driver", "nav"):
+            if name in systems:
+                for stream in getattr(systems[name], "streams", []):
+                    self.add_stream(stream)
+
+    def topic_settings(self, name):
+        """Find a topic's settings in config pub_topics.
+
+        Settings are keyed by topic prefix, the longest prefix of the name
+        that's there wins.
+
+        :param name: Topic name.
+        :type name: string
+        :returns: Dict of settings, empty if none match.
+
+        """
+        topic_config = self.config.get("pub_topics", {})
+        prefixes = [prefix for prefix in topic_config
+                    if name.startswith(prefix)]
+        if not prefixes:
+            return {}
+        return topic_config[max(prefixes, key=len)]
+
+    def add_topic(self, name, getter, serializer=None):
+        """Register a topic, with the rate and epsilon set for it in config.
+
+        :param name: Topic name.
+        :type name: string
+        :param getter: Called with no arguments to sample the value.
+        :type getter: callable
+        :param serializer: Turns a value into the string that's sent,
+            defaults to str in text mode and telemetry.encode in binary.
+        :type serializer: callable
+        :returns: The new Topic.
+
+        """
+        settings = self.topic_settings(name)
+        if serializer is None:
+            serializer = telemetry.encode if self.encoding == "binary" \
+                else str
+        topic = Topic(name, getter, settings.get("rate", self.default_rate),
+                      settings.get("epsilon"), serializer)
+        self.topics[name] = topic
+        return topic
+
+    def add_stream(self, stream):
+        """Register a SampleStream as a topic, checked at its config rate.
+
+        :param stream: Stream to publish.
+        :type stream: bot.lib.sample_stream.SampleStream
+        :returns: The new StreamTopic.
+
+        """
+        serializer = None
+        if self.encoding == "binary":
+            serializer = lambda batch: telemetry.encode_batch(stream.fields,
+                                                              batch)
+        topic = StreamTopic(stream, self.topic_settings(stream.name).get(
+            "rate", self.default_rate), serializer)
+        self.topics[stream.name] = topic
+        return topic
 
     def run(self):
-        """Entry point for thread, just publishes topics.
+        """Entry point for thread, publishes topics as they come due.
 
         Note that this overrides Thread.run and is the entry point when
         starting this thread.
 
         """
         while True:
-            # Publish topics
-            sleep(self.pub_delay)
-            self.publish()
+            if self.schedule:
+                timeout = max(self.schedule[0][0] - lib.monotonic(), 0)
+                # zmq polls in milliseconds
+                self.pub_sock.poll(timeout * 1000)
+            else:
+                # Nothing to publish until someone subscribes
+                self.pub_sock.poll()
+            self.handle_subscriptions()
+            self.publish_due()
+
+    def reschedule(self):
+        """Put exactly the subscribed topics on the schedule, due now."""
+        now = lib.monotonic()
+        scheduled = set(name for due, name in self.schedule)
+        active = self.active_topics()
+        for name in scheduled.difference(active):
+            self.topics[name].stop()
+        for name in active:
+            if name not in scheduled:
+                self.topics[name].start()
+        self.schedule = [(now, name) for name in active]
+        heapq.heapify(self.schedule)
+
+    def publish_due(self, now=None):
+        """Publish every scheduled topic that's due, then schedule it again.
+
+        :param now: Current lib.monotonic time, read if not given.
+        :type now: float
+        :returns: Number of messages sent.
+
+        """
+        if now is None:
+            now = lib.monotonic()
+        sent = 0
+        while self.schedule and self.schedule[0][0] <= now:
+            due, name = heapq.heappop(self.schedule)
+            topic = self.topics[name]
+            sent += self.send(topic)
+            due += topic.period
+            if due <= now:
+                # Fell behind, skip the missed samples rather than burst
+                due = now + topic.period
+            heapq.heappush(self.schedule, (due, name))
+        return sent
+
+    def send(self, topic):
+        """Sample a topic and send whatever it has that's worth sending.
+
+        :param topic: Topic to sample.
+        :type topic: Topic
+        :returns: Number of messages sent.
+
+        """
+        payloads = topic.payloads()
+        for payload in payloads:
+            if self.encoding == "binary":
+                self.pub_sock.send_multipart([topic.name, payload])
+            else:
+                self.pub_sock.send("{} {}".format(topic.name, payload))
+        return len(payloads)
+
+    def handle_subscriptions(self):
+        """Apply every subscription message waiting on the XPUB socket."""
+        while True:
+            try:
+                msg = self.pub_sock.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            if self.subscriptions.update(msg):
+                self.logger.debug("Subscribed prefixes: {}".format(
+                    sorted(self.subscriptions.prefixes)))
+                self.reschedule()
+            elif msg[:1] == "\x01":
+                # Another client on a prefix that's already subscribed,
+                # resend its topics' current values for the newcomer
+                for name, topic in self.topics.items():
+                    if name.startswith(msg[1:]):
+                        topic.reset()
+                self.reschedule()
+
+    def active_topics(self):
+        """Get the names of topics with at least one subscriber."""
+        if not self.subscriptions:
+            return []
+        return [topic for topic in sorted(self.topics)
+                if self.subscriptions.wanted(topic)]
 
     def publish(self):
-        """Publish information about bot."""
-        for topic_name, topic_val in self.topics.iteritems():
-            # FIXME: This always calls every function.
-            # ZMQ will drop any topics that no clients are subscribed to, but
-            # the idea is to prevent these calls from being made in the first
-            # place, which is not happening (painfully obvious now).
-            self.pub_sock.send("{} {}".format(topic_name, topic_val()))
+        """Sample every subscribed topic now, whatever its schedule.
+
+        :returns: Number of messages sent.
+
+        """
+        return sum(self.send(self.topics[name])
+                   for name in self.active_topics())
@@ -0,0 +1,166 @@
+"""Registry that builds bot systems, sharing them and bringing them up fast.
+
+Systems used to be built one after the other by CtrlServer, and each built
+its own copy of the hardware it needed, so a second OmniDriver ran a second
+DMCC autodetect and several IR objects shared one bus. Systems are now
+registered with a factory and the names of the systems they depend on.
+Every system is built exactly once and handed to the systems that need it.
+
+Eager systems are built together on their own threads at startup, each
+waiting only for its dependencies, so slow independent hardware (DMCC
+autodetect, servo capes, the switch GPIOs) comes up concurrently. Lazy
+systems are built on first use.
+
+"""
+
+from inspect import getargspec, getmembers, ismethod
+from threading import Lock, Thread
+
+import bot.lib.lib as lib
+
+
+class Subsystem(object):
+
+    """How to build one system, and the system once it's built."""
+
+    def __init__(self, name, factory, cls, deps, lazy, export):
+        self.name = name
+        self.factory = factory
+        self.cls = cls
+        self.deps = deps
+        self.lazy = lazy
+        self.export = export
+        self.instance = None
+        # Held while building, so concurrent users wait for one build
+        self.lock = Lock()
+
+
+class SubsystemRegistry(object):
+
+    """Builds systems on demand, each one once, dependencies first.
+
+    Supports systems["name"] and "name" in systems, so it can be passed
+    wherever a dict of systems was, like to PubServer.
+
+    """
+
+    def __init__(self):
+        self.logger = lib.get_logger()
+        self.subsystems = {}
+
+    def register(self, name, factory, cls=None, deps=(), lazy=False,
+                 export=True):
+        """Add a system to be built by factory.
+
+        :param name: Name the system is called by through the API.
+        :type name: string
+        :param factory: Called with the dependencies as keyword arguments,
+            named as in deps, to build the system.
+        :type factory: callable
+        :param cls: Class of the built system, read for exported methods
+            so lazy systems can be listed before they're built. Defaults
+            to factory, for factories that are classes.
+        :type cls: class
+        :param deps: Names of systems to build first and pass to factory.
+        :type deps: tuple
+        :param lazy: Build on first use instead of in start().
+        :type lazy: boolean
+        :param export: Expose the system's API methods to clients.
+        :type export: boolean
+
+        """
+        if name in self.subsystems:
+            raise ValueError("System {} is already registered".format(name))
+        self.subsystems[name] = Subsystem(name, factory, cls or factory,
+                                          tuple(deps), lazy, export)
+
+    def add(self, name, instance, export=True):
+        """Add a system that's already built.
+
+        :param name: Name the system is called by through the API.
+        :type name: string
+        :param instance: The system.
+        :param export: Expose the system's API methods to clients.
+        :type export: boolean
+
+        """
+        self.register(name, None, type(instance), export=export)
+        self.subsystems[name].instance = instance
+
+    def get(self, name):
+        """Get a system, building it and its dependencies if needed.
+
+        :param name: Name the system was registered with.
+        :type name: string
+        :returns: The system.
+        :raises KeyError: If no system has that name.
+
+        """
+        subsystem = self.subsystems[name]
+        if subsystem.instance is not None:
+            return subsystem.instance
+        with subsystem.lock:
+            if subsystem.instance is None:
+                deps = dict((dep, self.get(dep)) for dep in subsystem.deps)
+                start = lib.monotonic()
+                subsystem.instance = subsystem.factory(**deps)
+                self.logger.info("Built {} in {:.3f}s".format(
+                    name, lib.monotonic() - start))
+        return subsystem.instance
+
+    def is_built(self, name):
+        return self.subsystems[name].instance is not None
+
+    def start(self):
+        """Build every eager system, independent ones concurrently.
+
+        :raises: The first exception raised building a system, once all
+            the builds have finished.
+
+        """
+        errors = []
+
+        def build(name):
+            try:
+                self.get(name)
+            except Exception as e:
+                self.logger.error("Failed to build {}: {}".format(name, e))
+                errors.append(e)
+
+        threads = [Thread(target=build, args=(name,), name="build_" + name)
+                   for name, subsystem in sorted(self.subsystems.items())
+                   if not subsystem.lazy and subsystem.instance is None]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def exported(self):
+        """Names of the systems exposed to clients."""
+        return sorted(name for name, subsystem in self.subsystems.items()
+                      if subsystem.export)
+
+    def api_methods(self, name):
+        """Find the exported methods of a system, without building it.
+
+        :param name: Name the system was registered with.
+        :type name: string
+        :returns: Dict mapping method name to argspec.
+
+        """
+        methods = {}
+        for member_name, member in getmembers(self.subsystems[name].cls):
+            if ismethod(member) and hasattr(member, "__api_call"):
+                methods[member_name] = getargspec(member)
+        return methods
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        return name in self.subsystems
+
+    def __iter__(self):
+        return iter(self.subsystems)
@@ -0,0 +1,60 @@
+"""Test cases for lookup table block color classification."""
+
+import numpy as np
+
+from bot.hardware.complex_hardware.color_classifier import BOUNDARIES
+from bot.hardware.complex_hardware.color_classifier import NO_COLOR
+from bot.hardware.complex_hardware.color_classifier import build_color_lut
+from bot.hardware.complex_hardware.color_classifier import classify
+from bot.hardware.complex_hardware.color_classifier import enhance_saturation
+import tests.test_bot as test_bot
+
+
+def label_of(name):
+    return 1 + [b[0] for b in BOUNDARIES].index(name)
+
+
+class TestColorClassifier(test_bot.TestBot):
+
+    """Test saturation blend, table build and pixel labelling."""
+
+    def setUp(self):
+        super(TestColorClassifier, self).setUp()
+        self.lut = build_color_lut()
+
+    def test_enhance_gray_unchanged(self):
+        """Test that gray pixels aren't affected by saturation."""
+        assert np.allclose(enhance_saturation([[100, 100, 100]], 3.0), 100)
+
+    def test_enhance_saturates(self):
+        """Test that color is pushed away from gray and clipped."""
+        b, g, r = enhance_saturation([40, 40, 160], 3.0)
+        assert r == 255
+        assert b < 40
+
+    def test_lut_shape(self):
+        """Test the table has one cell per quantized BGR value."""
+        assert self.lut.shape == (32, 32, 32)
+        assert self.lut.dtype == np.uint8
+
+    def test_classify(self):
+        """Test labelling a small image of known colors."""
+        image = np.array([[[30, 30, 200], [200, 60, 40]],
+                          [[40, 180, 200], [128, 128, 128]]], dtype=np.uint8)
+        labels = classify(image, self.lut)
+        assert labels.shape == (2, 2)
+        assert labels[0, 0] == label_of("red")
+        assert labels[0, 1] == label_of("blue")
+        assert labels[1, 0] == label_of("yellow")
+        assert labels[1, 1] == NO_COLOR
+
+    def test_matches_ranges(self):
+        """Test that table cells agree with the ranges they were built from."""
+        bgr = np.array([[[8 * b + 3, 8 * g + 3, 8 * r + 3]
+                         for b, g, r in [(3, 3, 25), (29, 10, 5)]]],
+                       dtype=np.uint8)
+        enhanced = enhance_saturation(bgr, 3.0)[0]
+        labels = classify(bgr, self.lut)[0]
+        for pixel, label in zip(enhanced, labels):
+            name, lower, upper = BOUNDARIES[label - 1]
+            assert np.all(pixel >= lower) and np.all(pixel <= upper)
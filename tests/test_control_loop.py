@@ -0,0 +1,55 @@
+"""Test cases for the fixed-rate control loop scheduler."""
+
+from time import sleep
+
+from bot.navigation.control_loop import ControlLoop
+import tests.test_bot as test_bot
+
+
+class TestControlLoop(test_bot.TestBot):
+
+    """Test loop termination, timesteps and overrun accounting."""
+
+    def setUp(self):
+        super(TestControlLoop, self).setUp()
+        self.loop = ControlLoop(rate=200)
+
+    def test_bad_rate(self):
+        """Test that a non-positive rate is rejected."""
+        with self.assertRaises(ValueError):
+            ControlLoop(rate=0)
+
+    def test_step_stops_loop(self):
+        """Test that the loop ends when step returns False."""
+        timesteps = []
+
+        def step(timestep):
+            timesteps.append(timestep)
+            return len(timesteps) < 5
+        assert self.loop.run(step) == 5
+        assert timesteps[0] == self.loop.period
+        # Allow plenty of slack for a loaded test machine
+        assert all(0 < t < 10 * self.loop.period for t in timesteps)
+
+    def test_duration(self):
+        """Test that a duration bounds the run."""
+        ticks = self.loop.run(lambda timestep: True, duration=0.05)
+        assert 0 < ticks <= 11
+        assert self.loop.stats()["ticks"] == ticks
+
+    def test_stop(self):
+        """Test that stop() ends the loop after the current tick."""
+        def step(timestep):
+            self.loop.stop()
+            return True
+        assert self.loop.run(step) == 1
+
+    def test_overrun(self):
+        """Test that slow steps are counted as overruns."""
+        def step(timestep):
+            sleep(2 * self.loop.period)
+            return self.loop.ticks < 2
+        self.loop.run(step)
+        stats = self.loop.stats()
+        assert stats["overruns"] >= 1
+        assert stats["max_step_ms"] >= 2 * self.loop.period * 1000
@@ -0,0 +1,87 @@
+"""Test cases for AsyncCtrlClient against a CtrlServer with fake systems."""
+
+import os
+import sys
+
+import zmq
+
+from tests.test_ctrl_server import CtrlServerCase
+
+# The clients import lib.messages relative to the bot directory
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "bot"))
+from bot.client.ctrl_client import AsyncCtrlClient
+
+
+class AsyncClientCase(CtrlServerCase):
+
+    """Gives each test an AsyncCtrlClient connected to the server."""
+
+    def setUp(self):
+        super(AsyncClientCase, self).setUp()
+        self.async_client = AsyncCtrlClient(self.addr)
+
+    def tearDown(self):
+        self.async_client.ctrl_sock.setsockopt(zmq.LINGER, 0)
+        self.async_client.clean_up()
+        super(AsyncClientCase, self).tearDown()
+
+
+class TestAsyncRouter(AsyncClientCase):
+
+    """Test overlapping requests against a router mode server."""
+
+    mode = "router"
+
+    def test_out_of_order(self):
+        """Test that a quick reply isn't held up behind a slow one."""
+        slow = self.async_client.send("slow", "wait")
+        fast = self.async_client.send("fast", "echo", {"value": 2})
+        assert self.async_client.wait(fast, timeout=5)["call_return"] == 2
+        self.server.systems["slow"].open.set()
+        assert self.async_client.wait(slow, timeout=5)["call_return"] is True
+
+    def test_wait_keeps_others(self):
+        """Test that replies that arrive while waiting aren't lost."""
+        first = self.async_client.send("fast", "echo", {"value": 1})
+        second = self.async_client.send("fast", "echo", {"value": 2})
+        # The fast worker answers first, then second
+        assert self.async_client.wait(second, timeout=5)[
+            "call_return"] == 2
+        req_id, reply = self.async_client.recv(timeout=5)
+        assert req_id == first
+        assert reply["call_return"] == 1
+
+    def test_batch(self):
+        """Test that a batch's reply comes back under its request id."""
+        req_id = self.async_client.send_batch(
+            [("fast", "echo", {"value": 1}), ("ctrl", "echo")])
+        reply = self.async_client.wait(req_id, timeout=5)
+        assert reply["type"] == "batch_reply"
+        assert [call["type"] for call in reply["replies"]] == \
+            ["call_reply", "call_reply"]
+
+    def test_timeout(self):
+        """Test that waiting on an unanswered request times out."""
+        req_id = self.async_client.send("slow", "wait")
+        assert self.async_client.wait(req_id, timeout=0.1) is None
+        self.server.systems["slow"].open.set()
+        assert self.async_client.wait(req_id, timeout=5)["call_return"]
+
+
+class TestAsyncRep(AsyncClientCase):
+
+    """Test that the request id envelope comes back through REP too."""
+
+    def test_call(self):
+        """Test a blocking call through the DEALER socket."""
+        assert self.async_client.call("fast", "echo", {"value": 3})[
+            "call_return"] == 3
+
+    def test_several(self):
+        """Test that queued requests are answered in turn, by id."""
+        ids = [self.async_client.send("fast", "echo", {"value": value})
+               for value in (1, 2)]
+        replies = [self.async_client.recv(timeout=5) for req_id in ids]
+        assert [(req_id, reply["call_return"])
+                for req_id, reply in replies] == zip(ids, [1, 2])
@@ -0,0 +1,340 @@
+"""Test cases for CtrlServer's message handling, in rep and router mode."""
+
+import signal
+from threading import Event, Thread
+
+import zmq
+from zmq.utils import jsonapi
+
+import bot.lib.lib as lib
+import bot.lib.messages as msgs
+from bot.server.ctrl_server import CtrlServer, SystemWorker, reply_addr
+from bot.server.registry import SubsystemRegistry
+import tests.test_bot as test_bot
+
+
+class Gate(object):
+
+    """System whose wait calls block until the gate is opened."""
+
+    def __init__(self):
+        self.open = Event()
+
+    @lib.api_call
+    def wait(self):
+        return self.open.wait(5)
+
+    @lib.api_call
+    def echo(self, value):
+        return value
+
+    @lib.api_call
+    def fail(self):
+        raise IOError("Device gone")
+
+
+class FakeNav(object):
+
+    def __init__(self):
+        self.stopped = False
+
+    @lib.api_call
+    def stop(self):
+        self.stopped = True
+
+
+class FakeDriver(object):
+
+    def __init__(self):
+        self.speed = None
+
+    @lib.api_call
+    def move(self, speed, angle=0):
+        self.speed = speed
+
+
+class FakeCtrlServer(CtrlServer):
+
+    """CtrlServer with fake systems instead of bot hardware."""
+
+    def __init__(self, *args, **kwargs):
+        # Calls to hold wait inside for the gate to open
+        self.inside = Event()
+        self.gate = Event()
+        super(FakeCtrlServer, self).__init__(*args, **kwargs)
+
+    @lib.api_call
+    def hold(self):
+        self.inside.set()
+        return self.gate.wait(5)
+
+    def assign_subsystems(self):
+        systems = SubsystemRegistry()
+        systems.add("ctrl", self)
+        systems.add("slow", Gate())
+        systems.add("fast", Gate())
+        systems.add("nav", FakeNav())
+        systems.add("driver", FakeDriver())
+        return systems
+
+
+class CtrlServerCase(test_bot.TestBot):
+
+    """Runs a FakeCtrlServer listening on its own thread."""
+
+    mode = "rep"
+
+    def setUp(self):
+        super(CtrlServerCase, self).setUp()
+        self.orig_mode = self.config.get("ctrl_server_mode")
+        self.orig_sigint = signal.getsignal(signal.SIGINT)
+        self.config["ctrl_server_mode"] = self.mode
+        self.server = FakeCtrlServer()
+        self.listener = Thread(target=self.server.listen)
+        self.listener.setDaemon(True)
+        self.listener.start()
+
+        self.context = zmq.Context()
+        self.addr = "tcp://127.0.0.1:{}".format(
+            self.config["ctrl_server_port"])
+        self.sockets = []
+
+    def tearDown(self):
+        if self.listener.is_alive():
+            self.exit_server()
+        for sock in self.sockets:
+            sock.close()
+        self.context.term()
+        signal.signal(signal.SIGINT, self.orig_sigint)
+        self.config["ctrl_server_mode"] = self.orig_mode
+        super(CtrlServerCase, self).tearDown()
+
+    def client(self, kind=zmq.REQ):
+        sock = self.context.socket(kind)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.RCVTIMEO, 5000)
+        sock.connect(self.addr)
+        self.sockets.append(sock)
+        return sock
+
+    def call(self, sock, obj_name, method, params=None):
+        sock.send_json(msgs.call_req(obj_name, method, params or {}))
+        return sock.recv_json()
+
+    def exit_server(self):
+        sock = self.client()
+        sock.send_json(msgs.exit_req())
+        reply = sock.recv_json()
+        self.listener.join(5)
+        return reply
+
+
+class TestRepMode(CtrlServerCase):
+
+    """Test answering one call at a time on a REP socket."""
+
+    def test_call(self):
+        """Test that a call's return value is sent back."""
+        reply = self.call(self.client(), "fast", "echo", {"value": 3})
+        assert reply["type"] == "call_reply"
+        assert reply["call_return"] == 3
+
+    def test_bad_params(self):
+        """Test that params that aren't a dict get an error reply."""
+        sock = self.client()
+        sock.send_json(msgs.call_req("fast", "echo", None))
+        assert sock.recv_json()["type"] == "error"
+        assert self.call(sock, "fast", "echo", {"value": 1})["type"] == \
+            "call_reply"
+
+    def test_clean_up(self):
+        """Test that exiting stops the bot and closes the context."""
+        assert self.exit_server()["type"] == "exit_reply"
+        assert not self.listener.is_alive()
+        assert self.server.systems["nav"].stopped
+        assert self.server.systems["driver"].speed == 0
+        assert self.server.context.closed
+
+
+class TestRouterMode(CtrlServerCase):
+
+    """Test running calls on a worker per system."""
+
+    mode = "router"
+
+    def test_reply_routing(self):
+        """Test that a busy system doesn't hold up replies from another."""
+        slow, fast = self.client(), self.client()
+        slow.send_json(msgs.call_req("slow", "wait", {}))
+        # Answered while the slow call is still blocked
+        assert self.call(fast, "fast", "echo", {"value": 2})[
+            "call_return"] == 2
+        self.server.systems["slow"].open.set()
+        assert slow.recv_json()["call_return"] is True
+
+    def test_exception(self):
+        """Test that an exception in a call becomes an error reply."""
+        sock = self.client()
+        reply = self.call(sock, "fast", "fail")
+        assert reply["type"] == "error"
+        assert "Device gone" in reply["msg"]
+        # The worker is still there for the next call
+        assert self.call(sock, "fast", "echo", {"value": 1})[
+            "call_return"] == 1
+
+    def test_bad_params(self):
+        """Test that bad params don't kill the system's worker."""
+        sock = self.client()
+        for params in (None, [1, 2]):
+            sock.send_json(msgs.call_req("fast", "echo", params))
+            assert sock.recv_json()["type"] == "error"
+        assert self.call(sock, "fast", "echo", {"value": 1})[
+            "call_return"] == 1
+
+    def test_clean_up(self):
+        """Test that exiting stops the bot, workers and context."""
+        self.call(self.client(), "fast", "echo", {"value": 1})
+        workers = self.server.workers.values()
+        assert self.exit_server()["type"] == "exit_reply"
+        assert not self.listener.is_alive()
+        assert not any(worker.is_alive() for worker in workers)
+        assert self.server.systems["nav"].stopped
+        assert self.server.context.closed
+
+
+class TestSystemWorker(test_bot.TestBot):
+
+    """Test a SystemWorker on its own, replies going to a PULL socket."""
+
+    def setUp(self):
+        super(TestSystemWorker, self).setUp()
+        self.context = zmq.Context()
+        self.replies = self.context.socket(zmq.PULL)
+        self.replies.bind(reply_addr)
+        self.calls = []
+        self.started = Event()
+        self.release = Event()
+
+    def tearDown(self):
+        self.replies.close()
+        self.context.term()
+        super(TestSystemWorker, self).tearDown()
+
+    def call(self, name, method, params):
+        self.calls.append(method)
+        self.started.set()
+        if method == "fail":
+            raise ValueError("Broken call_func")
+        self.release.wait(5)
+        return msgs.call_reply("Called", method)
+
+    def reply(self):
+        assert self.replies.poll(5000)
+        frames = self.replies.recv_multipart()
+        return frames[:-1], jsonapi.loads(frames[-1])
+
+    def test_envelope(self):
+        """Test that replies go out with their request's envelope."""
+        worker = SystemWorker("sys", self.call, self.context)
+        worker.start()
+        self.release.set()
+        worker.submit(["client", ""], {"method": "m", "params": {}})
+        envelope, reply = self.reply()
+        assert envelope == ["client", ""]
+        assert reply["call_return"] == "m"
+        worker.stop()
+        worker.join(5)
+
+    def test_exception(self):
+        """Test that an exception from the call is sent as an error."""
+        worker = SystemWorker("sys", self.call, self.context)
+        worker.start()
+        worker.submit(["a"], {"method": "fail", "params": {}})
+        envelope, reply = self.reply()
+        assert reply["type"] == "error"
+        assert worker.is_alive()
+        worker.stop()
+        worker.join(5)
+
+    def test_stop(self):
+        """Test that stop drops queued calls and ends the thread."""
+        worker = SystemWorker("sys", self.call, self.context)
+        worker.start()
+        worker.submit(["a"], {"method": "first", "params": {}})
+        worker.submit(["b"], {"method": "second", "params": {}})
+        assert self.started.wait(5)
+        worker.stop()
+        self.release.set()
+        worker.join(5)
+        assert not worker.is_alive()
+        assert self.calls == ["first"]
+
+
+class BatchTests(object):
+
+    """Batch tests run against both server modes."""
+
+    def batch(self, calls, stop_on_error=False):
+        sock = self.client()
+        sock.send_json(msgs.batch_req(
+            [msgs.call_req(*call) for call in calls], stop_on_error))
+        return sock.recv_json()
+
+    def test_order(self):
+        """Test that replies come back in the order of the calls."""
+        reply = self.batch([("fast", "echo", {"value": value})
+                            for value in (1, 2, 3)])
+        assert reply["type"] == "batch_reply"
+        assert [call["call_return"] for call in reply["replies"]] == \
+            [1, 2, 3]
+
+    def test_stop_on_error(self):
+        """Test that a failed call ends the batch only if asked to."""
+        calls = [("fast", "echo", {"value": 1}), ("fast", "fail", {}),
+                 ("fast", "echo", {"value": 3})]
+        replies = self.batch(calls, stop_on_error=True)["replies"]
+        assert [call["type"] for call in replies] == ["call_reply", "error"]
+        replies = self.batch(calls)["replies"]
+        assert [call["type"] for call in replies] == \
+            ["call_reply", "error", "call_reply"]
+
+    def test_malformed_call(self):
+        """Test that a malformed call fails alone."""
+        sock = self.client()
+        sock.send_json(msgs.batch_req(
+            [{"obj_name": "fast"}, msgs.call_req("fast", "echo",
+                                                 {"value": 2})]))
+        replies = sock.recv_json()["replies"]
+        assert replies[0]["type"] == "error"
+        assert replies[1]["call_return"] == 2
+
+    def test_not_a_list(self):
+        """Test that a batch without a list of calls is an error."""
+        sock = self.client()
+        sock.send_json(msgs.batch_req("calls"))
+        assert sock.recv_json()["type"] == "error"
+
+
+class TestRepBatch(BatchTests, CtrlServerCase):
+
+    """Test batches on a REP socket."""
+
+
+class TestRouterBatch(BatchTests, CtrlServerCase):
+
+    """Test batches on their own threads in router mode."""
+
+    mode = "router"
+
+    def test_ctrl_locked(self):
+        """Test that ctrl calls in a batch don't overlap the listener's."""
+        batch = self.client()
+        batch.send_json(msgs.batch_req([msgs.call_req("ctrl", "hold", {})]))
+        assert self.server.inside.wait(5)
+        direct = self.client()
+        direct.send_json(msgs.call_req("ctrl", "echo", {"msg": 1}))
+        # Waits for the batch's ctrl call to finish
+        assert not direct.poll(200)
+        self.server.gate.set()
+        assert batch.recv_json()["replies"][0]["call_return"] is True
+        assert direct.recv_json()["call_return"] == 1
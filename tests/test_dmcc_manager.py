@@ -0,0 +1,39 @@
+"""Test cases for the shared DMCC board manager."""
+
+from os import path
+from unittest import TestCase
+
+from bot.hardware.dmcc_manager import get_manager
+from bot.hardware.dmcc_motor import DMCCMotorSet
+import bot.lib.lib as lib
+
+
+class TestDMCCManager(TestCase):
+
+    """Test that boards are shared between users."""
+
+    def setUp(self):
+        config = path.dirname(path.realpath(__file__))+"/test_config.yaml"
+        self.config = lib.get_config(config)
+        self.logger = lib.get_logger()
+        self.logger.info("Running {}()".format(self._testMethodName))
+
+    def test_single_manager(self):
+        self.assertIs(get_manager(), get_manager())
+
+    def test_shared_board(self):
+        manager = get_manager()
+        self.assertIs(manager.board(0), manager.board(0))
+        self.assertIs(manager.motor(0, 1), manager.board(0).motors[1])
+
+    def test_motor_sets_share_boards(self):
+        drive_conf = self.config['dmcc_drive_motors']
+        first = DMCCMotorSet(drive_conf)
+        second = DMCCMotorSet(drive_conf)
+        self.assertIs(first['front_left'].dmcc, second['front_left'].dmcc)
+
+    def test_lock_reentrant(self):
+        manager = get_manager()
+        with manager.lock(0):
+            with manager.lock(0):
+                manager.motor(0, 1).power = 0
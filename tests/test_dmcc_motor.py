@@ -34,6 +34,28 @@ class TestDMCCMotorSet(TestCase):
         with self.assertRaises(KeyError):
             DMCCMotorSet(motor_conf)
 
+    def test_set_powers(self):
+        drive_conf = self.config['dmcc_drive_motors']
+        motor_set = DMCCMotorSet(drive_conf)
+        powers = {'front_left': 50, 'front_right': -50,
+                  'back_left': 20, 'back_right': 0}
+        # back_right starts at zero, so it doesn't need a write
+        self.assertEqual(motor_set.set_powers(powers), 3)
+        self.assertEqual(motor_set['front_right'].power, -50)
+        # Unchanged command costs no writes
+        self.assertEqual(motor_set.set_powers(powers), 0)
+
+    def test_set_powers_deadband(self):
+        drive_conf = self.config['dmcc_drive_motors']
+        motor_set = DMCCMotorSet(drive_conf)
+        motor_set.set_powers({'front_left': 50, 'back_left': 0.5})
+        written = motor_set.set_powers({'front_left': 50.5, 'back_left': 0},
+                                       deadband=1)
+        # Small change is dropped, but a stop always goes through
+        self.assertEqual(written, 1)
+        self.assertEqual(motor_set['front_left'].power, 50)
+        self.assertEqual(motor_set['back_left'].power, 0)
+
 
 class TestDMCCMotor(TestCase):
 
@@ -0,0 +1,74 @@
+"""Test cases for continuous camera capture."""
+
+from time import sleep
+
+from bot.hardware.complex_hardware.frame_grabber import FrameGrabber
+import tests.test_bot as test_bot
+
+
+class FakeCamera(object):
+
+    """Produces numbered frames at a fixed rate, like a capture device."""
+
+    def __init__(self, period=0.005, fail_every=None):
+        self.period = period
+        self.fail_every = fail_every
+        self.count = 0
+
+    def read(self):
+        sleep(self.period)
+        self.count += 1
+        if self.fail_every and self.count % self.fail_every == 0:
+            return False, None
+        return True, self.count
+
+
+class TestFrameGrabber(test_bot.TestBot):
+
+    """Test capture thread, frame ring and consumer waits."""
+
+    def setUp(self):
+        super(TestFrameGrabber, self).setUp()
+        self.grabber = FrameGrabber(FakeCamera(), ring_size=3)
+
+    def tearDown(self):
+        self.grabber.stop()
+        super(TestFrameGrabber, self).tearDown()
+
+    def test_latest_waits_for_first_frame(self):
+        """Test that latest blocks until a frame exists."""
+        assert self.grabber.latest(timeout=0.01) is None
+        self.grabber.start()
+        seq, timestamp, frame = self.grabber.latest(timeout=1)
+        assert seq >= 1
+        assert timestamp > 0
+
+    def test_wait_next(self):
+        """Test that wait_next returns a newer frame than the one given."""
+        self.grabber.start()
+        seq = self.grabber.latest(timeout=1)[0]
+        next_seq, timestamp, frame = self.grabber.wait_next(seq, timeout=1)
+        assert next_seq > seq
+
+    def test_ring_is_bounded(self):
+        """Test that only the newest frames are kept, newest first."""
+        self.grabber.start()
+        self.grabber.wait_next(10, timeout=1)
+        history = self.grabber.history()
+        assert len(history) == 3
+        seqs = [seq for seq, timestamp, frame in history]
+        assert seqs == sorted(seqs, reverse=True)
+        assert seqs[0] - seqs[-1] == 2
+
+    def test_read_errors(self):
+        """Test that failed reads are counted and skipped."""
+        grabber = FrameGrabber(FakeCamera(fail_every=2))
+        grabber.start()
+        grabber.wait_next(3, timeout=1)
+        grabber.stop()
+        assert grabber.read_errors >= 1
+
+    def test_stop_wakes_waiters(self):
+        """Test that stopping capture ends a wait."""
+        self.grabber.stop()
+        assert self.grabber.wait_next(100) is None
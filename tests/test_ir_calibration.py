@@ -0,0 +1,71 @@
+"""Test cases for IR raw count to distance calibration."""
+
+from bot.hardware.ir_calibration import IRCalibration
+import tests.test_bot as test_bot
+
+
+def reference_distance(raw):
+    """The original per-element conversion the lookup table replaces."""
+    return int((raw ** -1.55) * 2000000 if raw != 0 else 0)
+
+
+class TestIRCalibration(test_bot.TestBot):
+
+    """Test converting raw IR packets to distances."""
+
+    def setUp(self):
+        """Build a calibration from the bot's IR config."""
+        super(TestIRCalibration, self).setUp()
+        self.sensors = {"North Left": 1, "North Right": 2, "Arm": 10}
+        self.cal = IRCalibration(self.sensors)
+
+    def packet(self, north_left, north_right, arm):
+        raw = [0] * 10
+        raw[0] = north_left
+        raw[1] = north_right
+        raw[9] = arm
+        return raw
+
+    def test_default_curve(self):
+        """Test that the table matches the original conversion."""
+        for raw in [0, 1, 2, 37, 150, 999, 4096, 65535]:
+            result = self.cal.convert(self.packet(raw, raw, raw))
+            assert result["North Left"] == reference_distance(raw)
+            assert result["Arm"] == reference_distance(raw)
+
+    def test_bias(self):
+        """Test that biases shift raw counts before conversion."""
+        cal = IRCalibration(self.sensors, {"North Left": -20})
+        result = cal.convert(self.packet(220, 220, 220))
+        assert result["North Left"] == reference_distance(200)
+        assert result["North Right"] == reference_distance(220)
+
+    def test_negative_clamp(self):
+        """Test that counts biased below zero clamp to one."""
+        cal = IRCalibration(self.sensors, {"North Left": -50})
+        result = cal.convert(self.packet(10, 10, 10))
+        assert result["North Left"] == reference_distance(1)
+        result = cal.convert(self.packet(50, 10, 10))
+        assert result["North Left"] == 0
+
+    def test_overflow_clamp(self):
+        """Test that counts biased past the raw range stay in the table."""
+        cal = IRCalibration(self.sensors, {"North Left": 100})
+        result = cal.convert(self.packet(65535, 0, 0))
+        assert result["North Left"] == reference_distance(65535)
+
+    def test_set_bias(self):
+        """Test changing a bias after the table is built."""
+        self.cal.set_bias("North Right", 30)
+        self.cal.set_bias("Not A Sensor", 30)
+        result = self.cal.convert(self.packet(100, 100, 100))
+        assert result["North Right"] == reference_distance(130)
+        assert result["North Left"] == reference_distance(100)
+
+    def test_per_sensor_curve(self):
+        """Test calibrating one sensor with its own curve."""
+        curves = {"Arm": {"scale": 1000, "exponent": -1.0}}
+        cal = IRCalibration(self.sensors, curves=curves)
+        result = cal.convert(self.packet(100, 100, 100))
+        assert result["Arm"] == 10
+        assert result["North Left"] == reference_distance(100)
@@ -0,0 +1,72 @@
+"""Test cases for IR reading filters."""
+
+import numpy as np
+
+from bot.hardware.ir_filter import IRFilter, build_filter
+import tests.test_bot as test_bot
+
+
+class TestIRFilter(test_bot.TestBot):
+
+    """Test each filter type on a pair of sensors."""
+
+    def setUp(self):
+        super(TestIRFilter, self).setUp()
+        self.names = ["East Top", "East Bottom"]
+
+    def feed(self, ir_filter, samples):
+        """Feed (top, bottom) samples, return the last filtered reading."""
+        for top, bottom in samples:
+            result = ir_filter.update({"East Top": top, "East Bottom": bottom})
+        return result
+
+    def test_moving_average(self):
+        """Test averaging over a sliding window."""
+        ir_filter = IRFilter(self.names, "moving_average", window=3)
+        result = self.feed(ir_filter, [(3, 30)])
+        assert result["East Top"] == 3
+        result = self.feed(ir_filter, [(6, 60), (9, 90), (12, 120)])
+        assert np.isclose(result["East Top"], 9)
+        assert np.isclose(result["East Bottom"], 90)
+
+    def test_exponential(self):
+        """Test exponential smoothing starting from the first sample."""
+        ir_filter = IRFilter(self.names, "exponential", alpha=0.5)
+        assert self.feed(ir_filter, [(100, 0)])["East Top"] == 100
+        assert self.feed(ir_filter, [(200, 0)])["East Top"] == 150
+
+    def test_median(self):
+        """Test that a median filter rejects a single spike."""
+        ir_filter = IRFilter(self.names, "median", window=3)
+        result = self.feed(ir_filter, [(100, 10), (5000, 10), (102, 10)])
+        assert result["East Top"] == 102
+
+    def test_kalman(self):
+        """Test that a Kalman filter converges on a steady reading."""
+        ir_filter = IRFilter(self.names, "kalman", process_noise=1.0,
+                             measurement_noise=25.0)
+        result = self.feed(ir_filter, [(0, 0)] + [(100, 50)] * 50)
+        assert abs(result["East Top"] - 100) < 1
+        assert abs(result["East Bottom"] - 50) < 1
+
+    def test_reset(self):
+        """Test that reset forgets previous samples."""
+        ir_filter = IRFilter(self.names, "moving_average", window=4)
+        self.feed(ir_filter, [(100, 100)] * 4)
+        ir_filter.reset()
+        assert self.feed(ir_filter, [(8, 8)])["East Top"] == 8
+
+    def test_unknown_type(self):
+        """Test that unknown filter types are rejected."""
+        with self.assertRaises(ValueError):
+            IRFilter(self.names, "fancy")
+        with self.assertRaises(ValueError):
+            build_filter(self.names, {"type": "fancy"})
+
+    def test_build_filter(self):
+        """Test building a filter from config, ignoring unrelated keys."""
+        config = {"type": "median", "window": 3, "alpha": 0.2,
+                  "sides": ["east"]}
+        ir_filter = build_filter(self.names, config)
+        assert ir_filter.kind == "median"
+        assert ir_filter.filter.window == 3
@@ -0,0 +1,113 @@
+"""Test cases for IR hub framing and link handling."""
+
+from bot.hardware.ir_packet import IRPacketDecoder, IRLink, parse_frame
+from bot.hardware.ir_packet import SYNC, FRAME_LEN
+import tests.test_bot as test_bot
+
+
+def make_frame(counts):
+    """Build the bytes the hub sends for the given channel counts."""
+    data = [SYNC]
+    for count in counts:
+        data.extend([count & 0xFF, count >> 8])
+    return data
+
+
+class FakeBus(object):
+
+    """Plays back a fixed byte stream, then keeps returning one byte."""
+
+    def __init__(self, stream, idle=0):
+        self.stream = list(stream)
+        self.idle = idle
+
+    def next_byte(self):
+        if self.stream:
+            return self.stream.pop(0)
+        return self.idle
+
+    def read_byte(self, addr):
+        return self.next_byte()
+
+    def read_i2c_block_data(self, addr, cmd, length):
+        return [self.next_byte() for i in xrange(length)]
+
+
+class TestIRPacketDecoder(test_bot.TestBot):
+
+    """Test splitting the byte stream into frames."""
+
+    def setUp(self):
+        super(TestIRPacketDecoder, self).setUp()
+        self.decoder = IRPacketDecoder()
+        self.counts = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]
+
+    def test_parse_frame(self):
+        """Test decoding little-endian channel counts."""
+        frame = make_frame(self.counts)[1:]
+        assert parse_frame(frame).tolist() == self.counts
+
+    def test_single_frame(self):
+        """Test decoding one frame fed byte by byte."""
+        frames = []
+        for byte in make_frame(self.counts):
+            frames.extend(self.decoder.feed([byte]))
+        assert len(frames) == 1
+        assert parse_frame(frames[0]).tolist() == self.counts
+
+    def test_skip_until_sync(self):
+        """Test that bytes before the first sync are ignored."""
+        frames = self.decoder.feed([1, 2, 3] + make_frame(self.counts))
+        assert len(frames) == 1
+        assert self.decoder.skipped_bytes == 3
+
+    def test_resync(self):
+        """Test that a sync inside a frame restarts it and is counted."""
+        stream = make_frame(self.counts)[:7] + make_frame(self.counts)
+        frames = self.decoder.feed(stream)
+        assert len(frames) == 1
+        assert self.decoder.resyncs == 1
+
+    def test_multiple_frames(self):
+        """Test decoding back to back frames."""
+        other = [c + 1 for c in self.counts]
+        frames = self.decoder.feed(make_frame(self.counts) +
+                                   make_frame(other))
+        assert [parse_frame(f).tolist() for f in frames] == \
+            [self.counts, other]
+        assert len(frames[0]) == FRAME_LEN
+
+
+class TestIRLink(test_bot.TestBot):
+
+    """Test reading frames off the bus with a deadline."""
+
+    def setUp(self):
+        super(TestIRLink, self).setUp()
+        self.counts = [5] * 10
+
+    def test_byte_reads(self):
+        """Test reading a frame one byte per transaction."""
+        link = IRLink(FakeBus(make_frame(self.counts)))
+        assert parse_frame(link.read_frame()).tolist() == self.counts
+        stats = link.stats()
+        assert stats["frames"] == 1
+        assert stats["bytes_read"] == FRAME_LEN + 1
+
+    def test_block_reads(self):
+        """Test that block reads keep the newest frame in the block."""
+        newer = [6] * 10
+        bus = FakeBus(make_frame(self.counts) + make_frame(newer))
+        link = IRLink(bus, block_size=2 * (FRAME_LEN + 1))
+        assert parse_frame(link.read_frame()).tolist() == newer
+        assert link.stats()["dropped_frames"] == 1
+
+    def test_timeout(self):
+        """Test that a link with no frames gives up at the deadline."""
+        link = IRLink(FakeBus([], idle=SYNC), frame_timeout=0.01)
+        with self.assertRaises(IOError):
+            link.read_frame()
+        stats = link.stats()
+        assert stats["timeouts"] == 1
+        assert stats["dropped_frames"] == 1
+        assert stats["frames"] == 0
@@ -0,0 +1,98 @@
+"""Test cases for the background IR sampler."""
+
+from time import sleep
+
+from bot.hardware.ir_sampler import IRSampler, IRSnapshot
+import tests.test_bot as test_bot
+
+
+class FakeHub(object):
+
+    """Stands in for the IR hub, returns a counter as every distance."""
+
+    def __init__(self):
+        self.reads = 0
+        self.fail = False
+
+    def read(self):
+        if self.fail:
+            raise IOError("bus error")
+        self.reads += 1
+        return {"North Left": self.reads, "North Right": self.reads}
+
+
+class TestIRSampler(test_bot.TestBot):
+
+    """Test filling and reading the IR frame ring."""
+
+    def setUp(self):
+        """Build a sampler around a fake hub."""
+        super(TestIRSampler, self).setUp()
+        self.hub = FakeHub()
+        self.sampler = IRSampler(self.hub.read, rate=200, ring_size=4)
+
+    def tearDown(self):
+        """Make sure no sampler thread outlives the test."""
+        self.sampler.stop()
+        if self.sampler.is_alive():
+            self.sampler.join()
+        super(TestIRSampler, self).tearDown()
+
+    def test_no_frame(self):
+        """Test that nothing is returned before the first sample."""
+        assert self.sampler.latest() is None
+        assert self.sampler.latest(timeout=0.01) is None
+        assert self.sampler.history() == []
+
+    def test_latest(self):
+        """Test that latest returns the newest timestamped frame."""
+        self.sampler.sample()
+        self.sampler.sample()
+        frame = self.sampler.latest()
+        assert isinstance(frame, IRSnapshot)
+        assert frame["North Left"] == 2
+        assert frame.timestamp > 0
+
+    def test_ring_reuses_slots(self):
+        """Test that the ring wraps without allocating new frames."""
+        frames = list(self.sampler.frames)
+        for i in xrange(10):
+            self.sampler.sample()
+        assert self.sampler.latest()["North Left"] == 10
+        for orig, current in zip(frames, self.sampler.frames):
+            assert orig is current
+
+    def test_history(self):
+        """Test that history is newest first and skips the write slot."""
+        for i in xrange(10):
+            self.sampler.sample()
+        history = self.sampler.history()
+        assert len(history) == 3
+        assert [f["North Left"] for f in history] == [10, 9, 8]
+        assert len(self.sampler.history(2)) == 2
+
+    def test_read_error(self):
+        """Test that failed reads are counted and keep the last frame."""
+        self.sampler.sample()
+        self.hub.fail = True
+        assert not self.sampler.sample()
+        assert self.sampler.read_errors == 1
+        assert self.sampler.latest()["North Left"] == 1
+
+    def test_thread(self):
+        """Test sampling in the background."""
+        self.sampler.setDaemon(True)
+        self.sampler.start()
+        frame = self.sampler.latest(timeout=1)
+        assert frame is not None
+        sleep(0.05)
+        self.sampler.stop()
+        self.sampler.join()
+        assert self.sampler.frame_count > 1
+
+    def test_bad_params(self):
+        """Test rejecting a ring that's too small or a bad rate."""
+        with self.assertRaises(ValueError):
+            IRSampler(self.hub.read, ring_size=1)
+        with self.assertRaises(ValueError):
+            IRSampler(self.hub.read, rate=0)
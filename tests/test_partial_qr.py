@@ -0,0 +1,46 @@
+"""Test cases for vectorized finder pattern candidate filtering."""
+
+import numpy as np
+
+from bot.hardware.complex_hardware.partial_qr import contour_stats
+from bot.hardware.complex_hardware.partial_qr import candidate_regions
+import tests.test_bot as test_bot
+
+
+def box_contour(x, y, w, h):
+    """Contour of an axis aligned box, shaped like findContours output."""
+    return np.array([[[x, y]], [[x, y + h - 1]], [[x + w - 1, y + h - 1]],
+                     [[x + w - 1, y]]], dtype=np.int32)
+
+
+class TestPartialQR(test_bot.TestBot):
+
+    """Test contour statistics and candidate selection."""
+
+    def setUp(self):
+        super(TestPartialQR, self).setUp()
+        self.outer = box_contour(10, 10, 20, 20)
+        self.inner = box_contour(14, 14, 11, 11)
+        self.thin = np.array([[[0, 0]], [[40, 0]], [[0, 10]]], dtype=np.int32)
+
+    def test_contour_stats(self):
+        """Test bounding boxes and shoelace areas."""
+        x, y, w, h, area = contour_stats([self.outer, self.thin])
+        assert x.tolist() == [10, 0]
+        assert w.tolist() == [20, 41]
+        assert h.tolist() == [20, 11]
+        assert area.tolist() == [19 * 19, 200]
+
+    def test_candidate_regions(self):
+        """Test that only square parents are kept, nested boxes merged."""
+        # [next, previous, child, parent] per contour
+        hierarchy = np.array([[[-1, -1, 2, -1],
+                               [-1, -1, -1, -1],
+                               [-1, -1, -1, 0]]])
+        regions = candidate_regions([self.outer, self.thin, self.inner],
+                                    hierarchy)
+        assert regions.tolist() == [[10, 10, 20, 20]]
+
+    def test_no_contours(self):
+        """Test that an empty frame gives no candidates."""
+        assert len(candidate_regions([], None)) == 0
@@ -60,3 +60,12 @@ class TestPID(test_bot.TestBot):
             assert abs(test_output[index] - output_value[index]) <= \
                 .001, "{} != {}, {}".format(
                     test_output[index], output_value[index], 1)
+
+    def test_clear_error(self):
+        """Test that clear_error resets the integral term"""
+        self.pid.set_k_values(0, 0, 1)
+        for x in [5, 5, 5]:
+            self.pid.pid(0, x, 1)
+        self.pid.clear_error()
+        assert self.pid.integral_error == 0
+        assert self.pid.pid(0, 2, 1) == -1
@@ -0,0 +1,67 @@
+"""Test cases for the vectorized PID bank."""
+
+import numpy as np
+
+from bot.navigation.pid import PID, PIDBank
+import tests.test_bot as test_bot
+
+
+class TestPIDBank(test_bot.TestBot):
+
+    """Test PIDBank against PID and its extra limits."""
+
+    def setUp(self):
+        super(TestPIDBank, self).setUp()
+        self.gains = [(1.1, 0.06, 0.0), (0.5, 0.0, 0.2), (3.0, 0.01, 0.05)]
+        self.bank = PIDBank(len(self.gains))
+        for channel, (kp, kd, ki) in enumerate(self.gains):
+            self.bank.set_k_values(channel, kp, kd, ki)
+
+    def test_matches_pid(self):
+        """Test that each channel steps exactly like a scalar PID."""
+        pids = []
+        for kp, kd, ki in self.gains:
+            pid = PID()
+            pid.set_k_values(kp, kd, ki)
+            pids.append(pid)
+        targets = [0.0, 300.0, 150.0]
+        for tick in xrange(20):
+            values = [tick * 3.0, 280.0 + tick, 200.0 - tick * 2]
+            outputs = self.bank.step(targets, values, 0.02)
+            expected = [pid.pid(target, value, 0.02) for pid, target, value
+                        in zip(pids, targets, values)]
+            assert np.allclose(outputs, expected)
+
+    def test_single_channel(self):
+        """Test stepping one channel leaves the others alone."""
+        self.bank.step(10, 0, 1.0, channels=1)
+        assert self.bank.previous_error.tolist() == [0, 10, 0]
+        assert self.bank.output[1] == 0.5 * 10 + 0.2 * 5
+
+    def test_integral_limit(self):
+        """Test that the integral is clamped against windup."""
+        bank = PIDBank(1, integral_limit=5)
+        bank.set_k_values(0, 0, 0, 1)
+        for i in xrange(10):
+            output = bank.step(0, -10, 1.0)
+        assert output[0] == 5
+
+    def test_output_limit(self):
+        """Test that outputs are clamped."""
+        bank = PIDBank(2, output_limit=100)
+        assert bank.step([0, 0], [500, -500], 1.0).tolist() == [-100, 100]
+
+    def test_derivative_filter(self):
+        """Test that derivative filtering smooths a step in the error."""
+        bank = PIDBank(1, derivative_alpha=0.5)
+        bank.set_k_values(0, 0, 1, 0)
+        assert bank.step(10, 0, 1.0)[0] == 5
+        assert bank.step(10, 0, 1.0)[0] == 2.5
+
+    def test_reset(self):
+        """Test that reset clears error history."""
+        self.bank.step([1, 2, 3], [0, 0, 0], 1.0)
+        self.bank.reset()
+        assert not self.bank.previous_error.any()
+        assert not self.bank.integral_error.any()
+        assert not self.bank.derivative.any()
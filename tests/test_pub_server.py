@@ -0,0 +1,264 @@
+"""Test cases for the subscription driven PubServer."""
+
+from time import sleep
+
+import zmq
+
+from bot.lib.sample_stream import SampleStream
+import bot.lib.telemetry as telemetry
+from bot.server.pub_server import PubServer, Subscriptions, Topic
+import tests.test_bot as test_bot
+
+
+class FakeMotor(object):
+
+    """Counts reads, which are bus transactions on a real motor."""
+
+    def __init__(self):
+        self.reads = 0
+
+    @property
+    def power(self):
+        self.reads += 1
+        return 10
+
+    @property
+    def velocity(self):
+        self.reads += 1
+        return 20
+
+
+class FakeMotorSet(object):
+
+    def __init__(self, names):
+        self.motors = dict((name, FakeMotor()) for name in names)
+
+
+class FakeDriver(object):
+
+    def __init__(self):
+        self.motors = FakeMotorSet(["north", "south", "east", "west"])
+        self.streams = [SampleStream("drive_powers", ["north"],
+                                     batch_size=2)]
+
+
+class TestSubscriptions(test_bot.TestBot):
+
+    """Test tracking XPUB subscription messages."""
+
+    def setUp(self):
+        super(TestSubscriptions, self).setUp()
+        self.subscriptions = Subscriptions()
+
+    def test_subscribe(self):
+        """Test that subscribing makes matching topics wanted."""
+        assert self.subscriptions.update("\x01drive_motor_power")
+        assert self.subscriptions.wanted("drive_motor_power_north")
+        assert not self.subscriptions.wanted("drive_motor_velocity_north")
+
+    def test_unsubscribe(self):
+        """Test that unsubscribing forgets the prefix."""
+        self.subscriptions.update("\x01drive")
+        assert self.subscriptions.update("\x00drive")
+        assert not self.subscriptions.wanted("drive_motor_power_north")
+        assert len(self.subscriptions) == 0
+
+    def test_everything(self):
+        """Test that an empty prefix wants every topic."""
+        self.subscriptions.update("\x01")
+        assert self.subscriptions.wanted("drive_motor_detail_east")
+
+
+class TestTopic(test_bot.TestBot):
+
+    """Test change-only sampling of topics."""
+
+    def setUp(self):
+        super(TestTopic, self).setUp()
+        self.value = 10.0
+
+    def test_every_sample(self):
+        """Test that topics without epsilon send every sample."""
+        topic = Topic("t", lambda: self.value)
+        assert topic.sample() == "10.0"
+        assert topic.sample() == "10.0"
+
+    def test_epsilon(self):
+        """Test that small changes aren't sent."""
+        topic = Topic("t", lambda: self.value, epsilon=0.5)
+        assert topic.sample() == "10.0"
+        self.value = 10.4
+        assert topic.sample() is None
+        self.value = 10.6
+        assert topic.sample() == "10.6"
+
+    def test_epsilon_dict(self):
+        """Test that dicts change by their largest changed entry."""
+        topic = Topic("t", lambda: self.value, epsilon=1,
+                      serializer=lambda value: "x")
+        self.value = {"a": 1, "b": 2}
+        assert topic.sample() == "x"
+        self.value = {"a": 1.5, "b": 2.5}
+        assert topic.sample() is None
+        self.value = {"a": 1, "b": 4}
+        assert topic.sample() == "x"
+
+    def test_reset(self):
+        """Test that a reset topic sends its next sample."""
+        topic = Topic("t", lambda: self.value, epsilon=0)
+        topic.sample()
+        assert topic.sample() is None
+        topic.reset()
+        assert topic.sample() == "10.0"
+
+    def test_bad_rate(self):
+        """Test that a non-positive rate is rejected."""
+        with self.assertRaises(ValueError):
+            Topic("t", lambda: 0, rate=0)
+
+
+class PubServerCase(test_bot.TestBot):
+
+    """Runs a PubServer on fake motors, with a SUB socket listening."""
+
+    encoding = "text"
+
+    def setUp(self):
+        super(PubServerCase, self).setUp()
+        self.orig_encoding = self.config.get("pub_encoding")
+        self.config["pub_encoding"] = self.encoding
+        self.driver = FakeDriver()
+        self.server = PubServer({"driver": self.driver})
+        self.sub_sock = self.server.context.socket(zmq.SUB)
+        self.sub_sock.connect("tcp://127.0.0.1:{}".format(
+            self.config["pub_server_port"]))
+
+    def tearDown(self):
+        self.sub_sock.close()
+        self.server.pub_sock.close()
+        self.server.context.term()
+        self.config["pub_encoding"] = self.orig_encoding
+        super(PubServerCase, self).tearDown()
+
+    def reads(self):
+        return sum(motor.reads
+                   for motor in self.driver.motors.motors.values())
+
+    def subscribe(self, prefix):
+        self.sub_sock.setsockopt(zmq.SUBSCRIBE, prefix)
+        sleep(0.2)
+        self.server.handle_subscriptions()
+
+
+class TestPubServer(PubServerCase):
+
+    """Test that only subscribed topics are read and published."""
+
+    encoding = "binary"
+
+    def test_idle(self):
+        """Test that nothing is read without subscribers."""
+        self.server.handle_subscriptions()
+        self.server.publish()
+        assert self.reads() == 0
+
+    def test_topic_config(self):
+        """Test that topics get the rate of their longest config prefix."""
+        topic = self.server.topics["drive_motor_velocity_north"]
+        settings = self.config["pub_topics"]["drive_motor_velocity"]
+        assert topic.period == 1.0 / settings["rate"]
+        assert topic.epsilon == settings["epsilon"]
+
+    def test_schedule(self):
+        """Test that topics are sampled at their own rates."""
+        self.server.topics["drive_motor_power_north"].period = 0.1
+        self.server.topics["drive_motor_velocity_north"].period = 1
+        self.server.topics["drive_motor_power_north"].epsilon = None
+        self.subscribe("drive_motor_power_north")
+        self.subscribe("drive_motor_velocity_north")
+        start = self.server.schedule[0][0]
+        for i in xrange(10):
+            self.server.publish_due(start + i * 0.1 + 0.01)
+        # Power on every tick, velocity on the first only
+        assert self.driver.motors.motors["north"].reads == 11
+
+    def test_unsubscribe_unschedules(self):
+        """Test that unsubscribed topics leave the schedule."""
+        self.subscribe("drive_motor_power_north")
+        assert len(self.server.schedule) == 1
+        self.sub_sock.setsockopt(zmq.UNSUBSCRIBE, "drive_motor_power_north")
+        sleep(0.2)
+        self.server.handle_subscriptions()
+        assert self.server.schedule == []
+
+    def test_stream(self):
+        """Test that streams record while subscribed and send batches."""
+        stream = self.driver.streams[0]
+        stream.record([1])
+        assert not stream.active
+        self.subscribe("drive_powers")
+        assert stream.active
+        for i in xrange(5):
+            stream.record([i], timestamp=i)
+        assert self.server.publish() == 2
+        topic, payload = self.sub_sock.recv_multipart()
+        assert topic == "drive_powers"
+        batch = telemetry.decode(payload)[1]
+        assert batch["fields"] == ["timestamp", "north"]
+        assert batch["samples"] == [[0, 0], [1, 1]]
+        self.sub_sock.setsockopt(zmq.UNSUBSCRIBE, "drive_powers")
+        sleep(0.2)
+        self.server.handle_subscriptions()
+        assert not stream.active
+
+    def test_second_subscriber(self):
+        """Test that a new client gets the current value of a topic that
+        other clients are already subscribed to."""
+        self.server.topics["drive_motor_power_north"].epsilon = 0
+        self.subscribe("drive_motor_power_north")
+        self.server.publish_due()
+        assert self.sub_sock.poll(1000)
+        self.sub_sock.recv_multipart()
+
+        second = self.server.context.socket(zmq.SUB)
+        second.connect("tcp://127.0.0.1:{}".format(
+            self.config["pub_server_port"]))
+        try:
+            second.setsockopt(zmq.SUBSCRIBE, "drive_motor_power_north")
+            sleep(0.2)
+            self.server.handle_subscriptions()
+            # The value hasn't changed, but is sent for the newcomer
+            self.server.publish_due()
+            assert second.poll(1000)
+            topic, payload = second.recv_multipart()
+            assert telemetry.decode(payload)[1] == 10
+        finally:
+            second.close()
+
+    def test_subscribed_only(self):
+        """Test that only subscribed getters are called."""
+        self.sub_sock.setsockopt(zmq.SUBSCRIBE, "drive_motor_power_north")
+        sleep(0.2)
+        self.server.handle_subscriptions()
+        assert self.server.active_topics() == ["drive_motor_power_north"]
+        self.server.publish()
+        assert self.driver.motors.motors["north"].reads == 1
+        assert self.reads() == 1
+        assert self.sub_sock.poll(1000)
+        topic, payload = self.sub_sock.recv_multipart()
+        assert topic == "drive_motor_power_north"
+        assert telemetry.decode(payload)[1] == 10
+
+
+class TestPubServerText(PubServerCase):
+
+    """Test the default "topic value" text encoding."""
+
+    encoding = "text"
+
+    def test_text(self):
+        """Test that values are sent as one "topic value" frame."""
+        self.subscribe("drive_motor_power_north")
+        self.server.publish()
+        assert self.sub_sock.poll(1000)
+        assert self.sub_sock.recv_multipart() == ["drive_motor_power_north 10"]
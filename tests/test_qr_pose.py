@@ -0,0 +1,77 @@
+"""Test cases for batched QR pose estimates and target selection."""
+
+import numpy as np
+
+from bot.hardware.complex_hardware.qr_pose import select_qr
+from bot.hardware.complex_hardware.qr_pose import solve_qr_batch
+import tests.test_bot as test_bot
+
+
+def square(cx, cy, edge):
+    """Corners of an axis aligned code, ordered tl, tr, bl, br."""
+    half = edge / 2.0
+    return [(cx - half, cy - half), (cx + half, cy - half),
+            (cx - half, cy + half), (cx + half, cy + half)]
+
+
+class TestSolveQRBatch(test_bot.TestBot):
+
+    """Test pose estimates from QR corners."""
+
+    def setUp(self):
+        super(TestSolveQRBatch, self).setUp()
+        self.resolution = (640, 480)
+        self.a = 1667.1
+        self.n = -1.0181
+
+    def solve(self, corners):
+        return solve_qr_batch(corners, self.resolution, self.a, self.n)
+
+    def test_centered(self):
+        """Test that a centered code is straight ahead."""
+        x, y, z, distance = self.solve([square(320, 240, 100)])[0]
+        assert x == 0 and y == 0
+        assert abs(distance - self.a * 100 ** self.n) < 1e-9
+        assert abs(z - distance) < 1e-9
+
+    def test_offset_signs(self):
+        """Test that x grows to the right and y grows up."""
+        x, y, z, distance = self.solve([square(420, 140, 100)])[0]
+        assert abs(x - 1.5) < 1e-9
+        assert abs(y - 1.5) < 1e-9
+        assert z < distance
+
+    def test_batch_matches_single(self):
+        """Test that solving codes together matches solving them alone."""
+        codes = [square(100, 100, 50), square(500, 300, 80),
+                 square(320, 400, 120)]
+        batch = self.solve(codes)
+        assert batch.shape == (3, 4)
+        for code, pose in zip(codes, batch):
+            assert np.allclose(self.solve([code])[0], pose)
+
+    def test_longest_edge(self):
+        """Test that distance uses the longest edge of a skewed code."""
+        corners = [(300, 200), (400, 200), (300, 260), (400, 260)]
+        distance = self.solve([corners])[0][3]
+        assert abs(distance - self.a * 100 ** self.n) < 1e-9
+
+
+class TestSelectQR(test_bot.TestBot):
+
+    """Test picking the code to grab."""
+
+    def test_empty(self):
+        """Test that there's nothing to pick from no codes."""
+        assert select_qr([]) is None
+
+    def test_closest_x(self):
+        """Test that the code closest to center in x wins."""
+        tvecs = [[3.0, 0.0], [-0.5, 2.0], [1.0, -1.0]]
+        assert select_qr(tvecs) == 1
+
+    def test_same_column_lower_y(self):
+        """Test that the lower code wins within a column."""
+        tvecs = [[3.0, 0.0], [0.02, 2.0], [-0.03, -1.0]]
+        assert select_qr(tvecs) == 2
+        assert select_qr(tvecs, same_column=0.01) == 1
@@ -0,0 +1,50 @@
+"""Test cases for QR region of interest tracking."""
+
+from bot.hardware.complex_hardware.qr_tracker import QRTracker
+import tests.test_bot as test_bot
+
+
+class TestQRTracker(test_bot.TestBot):
+
+    """Test ROI placement and falling back to full frames."""
+
+    def setUp(self):
+        super(TestQRTracker, self).setUp()
+        self.tracker = QRTracker(pad=0.5, max_misses=2, min_pad=10)
+        self.shape = (720, 1280, 3)
+        self.corners = [(600, 300), (700, 300), (600, 400), (700, 400)]
+
+    def test_full_frame_until_found(self):
+        """Test that there's no ROI before a code is found."""
+        assert self.tracker.roi(self.shape) is None
+        assert not self.tracker.tracking
+
+    def test_padded_roi(self):
+        """Test that the ROI is the corners' box plus padding."""
+        self.tracker.found(self.corners)
+        assert self.tracker.roi(self.shape) == (550, 250, 750, 450)
+
+    def test_roi_clamped_to_frame(self):
+        """Test that the ROI never leaves the frame."""
+        self.tracker.found([(0, 0), (50, 0), (0, 50), (1279, 719)])
+        assert self.tracker.roi(self.shape) == (0, 0, 1280, 720)
+
+    def test_min_pad(self):
+        """Test that tiny codes still get the minimum margin."""
+        self.tracker.found([(100, 100), (102, 102)])
+        assert self.tracker.roi(self.shape) == (90, 90, 112, 112)
+
+    def test_misses(self):
+        """Test falling back to full frames after max_misses."""
+        self.tracker.found(self.corners)
+        assert not self.tracker.missed()
+        assert self.tracker.roi(self.shape) is not None
+        assert self.tracker.missed()
+        assert self.tracker.roi(self.shape) is None
+
+    def test_found_resets_misses(self):
+        """Test that finding the code again clears the miss count."""
+        self.tracker.found(self.corners)
+        self.tracker.missed()
+        self.tracker.found(self.corners)
+        assert not self.tracker.missed()
@@ -0,0 +1,110 @@
+"""Test cases for building bot systems through the subsystem registry."""
+
+from threading import Event, Lock
+from time import sleep
+
+import bot.lib.lib as lib
+from bot.server.registry import SubsystemRegistry
+import tests.test_bot as test_bot
+
+
+class Device(object):
+
+    """Stands in for hardware, counts how many were built."""
+
+    built = 0
+    lock = Lock()
+
+    def __init__(self, delay=0):
+        sleep(delay)
+        with Device.lock:
+            Device.built += 1
+
+    @lib.api_call
+    def read(self, channel, scale=1):
+        return channel * scale
+
+    def internal(self):
+        pass
+
+
+class User(object):
+
+    """Stands in for a system built on top of a Device."""
+
+    def __init__(self, device):
+        self.device = device
+
+
+class TestRegistry(test_bot.TestBot):
+
+    """Test shared, lazy and concurrent system construction."""
+
+    def setUp(self):
+        super(TestRegistry, self).setUp()
+        Device.built = 0
+        self.systems = SubsystemRegistry()
+
+    def test_dependency_shared(self):
+        """Test that users of a dependency get the same instance."""
+        self.systems.register("device", Device, export=False)
+        self.systems.register("a", User, deps=("device",))
+        self.systems.register("b", User, deps=("device",))
+        self.systems.start()
+        assert self.systems["a"].device is self.systems["b"].device
+        assert Device.built == 1
+
+    def test_lazy(self):
+        """Test that lazy systems are built on first use only."""
+        self.systems.register("device", Device, lazy=True)
+        self.systems.start()
+        assert not self.systems.is_built("device")
+        device = self.systems["device"]
+        assert self.systems["device"] is device
+        assert Device.built == 1
+
+    def test_concurrent_start(self):
+        """Test that independent systems are built at the same time."""
+        names = ("a", "b", "c", "d")
+        arrived = []
+        everyone = Event()
+        met = []
+
+        def build():
+            # Only returns True if every builder is running at once
+            with Device.lock:
+                arrived.append(True)
+                if len(arrived) == len(names):
+                    everyone.set()
+            met.append(everyone.wait(5))
+            return Device()
+
+        for name in names:
+            self.systems.register(name, build)
+        self.systems.start()
+        assert met == [True] * len(names)
+        assert Device.built == 4
+
+    def test_build_error(self):
+        """Test that a failed build is raised from start."""
+        def broken():
+            raise IOError("No device")
+        self.systems.register("broken", broken)
+        with self.assertRaises(IOError):
+            self.systems.start()
+
+    def test_api_methods_before_build(self):
+        """Test that exported methods are found without building."""
+        self.systems.register("device", lambda: Device(), cls=Device,
+                              lazy=True)
+        methods = self.systems.api_methods("device")
+        assert methods.keys() == ["read"]
+        assert methods["read"].args == ["self", "channel", "scale"]
+        assert not self.systems.is_built("device")
+
+    def test_exported(self):
+        """Test that only exported systems are listed."""
+        self.systems.add("ctrl", object())
+        self.systems.register("device", Device, export=False)
+        assert self.systems.exported() == ["ctrl"]
+        assert "device" in self.systems
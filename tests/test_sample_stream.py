@@ -0,0 +1,107 @@
+"""Test cases for batched telemetry sample streams."""
+
+from threading import Event, Thread
+
+from bot.lib.sample_stream import SampleStream
+import tests.test_bot as test_bot
+
+
+class TestSampleStream(test_bot.TestBot):
+
+    """Test batching, activation and dropping of old batches."""
+
+    def setUp(self):
+        super(TestSampleStream, self).setUp()
+        self.stream = SampleStream("test", ["a", "b"], batch_size=3,
+                                   max_batches=2)
+
+    def test_fields(self):
+        """Test that a timestamp column comes first."""
+        assert self.stream.fields == ["timestamp", "a", "b"]
+
+    def test_inactive(self):
+        """Test that nothing is recorded without a subscriber."""
+        for i in xrange(5):
+            self.stream.record([i, i])
+        self.stream.flush()
+        assert self.stream.drain() == []
+
+    def test_batches(self):
+        """Test that only full batches are handed over."""
+        self.stream.start()
+        for i in xrange(4):
+            self.stream.record([i, -i], timestamp=10 + i)
+        batches = self.stream.drain()
+        assert len(batches) == 1
+        assert batches[0].tolist() == [[10, 0, 0], [11, 1, -1],
+                                       [12, 2, -2]]
+        assert self.stream.drain() == []
+
+    def test_flush(self):
+        """Test that a partial batch can be pushed out."""
+        self.stream.start()
+        self.stream.record([1, 2], timestamp=5)
+        self.stream.flush()
+        assert [batch.tolist() for batch in self.stream.drain()] == \
+            [[[5, 1, 2]]]
+
+    def test_batch_not_reused(self):
+        """Test that handed over batches aren't written to again."""
+        self.stream.start()
+        for i in xrange(3):
+            self.stream.record([i, i], timestamp=0)
+        batch = self.stream.drain()[0]
+        for i in xrange(3):
+            self.stream.record([9, 9], timestamp=0)
+        assert batch[:, 1].tolist() == [0, 1, 2]
+
+    def test_oldest_dropped(self):
+        """Test that a slow publisher loses the oldest batches."""
+        self.stream.start()
+        for i in xrange(9):
+            self.stream.record([i, i], timestamp=0)
+        batches = self.stream.drain()
+        assert [batch[0, 1] for batch in batches] == [3, 6]
+
+    def test_stop(self):
+        """Test that stopping drops unpublished samples."""
+        self.stream.start()
+        for i in xrange(4):
+            self.stream.record([i, i])
+        self.stream.stop()
+        self.stream.flush()
+        assert self.stream.drain() == []
+
+    def test_stop_while_recording(self):
+        """Test that a stop during a record leaves nothing behind."""
+        entered, release = Event(), Event()
+
+        class Blocking(object):
+
+            """One value, read only once the test lets it through."""
+
+            def __len__(self):
+                return 1
+
+            def __getitem__(self, index):
+                if index > 0:
+                    raise IndexError(index)
+                entered.set()
+                release.wait(5)
+                return 1
+
+        stream = SampleStream("test", ["a"], batch_size=1)
+        stream.start()
+        recorder = Thread(target=stream.record, args=(Blocking(),))
+        recorder.start()
+        assert entered.wait(5)
+        stopper = Thread(target=stream.stop)
+        stopper.start()
+        # Let the stop go ahead of the record, if nothing holds it back
+        stopper.join(0.2)
+        release.set()
+        recorder.join(5)
+        stopper.join(5)
+        # The sample being recorded must not land after the stop
+        assert len(stream.full) == 0
+        assert stream.count == 0
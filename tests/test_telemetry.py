@@ -0,0 +1,57 @@
+"""Test cases for the binary telemetry encoding."""
+
+import numpy as np
+
+import bot.lib.telemetry as telemetry
+import tests.test_bot as test_bot
+
+
+class TestTelemetry(test_bot.TestBot):
+
+    """Test that values survive a round trip with their type."""
+
+    def round_trip(self, value):
+        timestamp, decoded = telemetry.decode(
+            telemetry.encode(value, timestamp=12.5))
+        assert timestamp == 12.5
+        return decoded
+
+    def test_integer(self):
+        decoded = self.round_trip(-42)
+        assert decoded == -42 and isinstance(decoded, (int, long))
+
+    def test_number(self):
+        assert self.round_trip(3.25) == 3.25
+
+    def test_numbers(self):
+        assert self.round_trip([1, 2.5, -3]) == [1.0, 2.5, -3.0]
+        assert self.round_trip(np.arange(4.0)) == [0.0, 1.0, 2.0, 3.0]
+        assert self.round_trip([]) == []
+
+    def test_named(self):
+        value = {"North Left": 10.5, "North Right": 12.0}
+        assert self.round_trip(value) == value
+        assert self.round_trip({}) == {}
+
+    def test_text(self):
+        assert self.round_trip("DMCC: 0 motor_num: 1") == \
+            u"DMCC: 0 motor_num: 1"
+        assert self.round_trip(["a", "b"]) == u"['a', 'b']"
+
+    def test_batch(self):
+        samples = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        timestamp, decoded = telemetry.decode(
+            telemetry.encode_batch(["timestamp", "a", "b"], samples, 7.0))
+        assert timestamp == 7.0
+        assert decoded == {"fields": ["timestamp", "a", "b"],
+                           "samples": samples.tolist()}
+
+    def test_compact(self):
+        """Test that a number costs its header and 8 bytes."""
+        assert len(telemetry.encode(1.5)) == telemetry.HEADER.size + 8
+
+    def test_bad_payload(self):
+        with self.assertRaises(ValueError):
+            telemetry.decode("\x01")
+        with self.assertRaises(ValueError):
+            telemetry.decode(telemetry.HEADER.pack(99, 0))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Benchmark the vision pipelines on the saved frames in tests/test_images.
+
+Plays the images through Camera's QR, partial QR and block color stages and
+generic_blocks, without a camera attached. Reports latency percentiles per
+stage, peak memory, and how detections compare with ground_truth.yaml.
+
+Usage, from the repo root:
+
+    python -m tests.vision_bench [--repeat N] [--record]
+
+--record writes the current detections to the ground truth file instead of
+checking against it. Review what it wrote before checking it in. The bench
+exits non-zero on any mismatch with ground truth; with no ground truth at
+all it only warns that accuracy wasn't checked.
+
+"""
+
+import argparse
+import os
+import resource
+import sys
+from collections import defaultdict
+from glob import glob
+from time import time
+
+import cv2
+import numpy as np
+import yaml
+
+import bot.lib.lib as lib
+from bot.hardware.complex_hardware.camera_reader import Camera
+from bot.hardware.complex_hardware.partial_qr import detect_markers
+import bot.hardware.complex_hardware.generic_blocks as generic_blocks
+
+
+image_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         "test_images")
+truth_file = os.path.join(image_dir, "ground_truth.yaml")
+
+
+class ImageReplay(object):
+
+    """Stands in for cv2.VideoCapture, playing saved frames in a loop."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return True, frame
+
+    def grab(self):
+        self.index += 1
+        return True
+
+    def get(self, prop):
+        height, width = self.frames[0].shape[:2]
+        return {3: width, 4: height}.get(prop, 0)
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+class Quiet(object):
+
+    """Swallows the vision code's prints so they don't skew timings."""
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+class Bench(object):
+
+    """Times named stages and collects per-image detections."""
+
+    def __init__(self):
+        self.times = defaultdict(list)
+
+    def run(self, stage, func, *args):
+        start = time()
+        result = func(*args)
+        self.times[stage].append(time() - start)
+        return result
+
+    def report(self):
+        print "{:<26}{:>6}{:>10}{:>10}{:>10}{:>10}".format(
+            "stage", "n", "p50 ms", "p90 ms", "p99 ms", "max ms")
+        for stage in sorted(self.times):
+            ms = np.array(self.times[stage]) * 1000
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            print "{:<26}{:>6}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                stage, len(ms), p50, p90, p99, ms.max())
+
+
+def detect(bench, cam, frame):
+    """Run every pipeline on one frame, return what each one found."""
+    gray = bench.run("qr.preprocess", cam.qr_preprocess, frame)
+    decoded = bench.run("qr.decode", cam.qr_decode, gray)
+    codes = bench.run("qr.pose", cam.qr_pose, decoded)
+    if codes:
+        bench.run("qr.select", cam.selectQR, codes)
+
+    markers = bench.run("partial_qr.detect", detect_markers, frame,
+                        cam.pyramid_levels)
+    partials = bench.run("partial_qr.group", cam.partial_qr_group, markers)
+    bench.run("partial_qr.select", cam.partial_qr_select, partials)
+
+    prepared = bench.run("color.preprocess", cam.prepare_color_frame, frame)
+    blocks = bench.run("color.detect", cam.segment_blocks, prepared)
+
+    centers = bench.run("generic_blocks.detect",
+                        generic_blocks.get_front_center, frame)
+
+    return {
+        "qr": sorted(str(code.value) for code in codes),
+        "partial_qr": len(partials),
+        "color": blocks[0].color if blocks else None,
+        "generic_blocks": 0 if centers == -1 else len(centers),
+    }
+
+
+def compare(results, truth):
+    """Print detections that differ from ground truth.
+
+    :returns: (images checked, number of mismatches).
+
+    """
+    mismatches = 0
+    unchecked = 0
+    for name in sorted(results):
+        expected = truth.get(name)
+        if expected is None:
+            unchecked += 1
+            continue
+        for key, value in sorted(results[name].items()):
+            if key in expected and expected[key] != value:
+                mismatches += 1
+                print "MISMATCH {} {}: expected {}, got {}".format(
+                    name, key, expected[key], value)
+    print "Images checked: {}, unchecked (no ground truth): {}, " \
+        "mismatches: {}".format(len(results) - unchecked, unchecked,
+                                mismatches)
+    return len(results) - unchecked, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Passes over the image set (default 5)")
+    parser.add_argument("--record", action="store_true",
+                        help="Write detections to the ground truth file")
+    parser.add_argument("--images", default=image_dir,
+                        help="Directory of .jpg frames to replay")
+    args = parser.parse_args()
+
+    names = sorted(glob(os.path.join(args.images, "*.jpg")))
+    if not names:
+        print "No images in {}".format(args.images)
+        return 1
+    frames = [cv2.imread(name) for name in names]
+
+    config = lib.get_config()
+    cam = Camera(config[config["dagu_arm"]["camera"]],
+                 cam=ImageReplay(frames))
+
+    bench = Bench()
+    results = {}
+    for i in xrange(args.repeat):
+        for name, frame in zip(names, frames):
+            with Quiet():
+                results[os.path.basename(name)] = detect(bench, cam, frame)
+
+    bench.report()
+    # Linux reports ru_maxrss in kilobytes
+    print "Peak RSS: {:.1f} MB".format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+    if args.record:
+        # Keep the explanatory comment at the top of the file
+        with open(truth_file) as f:
+            header = [line for line in f if line.startswith("#")]
+        with open(truth_file, "w") as f:
+            f.writelines(header)
+            yaml.safe_dump(results, f, default_flow_style=False)
+        print "Recorded detections for {} images to {}".format(
+            len(results), truth_file)
+        return 0
+
+    with open(truth_file) as f:
+        truth = yaml.safe_load(f) or {}
+    checked, mismatches = compare(results, truth)
+    if not checked:
+        # Nothing to gate on until reviewed ground truth is checked in
+        print "WARNING: no ground truth for any image, accuracy not checked"
+        return 0
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())